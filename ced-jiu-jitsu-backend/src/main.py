@@ -5,6 +5,12 @@ from dotenv import load_dotenv
 
 # Importa a nossa nova função de inicialização
 from config.firebase_config import initialize_firebase
+from services.storage_policy import init_storage_policy
+from services.serialization import init_serialization
+from services.tenancy import init_tenancy
+from services.traffic_capture import init_traffic_capture
+from services.task_executor import init_task_executor
+from services.blob_storage import init_blob_storage
 
 load_dotenv()
 
@@ -13,6 +19,21 @@ initialize_firebase()
 
 app = Flask(__name__)
 
+# Academia (unidade) de cada requisição, pelo host ou pelo token
+init_tenancy(app)
+
+# Prazo por requisição e resposta 503 quando o Firestore estiver indisponível
+init_storage_policy(app)
+
+# Respostas em JSON ou MessagePack (Accept: application/msgpack)
+init_serialization(app)
+
+# Captura opcional de tráfego para replay de carga (TRAFFIC_CAPTURE_PATH)
+init_traffic_capture(app)
+
+# Fotos: em produção exige o bucket do Cloud Storage
+init_blob_storage(app)
+
 # caso queira realizar um debig doque está acontecendo (app.debug = True)
 # --- 2. CONFIGURAÇÃO DO CORS ---
 # Aplique o CORS à sua aplicação, permitindo requisições
@@ -24,14 +45,34 @@ CORS(app, resources={r"/api/*": {"origins": "https://ced-jiu-jitsu.web.app"}})
 from routes.students import students_bp
 from routes.attendance import attendance_bp
 from routes.auth import auth_bp
+from routes.export import export_bp
+from routes.metrics import metrics_bp
+from routes.jobs import jobs_bp
+from routes.graduation import graduation_bp
+from routes.dashboard import dashboard_bp
+from routes.photos import photos_bp
+from routes.events import events_bp
+from routes.leaderboards import leaderboards_bp
 # Adicione outros blueprints se necessário
 
 # Registre os blueprints com prefixo /api
 app.register_blueprint(students_bp, url_prefix='/api/students')
 app.register_blueprint(attendance_bp, url_prefix='/api/attendance')
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
+app.register_blueprint(export_bp, url_prefix='/api/export')
+app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
+app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
+app.register_blueprint(graduation_bp, url_prefix='/api/graduation')
+app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
+app.register_blueprint(photos_bp, url_prefix='/api/photos')
+app.register_blueprint(events_bp, url_prefix='/api/events')
+app.register_blueprint(leaderboards_bp, url_prefix='/api/leaderboards')
 # app.register_blueprint(...)
 
+# Executor de tarefas em segundo plano: inicia já no boot do worker para
+# retomar as tarefas pendentes (as rotas acima registram as tarefas)
+init_task_executor(app)
+
 # Servir arquivos estáticos do React
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
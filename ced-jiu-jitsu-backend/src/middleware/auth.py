@@ -1,9 +1,13 @@
 from functools import wraps
 from flask import request, jsonify
 from firebase_admin import auth
-from models.student import Student
+from services.tenancy import set_request_tenant, TENANT_CLAIM
+from models.student import Student, STUDENT_FIELDS
 from models.teacher import Teacher
 
+# Dados do aluno guardados na requisição (o histórico não é decodificado)
+CURRENT_USER_FIELDS = tuple(field for field in STUDENT_FIELDS if field != 'history_presences')
+
 def require_auth(f):
     """
     Decorator que requer autenticação válida
@@ -19,10 +23,15 @@ def require_auth(f):
             decoded_token = auth.verify_id_token(token)
             uid = decoded_token['uid']
             
+            # A academia do usuário vem do claim do token (ou do host)
+            tenant_error = set_request_tenant(decoded_token.get(TENANT_CLAIM))
+            if tenant_error:
+                return jsonify({'error': tenant_error}), 403
+            
             # 1. Tenta encontrar como Aluno primeiro
             student = Student.get_by_uid(uid)
             if student:
-                user_data = student.to_dict()
+                user_data = student.to_dict(CURRENT_USER_FIELDS)
                 user_data['role'] = 'aluno'
                 request.current_user = user_data
                 return f(*args, **kwargs)
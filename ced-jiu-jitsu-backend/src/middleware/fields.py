@@ -0,0 +1,20 @@
+from functools import wraps
+from flask import request, jsonify
+from models.student import Student
+
+def student_fields(mutation: bool = False):
+    """
+    Decorator que lê os campos pedidos na query string (fields e, em rotas
+    de alteração, compact) e os passa para a rota no argumento fields.
+    Campo desconhecido retorna 400.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            try:
+                kwargs['fields'] = Student.fields_from_args(request.args, mutation=mutation)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
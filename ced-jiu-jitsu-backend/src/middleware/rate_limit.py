@@ -0,0 +1,224 @@
+import math
+import os
+import threading
+import time
+from functools import wraps
+from typing import Dict
+from flask import request, jsonify
+from services.tenancy import current_tenant
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+# Token bucket por usuário: requisições por minuto e rajada máxima
+RATE_LIMIT_PER_MINUTE = _env_float('RATE_LIMIT_PER_MINUTE', 60)
+RATE_LIMIT_BURST = _env_float('RATE_LIMIT_BURST', 20)
+# Cota de cada academia (soma de todos os usuários da unidade)
+TENANT_RATE_LIMIT_PER_MINUTE = _env_float('TENANT_RATE_LIMIT_PER_MINUTE', 600)
+TENANT_RATE_LIMIT_BURST = _env_float('TENANT_RATE_LIMIT_BURST', 100)
+# Buckets sem uso há mais tempo que isso são descartados
+BUCKET_IDLE_SECONDS = 600
+MAX_BUCKETS = 10000
+
+# Limites de concorrência por endpoint: (execuções simultâneas, fila máxima, espera máxima em segundos)
+CONCURRENCY_DEFAULTS = {
+    'roster': (4, 8, 2.0),
+    'close_to_graduation': (2, 4, 2.0),
+    'classes': (4, 8, 2.0),
+    'dashboard': (4, 8, 2.0),
+}
+
+def _concurrency_config(name: str):
+    """
+    Lê o limite de um endpoint, permitindo sobrescrever por variável de ambiente
+    (ex.: CONCURRENCY_ROSTER_MAX, CONCURRENCY_ROSTER_QUEUE, CONCURRENCY_ROSTER_WAIT)
+    """
+    max_concurrent, max_queue, max_wait = CONCURRENCY_DEFAULTS.get(name, (4, 8, 2.0))
+    prefix = f'CONCURRENCY_{name.upper()}'
+    return (
+        int(_env_float(f'{prefix}_MAX', max_concurrent)),
+        int(_env_float(f'{prefix}_QUEUE', max_queue)),
+        _env_float(f'{prefix}_WAIT', max_wait)
+    )
+
+class TokenBucketLimiter:
+    """
+    Limita requisições por chave (UID) com o algoritmo token bucket
+    """
+
+    def __init__(self, per_minute: float = RATE_LIMIT_PER_MINUTE, burst: float = RATE_LIMIT_BURST):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._buckets: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.allowed_total = 0
+        self.limited_total = 0
+
+    def _evict_idle(self, now: float):
+        idle = [key for key, (_, last) in self._buckets.items() if now - last > BUCKET_IDLE_SECONDS]
+        for key in idle:
+            del self._buckets[key]
+
+    def acquire(self, key: str) -> float:
+        """
+        Consome um token. Retorna 0 se permitido ou os segundos até o próximo token.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) > MAX_BUCKETS:
+                self._evict_idle(now)
+
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                self.allowed_total += 1
+                return 0.0
+
+            self._buckets[key] = (tokens, now)
+            self.limited_total += 1
+            return (1 - tokens) / self.rate if self.rate > 0 else 60.0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'per_minute': self.rate * 60,
+                'burst': self.burst,
+                'tracked_users': len(self._buckets),
+                'allowed_total': self.allowed_total,
+                'limited_total': self.limited_total
+            }
+
+class ConcurrencyLimiter:
+    """
+    Limita execuções simultâneas de um endpoint (por academia). O excesso
+    espera numa fila curta e, se a fila estiver cheia ou a espera estourar,
+    é descartado.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.max_concurrent, self.max_queue, self.max_wait = _concurrency_config(name)
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted_total = 0
+        self.queued_total = 0
+        self.shed_total = 0
+
+    def acquire(self) -> bool:
+        if self._semaphore.acquire(blocking=False):
+            with self._lock:
+                self.in_flight += 1
+                self.admitted_total += 1
+            return True
+
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.shed_total += 1
+                return False
+            self.waiting += 1
+            self.queued_total += 1
+
+        acquired = self._semaphore.acquire(timeout=self.max_wait) if self.max_wait > 0 else False
+        with self._lock:
+            self.waiting -= 1
+            if acquired:
+                self.in_flight += 1
+                self.admitted_total += 1
+            else:
+                self.shed_total += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'max_wait_seconds': self.max_wait,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'admitted_total': self.admitted_total,
+                'queued_total': self.queued_total,
+                'shed_total': self.shed_total
+            }
+
+user_limiter = TokenBucketLimiter()
+tenant_limiter = TokenBucketLimiter(TENANT_RATE_LIMIT_PER_MINUTE, TENANT_RATE_LIMIT_BURST)
+_concurrency_limiters: Dict[tuple, ConcurrencyLimiter] = {}
+_concurrency_lock = threading.Lock()
+
+def _get_concurrency_limiter(name: str, tenant: str) -> ConcurrencyLimiter:
+    key = (name, tenant)
+    limiter = _concurrency_limiters.get(key)
+    if limiter is None:
+        with _concurrency_lock:
+            limiter = _concurrency_limiters.setdefault(key, ConcurrencyLimiter(name))
+    return limiter
+
+def _too_many_requests(wait_seconds: float):
+    response = jsonify({'error': 'Muitas requisições, tente novamente em instantes'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(wait_seconds)))
+    return response
+
+def rate_limit(f):
+    """
+    Decorator que aplica o token bucket por UID e a cota da academia
+    (usar depois de require_auth)
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user = getattr(request, 'current_user', None) or {}
+        tenant = current_tenant()
+        key = user.get('uid') or request.remote_addr or 'anonymous'
+
+        wait_seconds = user_limiter.acquire(f'{tenant}:{key}')
+        if wait_seconds > 0:
+            return _too_many_requests(wait_seconds)
+        wait_seconds = tenant_limiter.acquire(tenant)
+        if wait_seconds > 0:
+            return _too_many_requests(wait_seconds)
+
+        return f(*args, **kwargs)
+    return decorated_function
+
+def concurrency_limit(name: str):
+    """
+    Decorator que limita quantas requisições do endpoint rodam ao mesmo tempo
+    em cada academia
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            limiter = _get_concurrency_limiter(name, current_tenant())
+            if not limiter.acquire():
+                response = jsonify({'error': 'Servidor ocupado, tente novamente em instantes'})
+                response.status_code = 503
+                response.headers['Retry-After'] = str(max(1, math.ceil(limiter.max_wait)))
+                return response
+            try:
+                return f(*args, **kwargs)
+            finally:
+                limiter.release()
+        return decorated_function
+    return decorator
+
+def get_rate_limit_stats() -> Dict:
+    """
+    Retorna os contadores dos limitadores deste worker
+    """
+    concurrency = {}
+    for (name, tenant), limiter in list(_concurrency_limiters.items()):
+        concurrency.setdefault(tenant, {})[name] = limiter.stats()
+    return {
+        'per_user': user_limiter.stats(),
+        'per_tenant': tenant_limiter.stats(),
+        'concurrency': concurrency
+    }
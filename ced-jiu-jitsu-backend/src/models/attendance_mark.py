@@ -0,0 +1,349 @@
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from firebase_admin import firestore
+from google.api_core import exceptions as google_exceptions
+from config.firebase_config import get_db
+from services.single_flight import single_flight
+from services.storage_policy import storage_call
+from services.tenancy import collection_path
+from services.write_buffer import write_buffer
+from models.class_session import ClassSession
+from models.student import Student
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# O Firestore aceita no máximo 500 operações por batch
+MAX_BATCH_OPERATIONS = 450
+# Limite de documentos por chamada get_all
+MAX_READ_CHUNK = 300
+# Tentativas por aluno quando outro processo grava o mesmo aluno ao mesmo tempo
+MAX_CONFLICT_RETRIES = 5
+
+class AttendanceMark:
+    """
+    Registro de deduplicação de uma presença já aplicada (uma por aula e aluno)
+    """
+
+    COLLECTION = 'attendance_marks'
+
+    def __init__(self, class_id: str, student_uid: str, idempotency_key: str = "",
+                 applied_at: datetime = None):
+        self.class_id = class_id
+        self.student_uid = student_uid
+        self.idempotency_key = idempotency_key
+        self.applied_at = applied_at or datetime.now()
+
+    @staticmethod
+    def make_id(class_id: str, student_uid: str) -> str:
+        """
+        Gera o ID determinístico do registro para o par (aula, aluno)
+        """
+        return f"{class_id}__{student_uid}"
+
+    @staticmethod
+    def class_id_for_key(instructor_uid: str, idempotency_key: str) -> str:
+        """
+        Gera um ID de aula estável a partir da chave de idempotência do cliente,
+        para que reenvios da mesma sessão apontem sempre para a mesma aula
+        """
+        digest = hashlib.sha1(f"{instructor_uid}:{idempotency_key}".encode('utf-8')).hexdigest()
+        return f"class_sync_{digest[:20]}"
+
+    def to_dict(self) -> Dict:
+        """
+        Converte o objeto AttendanceMark para um dicionário
+        """
+        return {
+            'class_id': self.class_id,
+            'student_uid': self.student_uid,
+            'idempotency_key': self.idempotency_key,
+            'applied_at': self.applied_at
+        }
+
+    @classmethod
+    def find_existing(cls, pairs: Iterable[Tuple[str, str]]) -> Set[Tuple[str, str]]:
+        """
+        Retorna quais pares (aula, aluno) já possuem registro de presença aplicado
+        """
+        db = get_db()
+        pairs = list(pairs)
+        existing = set()
+
+        for start in range(0, len(pairs), MAX_READ_CHUNK):
+            chunk = pairs[start:start + MAX_READ_CHUNK]
+            refs = [db.collection(collection_path(cls.COLLECTION)).document(cls.make_id(class_id, uid))
+                    for class_id, uid in chunk]
+            docs = storage_call(lambda **kwargs: list(db.get_all(refs, **kwargs)))
+            for doc in docs:
+                if doc.exists:
+                    data = doc.to_dict()
+                    existing.add((data.get('class_id'), data.get('student_uid')))
+
+        return existing
+
+def commit_in_batches(db, operation_groups: List[List[Tuple]]) -> int:
+    """
+    Agrupa operações em batches sem quebrar um grupo entre dois commits.
+    Cada operação é uma tupla (ref, dados).
+    """
+    commits = 0
+    batch = db.batch()
+    pending = 0
+
+    for group in operation_groups:
+        if pending and pending + len(group) > MAX_BATCH_OPERATIONS:
+            storage_call(batch.commit)
+            commits += 1
+            batch = db.batch()
+            pending = 0
+        for ref, data in group:
+            batch.set(ref, data, merge=True)
+        pending += len(group)
+
+    if pending:
+        storage_call(batch.commit)
+        commits += 1
+
+    return commits
+
+class PresenceWriter:
+    """
+    Aplica presenças (aula, data, chave) em vários alunos com segurança
+    contra escritas concorrentes:
+
+    - cada aluno é gravado só com os campos de presença, com precondição
+      do horário de atualização lido (edições e recálculos feitos no meio
+      do caminho não são sobrescritos);
+    - os registros de deduplicação são criados com create() no mesmo commit
+      do aluno, então dois envios simultâneos do mesmo par não contam duas vezes.
+
+    Com update_roster, cada aluno também entra na lista de presentes da aula
+    (ArrayUnion) no mesmo commit do seu registro: presença contada e aula
+    nunca ficam divergentes.
+
+    Se um batch falhar por conflito, os alunos dele são relidos e gravados
+    um a um. Alunos que continuam em conflito depois de MAX_CONFLICT_RETRIES
+    tentativas ficam em failed (nada deles foi gravado) e os demais seguem:
+    os batches anteriores já foram confirmados.
+    """
+
+    def __init__(self, db=None, update_roster: bool = False):
+        self.db = db or get_db()
+        self.update_roster = update_roster
+        self.students_path = collection_path('students')
+        self.marks_path = collection_path(AttendanceMark.COLLECTION)
+        self.classes_path = collection_path('classes')
+        self.students: Dict[str, Student] = {}
+        self.applied: List[Tuple[str, str]] = []
+        self.not_found: Set[str] = set()
+        self.failed: Set[str] = set()
+        self.commits = 0
+        self.conflicts = 0
+
+    def _read(self, uids: List[str]) -> Dict:
+        for uid in uids:
+            write_buffer.flush_document(self.students_path, uid)
+        snapshots = {}
+        for start in range(0, len(uids), MAX_READ_CHUNK):
+            refs = [self.db.collection(self.students_path).document(uid) for uid in uids[start:start + MAX_READ_CHUNK]]
+            docs = storage_call(lambda **kwargs: list(self.db.get_all(refs, **kwargs)))
+            for doc in docs:
+                if doc.exists:
+                    snapshots[doc.id] = doc
+        return snapshots
+
+    def _group(self, uid: str, snapshot, entries: List[Tuple[str, datetime, str]],
+               existing: Set[Tuple[str, str]]) -> Optional[Tuple[Student, List[tuple], List[Tuple[str, str]]]]:
+        """
+        Operações de um aluno: criação dos registros e atualização dos campos de presença
+        """
+        student = Student.from_dict(snapshot.to_dict()) if snapshot is not None else None
+        if student is None:
+            return None
+        operations = []
+        pairs = []
+        for class_id, class_date, key in entries:
+            if (class_id, uid) in existing:
+                continue
+            student.apply_presence(class_date, update_degree=False)
+            mark = AttendanceMark(class_id, uid, idempotency_key=key)
+            mark_ref = self.db.collection(self.marks_path).document(AttendanceMark.make_id(class_id, uid))
+            operations.append(('create', mark_ref, mark.to_dict(), None))
+            pairs.append((class_id, uid))
+        if operations:
+            operations.append(('update', snapshot.reference, student.presence_fields(),
+                               self.db.write_option(last_update_time=snapshot.update_time)))
+        return student, operations, pairs
+
+    def _operation_count(self, operations: List[tuple], pairs: List[Tuple[str, str]]) -> int:
+        # Conta uma escrita de aula por registro (no commit elas são agrupadas por aula)
+        return len(operations) + (len(pairs) if self.update_roster else 0)
+
+    def _commit(self, groups: List[tuple]) -> None:
+        batch = self.db.batch()
+        attendees: Dict[str, List[str]] = {}
+        for _, _, operations, pairs in groups:
+            for kind, ref, data, option in operations:
+                if kind == 'create':
+                    batch.create(ref, data)
+                else:
+                    batch.update(ref, data, option=option)
+            for class_id, uid in pairs:
+                attendees.setdefault(class_id, []).append(uid)
+        if self.update_roster:
+            for class_id, uids in attendees.items():
+                batch.set(self.db.collection(self.classes_path).document(class_id),
+                          {'attended_students': firestore.ArrayUnion(uids)}, merge=True)
+        storage_call(batch.commit)
+        self.commits += 1
+        for uid, student, _, pairs in groups:
+            self.students[uid] = student
+            self.applied.extend(pairs)
+
+    def _retry(self, uid: str, entries: List[Tuple[str, datetime, str]]) -> None:
+        """
+        Relê registros e aluno e grava sozinho, até MAX_CONFLICT_RETRIES vezes
+        """
+        for _ in range(MAX_CONFLICT_RETRIES):
+            existing = AttendanceMark.find_existing((class_id, uid) for class_id, _, _ in entries)
+            group = self._group(uid, self._read([uid]).get(uid), entries, existing)
+            if group is None:
+                self.not_found.add(uid)
+                return
+            student, operations, pairs = group
+            if not operations:
+                return
+            try:
+                self._commit([(uid, student, operations, pairs)])
+                return
+            except (google_exceptions.FailedPrecondition, google_exceptions.Conflict):
+                self.conflicts += 1
+        logger.error(f"Estudante {uid} alterado concorrentemente {MAX_CONFLICT_RETRIES} vezes; presenças não aplicadas")
+        self.failed.add(uid)
+
+    def apply(self, pending_by_student: Dict[str, List[Tuple[str, datetime, str]]],
+              existing: Set[Tuple[str, str]]) -> None:
+        """
+        Aplica as presenças pendentes de cada aluno (uid -> [(aula, data, chave)])
+        """
+        uids = list(pending_by_student)
+        snapshots = self._read(uids)
+
+        batch_groups = []
+        pending = 0
+        retry = []
+        for uid in uids:
+            group = self._group(uid, snapshots.get(uid), pending_by_student[uid], existing)
+            if group is None:
+                self.not_found.add(uid)
+                continue
+            student, operations, pairs = group
+            if not operations:
+                continue
+            count = self._operation_count(operations, pairs)
+            if pending and pending + count > MAX_BATCH_OPERATIONS:
+                retry.extend(self._try_commit(batch_groups))
+                batch_groups, pending = [], 0
+            batch_groups.append((uid, student, operations, pairs))
+            pending += count
+        if batch_groups:
+            retry.extend(self._try_commit(batch_groups))
+
+        for uid in retry:
+            self._retry(uid, pending_by_student[uid])
+
+        single_flight.forget_collection(self.students_path)
+        if self.update_roster:
+            single_flight.forget_collection(self.classes_path)
+
+    def _try_commit(self, groups: List[tuple]) -> List[str]:
+        try:
+            self._commit(groups)
+            return []
+        except (google_exceptions.FailedPrecondition, google_exceptions.Conflict):
+            self.conflicts += 1
+            logger.warning(f"Conflito ao gravar presenças de {len(groups)} aluno(s); regravando um a um")
+            return [uid for uid, _, _, _ in groups]
+
+def sync_class_sessions(sessions: List[Dict], instructor_uid: str) -> Dict:
+    """
+    Aplica várias sessões de aula enfileiradas offline em commits agrupados.
+
+    Cada sessão é um dicionário com 'idempotency_key', 'date' (datetime com
+    fuso) e 'student_uids'. Pares (aula, aluno) que já possuem registro em
+    attendance_marks são ignorados, o que torna o reenvio seguro, inclusive
+    quando dois reenvios chegam ao mesmo tempo.
+    """
+    db = get_db()
+
+    # Ordena por data para que a progressão de graus siga a ordem das aulas
+    sessions = sorted(sessions, key=lambda session: session['date'])
+
+    class_sessions = []
+    pairs = []
+    for session in sessions:
+        class_id = AttendanceMark.class_id_for_key(instructor_uid, session['idempotency_key'])
+        class_session = ClassSession(
+            class_id=class_id,
+            date=session['date'],
+            instructor_uid=instructor_uid,
+            attended_students=list(dict.fromkeys(session['student_uids']))
+        )
+        class_sessions.append((session['idempotency_key'], class_session))
+        pairs.extend((class_id, uid) for uid in class_session.attended_students)
+
+    existing = AttendanceMark.find_existing(pairs)
+
+    # Agrupa as presenças pendentes por aluno para ler cada aluno uma única vez
+    pending_by_student: Dict[str, List[Tuple[str, datetime, str]]] = {}
+    for key, class_session in class_sessions:
+        for uid in class_session.attended_students:
+            if (class_session.class_id, uid) not in existing:
+                pending_by_student.setdefault(uid, []).append((class_session.class_id, class_session.date, key))
+
+    # As aulas são gravadas primeiro (set com merge é idempotente)
+    commits = commit_in_batches(db, [
+        [(db.collection(collection_path('classes')).document(class_session.class_id), class_session.to_dict())]
+        for _, class_session in class_sessions
+    ])
+    single_flight.forget_collection(collection_path('classes'))
+
+    writer = PresenceWriter(db)
+    writer.apply(pending_by_student, existing)
+    commits += writer.commits
+
+    applied = {}
+    for class_id, _ in writer.applied:
+        applied[class_id] = applied.get(class_id, 0) + 1
+    failed_pairs = {(class_id, uid) for uid in writer.failed for class_id, _, _ in pending_by_student[uid]}
+    results = []
+    for key, class_session in class_sessions:
+        missing = sum(1 for uid in class_session.attended_students if uid in writer.not_found)
+        failed = sum(1 for uid in class_session.attended_students if (class_session.class_id, uid) in failed_pairs)
+        count = applied.get(class_session.class_id, 0)
+        result = {
+            'idempotency_key': key,
+            'class_id': class_session.class_id,
+            'applied': count,
+            'skipped': len(class_session.attended_students) - count - missing - failed
+        }
+        if failed:
+            # Nada desses alunos foi gravado: reenviar a aula aplica só o que faltou
+            result['failed'] = failed
+        results.append(result)
+
+    for student in writer.students.values():
+        student.run_save_hooks('presence_marked')
+    logger.info(f"Sincronização offline aplicada em {commits} commit(s) para {len(sessions)} aula(s)")
+
+    return {
+        'sessions': results,
+        'commits': commits,
+        'student_uids': list(writer.students),
+        'errors': [f'Estudante com UID {uid} não encontrado' for uid in sorted(writer.not_found)] +
+                  [f'Presenças do estudante {uid} não gravadas por alterações concorrentes; reenvie a sincronização'
+                   for uid in sorted(writer.failed)]
+    }
@@ -1,6 +1,10 @@
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 from config.firebase_config import get_db
+from models.pagination import paginate_query, DEFAULT_PAGE_SIZE
+from services.single_flight import single_flight
+from services.storage_policy import storage_call
+from services.tenancy import collection_path
 
 class ClassSession:
     """
@@ -40,7 +44,8 @@ class ClassSession:
             class_id=data.get('class_id', ''),
             date=data.get('date'),
             instructor_uid=data.get('instructor_uid', ''),
-            attended_students=data.get('attended_students', [])
+            # Cópia: os dados podem ser compartilhados entre leituras agrupadas
+            attended_students=list(data.get('attended_students') or [])
         )
     
     def add_student(self, student_uid: str) -> bool:
@@ -67,8 +72,10 @@ class ClassSession:
         """
         try:
             db = get_db()
-            class_ref = db.collection('classes').document(self.class_id)
-            class_ref.set(self.to_dict(), merge=True)
+            path = collection_path('classes')
+            class_ref = db.collection(path).document(self.class_id)
+            storage_call(class_ref.set, self.to_dict(), merge=True)
+            single_flight.forget_collection(path)
             return True
         except Exception as e:
             print(f"Erro ao salvar aula: {e}")
@@ -81,33 +88,53 @@ class ClassSession:
         """
         try:
             db = get_db()
-            class_ref = db.collection('classes').document(class_id)
-            doc = class_ref.get()
+            path = collection_path('classes')
+            class_ref = db.collection(path).document(class_id)
             
-            if doc.exists:
-                return cls.from_dict(doc.to_dict())
-            return None
+            # Leituras simultâneas da mesma aula compartilham uma única chamada
+            data = single_flight.do(('class', path, class_id), lambda: cls._fetch_data(class_ref))
+            return cls.from_dict(data) if data is not None else None
         except Exception as e:
             print(f"Erro ao buscar aula: {e}")
             return None
     
+    @staticmethod
+    def _fetch_data(class_ref) -> Optional[Dict]:
+        doc = storage_call(class_ref.get)
+        return doc.to_dict() if doc.exists else None
+    
+    @classmethod
+    def iter_range(cls, start_date: datetime = None, end_date: datetime = None,
+                   page_size: int = DEFAULT_PAGE_SIZE, fields: Optional[Iterable[str]] = None,
+                   tenant: Optional[str] = None) -> Iterator['ClassSession']:
+        """
+        Percorre as aulas em ordem de data, página por página (memória constante).
+        fields limita os campos lidos (ex.: ('date', 'attended_students')).
+        """
+        query = get_db().collection(collection_path('classes', tenant))
+        if start_date:
+            query = query.where('date', '>=', start_date)
+        if end_date:
+            query = query.where('date', '<=', end_date)
+        query = query.order_by('date')
+        if fields is not None:
+            query = query.select(list(fields))
+        
+        for doc in paginate_query(query, page_size):
+            data = doc.to_dict() or {}
+            class_session = cls.from_dict(data)
+            # Documentos antigos (ou lidos sem o campo) usam o ID do documento
+            if not data.get('class_id'):
+                class_session.class_id = doc.id
+            yield class_session
+    
     @classmethod
     def get_by_date_range(cls, start_date: datetime, end_date: datetime) -> List['ClassSession']:
         """
         Busca aulas em um intervalo de datas
         """
         try:
-            db = get_db()
-            classes_ref = db.collection('classes')
-            query = classes_ref.where('date', '>=', start_date).where('date', '<=', end_date)
-            docs = query.stream()
-            
-            classes = []
-            for doc in docs:
-                classes.append(cls.from_dict(doc.to_dict()))
-            
-            return classes
+            return list(cls.iter_range(start_date, end_date))
         except Exception as e:
             print(f"Erro ao buscar aulas: {e}")
             return []
-
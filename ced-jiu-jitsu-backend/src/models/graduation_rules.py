@@ -0,0 +1,264 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional
+from firebase_admin import firestore
+from config.firebase_config import get_db
+from services.storage_policy import storage_call
+from services.tenancy import TenantLocal, collection_path
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Documento que guarda a tabela de graduação da academia
+RULES_COLLECTION = 'config'
+RULES_DOCUMENT = 'graduation_rules'
+# Intervalo entre verificações de versão no Firestore
+CHECK_INTERVAL_SECONDS = float(os.getenv('GRADUATION_RULES_CHECK_SECONDS', '30'))
+
+# Regras padrão (as mesmas que antes ficavam fixas no código)
+DEFAULT_RULES = {
+    'max_degrees': 4,
+    'default_belt': {'normal': 50, 'with_activity': 45, 'next': 'azul'},
+    'belts': {
+        'branca': {'normal': 50, 'with_activity': 45, 'next': 'azul'},
+        'azul': {'normal': 90, 'with_activity': 85, 'next': 'roxa'},
+        'roxa': {'normal': 70, 'with_activity': 65, 'next': 'marrom'},
+        'marrom': {'normal': 80, 'with_activity': 70, 'next': 'preta'},
+        'preta': {'type': 'time_based', 'next': 'preta'}  # Faixa preta é baseada em tempo
+    }
+}
+
+class CompiledRules:
+    """
+    Tabela de graduação compilada e imutável. Cada faixa vira um mapeamento
+    somente leitura, então a avaliação por requisição é apenas uma consulta.
+    """
+
+    __slots__ = ('version', 'max_degrees', 'belts', 'default_belt')
+
+    def __init__(self, rules: Dict, version: int = 0):
+        self.version = version
+        self.max_degrees = int(rules.get('max_degrees', DEFAULT_RULES['max_degrees']))
+        self.default_belt = self._compile_belt(rules.get('default_belt', DEFAULT_RULES['default_belt']))
+        self.belts = MappingProxyType({
+            name: self._compile_belt(belt) for name, belt in rules.get('belts', {}).items()
+        })
+
+    @staticmethod
+    def _compile_belt(belt: Dict) -> Mapping:
+        if belt.get('type') == 'time_based':
+            compiled = {'type': 'time_based', 'next': belt.get('next', ''), 'time_based': True}
+        else:
+            compiled = {
+                'normal': int(belt['normal']),
+                'with_activity': int(belt['with_activity']),
+                'next': belt.get('next', ''),
+                'time_based': False
+            }
+        return MappingProxyType(compiled)
+
+    def for_belt(self, belt: str) -> Mapping:
+        return self.belts.get(belt, self.default_belt)
+
+    def next_belt(self, belt: str) -> str:
+        return self.for_belt(belt)['next']
+
+    def required_presences(self, belt: str, degrees: int, extra_activities: int) -> int:
+        """
+        Presenças acumuladas necessárias até o próximo grau. Cada grau já
+        coberto por uma atividade extra usa o requisito reduzido.
+        """
+        rule = self.for_belt(belt)
+        if rule['time_based']:
+            return 0
+        steps = degrees + 1
+        with_activity = min(max(extra_activities, 0), steps)
+        return with_activity * rule['with_activity'] + (steps - with_activity) * rule['normal']
+
+    def degrees_for(self, belt: str, total_presences: int, extra_activities: int) -> Optional[int]:
+        """
+        Grau alcançado com o total de presenças, como se as presenças fossem
+        aplicadas uma a uma. None para faixas baseadas em tempo.
+        """
+        if self.for_belt(belt)['time_based']:
+            return None
+        degrees = 0
+        while degrees < self.max_degrees and \
+                self.required_presences(belt, degrees, extra_activities) <= total_presences:
+            degrees += 1
+        return degrees
+
+    def to_dict(self) -> Dict:
+        """
+        Converte as regras de volta para o formato armazenado
+        """
+        def plain(belt):
+            return {key: value for key, value in belt.items() if key != 'time_based'}
+
+        return {
+            'version': self.version,
+            'max_degrees': self.max_degrees,
+            'default_belt': plain(self.default_belt),
+            'belts': {name: plain(belt) for name, belt in self.belts.items()}
+        }
+
+def _is_positive_int(value) -> bool:
+    # bool é subclasse de int no Python, mas true não é um número de presenças
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+def _validate_belt(name: str, belt) -> None:
+    """
+    Valida a regra de uma faixa (também usada para default_belt)
+    """
+    if not isinstance(belt, dict):
+        raise ValueError(f'Regra inválida para a faixa {name}')
+    if not belt.get('next'):
+        raise ValueError(f'Faixa {name}: campo next é obrigatório')
+    if belt.get('type') == 'time_based':
+        return
+    for field in ('normal', 'with_activity'):
+        if not _is_positive_int(belt.get(field)):
+            raise ValueError(f'Faixa {name}: {field} deve ser um inteiro positivo')
+
+def validate_rules(rules: Dict) -> Dict:
+    """
+    Valida uma tabela de graduação enviada pelo cliente; lança ValueError se inválida
+    """
+    if not isinstance(rules, dict) or not isinstance(rules.get('belts'), dict) or not rules['belts']:
+        raise ValueError('Regras devem conter o mapa belts')
+
+    for name, belt in rules['belts'].items():
+        _validate_belt(name, belt)
+    if 'default_belt' in rules:
+        _validate_belt('default_belt', rules['default_belt'])
+
+    max_degrees = rules.get('max_degrees', DEFAULT_RULES['max_degrees'])
+    if not _is_positive_int(max_degrees):
+        raise ValueError('max_degrees deve ser um inteiro positivo')
+
+    # Valida que compila
+    CompiledRules(rules)
+    return rules
+
+class RulesSaveConflict(Exception):
+    """
+    Lançada quando outra gravação das regras venceu todas as tentativas da transação
+    """
+
+class GraduationRulesCache:
+    """
+    Mantém as regras compiladas de uma academia em memória e verifica
+    periodicamente se a versão guardada no Firestore mudou
+    """
+
+    def __init__(self, tenant: str):
+        self.tenant = tenant
+        self._rules = CompiledRules(DEFAULT_RULES)
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self) -> CompiledRules:
+        if self._checked_at is None or time.monotonic() - self._checked_at >= CHECK_INTERVAL_SECONDS:
+            # Só uma thread verifica; as outras seguem com as regras atuais
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._checked_at = time.monotonic()
+                    self._refresh()
+                finally:
+                    self._lock.release()
+        return self._rules
+    
+    def refresh(self) -> CompiledRules:
+        """
+        Força a verificação da versão no Firestore
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            self._refresh()
+        return self._rules
+
+    def _document(self):
+        return get_db().collection(collection_path(RULES_COLLECTION, self.tenant)).document(RULES_DOCUMENT)
+
+    def _refresh(self):
+        try:
+            doc = storage_call(self._document().get)
+            if not doc.exists:
+                return
+            data = doc.to_dict()
+            version = data.get('version', 0)
+            if version != self._rules.version:
+                self._rules = CompiledRules(data, version)
+                logger.info(f"Regras de graduação atualizadas para a versão {version}")
+        except Exception as e:
+            logger.error(f"Erro ao verificar regras de graduação, mantendo versão {self._rules.version}: {e}")
+
+    def save(self, rules: Dict, updated_by: str = '') -> CompiledRules:
+        """
+        Grava uma nova versão das regras e atualiza o cache local.
+
+        A versão é lida e gravada na mesma transação: dois saves simultâneos
+        (em workers diferentes) nunca gravam o mesmo número, e _refresh
+        depende disso para perceber a mudança.
+        """
+        rules = validate_rules(rules)
+        db = get_db()
+        document = self._document()
+
+        @firestore.transactional
+        def allocate(transaction):
+            snapshot = document.get(transaction=transaction)
+            current = (snapshot.to_dict() or {}).get('version', 0) if snapshot.exists else 0
+            compiled = CompiledRules(rules, current + 1)
+
+            data = compiled.to_dict()
+            data['updated_by'] = updated_by
+            data['updated_at'] = datetime.now()
+            transaction.set(document, data)
+            return compiled
+
+        try:
+            compiled = storage_call(lambda **kwargs: allocate(db.transaction()))
+        except ValueError as e:
+            # firestore.transactional esgota as tentativas com ValueError
+            raise RulesSaveConflict('Regras de graduação alteradas ao mesmo tempo por outro professor, '
+                                    'tente novamente') from e
+
+        with self._lock:
+            # Outra thread pode já ter carregado uma versão mais nova
+            if compiled.version > self._rules.version:
+                self._rules = compiled
+            self._checked_at = time.monotonic()
+        return compiled
+
+class TenantGraduationRules:
+    """
+    Regras de graduação da academia atual (cada academia tem sua tabela e seu cache)
+    """
+
+    def __init__(self):
+        self._caches = TenantLocal(GraduationRulesCache)
+
+    def for_tenant(self, tenant: str) -> GraduationRulesCache:
+        return self._caches.for_tenant(tenant)
+
+    def get(self) -> CompiledRules:
+        return self._caches.current().get()
+
+    def refresh(self) -> CompiledRules:
+        return self._caches.current().refresh()
+
+    def save(self, rules: Dict, updated_by: str = '') -> CompiledRules:
+        return self._caches.current().save(rules, updated_by)
+
+graduation_rules = TenantGraduationRules()
+
+def get_rules() -> CompiledRules:
+    """
+    Regras de graduação vigentes
+    """
+    return graduation_rules.get()
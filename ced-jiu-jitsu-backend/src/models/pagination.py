@@ -0,0 +1,29 @@
+import logging
+from typing import Iterator
+from services.storage_policy import storage_call
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 500
+
+def paginate_query(query, page_size: int = DEFAULT_PAGE_SIZE) -> Iterator:
+    """
+    Percorre uma consulta do Firestore página por página usando cursores.
+
+    A consulta precisa ter um order_by definido para que o cursor (start_after)
+    seja estável. Apenas uma página fica em memória por vez.
+    """
+    last_doc = None
+    while True:
+        page_query = query.limit(page_size)
+        if last_doc is not None:
+            page_query = page_query.start_after(last_doc)
+
+        docs = storage_call(page_query.get)
+        for doc in docs:
+            yield doc
+
+        if len(docs) < page_size:
+            return
+        last_doc = docs[-1]
@@ -0,0 +1,180 @@
+import logging
+import struct
+from functools import lru_cache
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Formato: versão (1 byte), dia base em ordinal (4 bytes), tamanho do bitmap
+# (4 bytes), bitmap, e pares (offset 4 bytes, contagem 2 bytes) para dias com
+# mais de uma presença
+ENCODING_VERSION = 1
+_HEADER = struct.Struct('>BII')
+_EXTRA = struct.Struct('>IH')
+# Posições dos bits ligados em cada valor de byte
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if value & (1 << bit)) for value in range(256))
+
+@lru_cache(maxsize=8192)
+def _iso_day(ordinal: int) -> str:
+    # Os dias se repetem entre alunos (mesmas aulas), então o texto é reaproveitado
+    return date.fromordinal(ordinal).isoformat()
+
+def to_day(value) -> date:
+    """
+    Converte datetime, date ou texto ISO-8601 para o dia correspondente
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+class PresenceBitmap:
+    """
+    Histórico de presenças compacto: um bit por dia a partir de um dia base,
+    com contagem extra opcional para dias com mais de uma presença.
+    Acrescentar é O(1) amortizado e contar um intervalo usa popcount.
+    """
+
+    __slots__ = ('epoch', 'bits', 'extra', '_count')
+
+    def __init__(self, epoch: Optional[date] = None, bits: bytearray = None, extra: Dict[int, int] = None):
+        self.epoch = epoch
+        self.bits = bits if bits is not None else bytearray()
+        self.extra = extra if extra is not None else {}
+        self._count = None
+
+    def __len__(self) -> int:
+        if self._count is None:
+            self._count = int.from_bytes(self.bits, 'little').bit_count() + sum(self.extra.values())
+        return self._count
+
+    def _rebase(self, new_epoch: date):
+        """
+        Move o dia base para trás (presença anterior ao início do bitmap)
+        """
+        shift = (self.epoch - new_epoch).days
+        value = int.from_bytes(self.bits, 'little') << shift
+        self.bits = bytearray(value.to_bytes((value.bit_length() + 7) // 8, 'little'))
+        self.extra = {offset + shift: count for offset, count in self.extra.items()}
+        self.epoch = new_epoch
+
+    def add(self, value) -> None:
+        """
+        Registra uma presença no dia informado
+        """
+        day = to_day(value)
+        if self.epoch is None:
+            self.epoch = day
+        elif day < self.epoch:
+            self._rebase(day)
+
+        offset = (day - self.epoch).days
+        index, bit = divmod(offset, 8)
+        if index >= len(self.bits):
+            self.bits.extend(bytes(index - len(self.bits) + 1))
+
+        if self.bits[index] & (1 << bit):
+            self.extra[offset] = self.extra.get(offset, 0) + 1
+        else:
+            self.bits[index] |= 1 << bit
+
+        if self._count is not None:
+            self._count += 1
+
+    def count_range(self, start, end) -> int:
+        """
+        Quantidade de presenças entre dois dias (inclusive)
+        """
+        if self.epoch is None:
+            return 0
+        low = max(0, (to_day(start) - self.epoch).days)
+        high = min((to_day(end) - self.epoch).days, len(self.bits) * 8 - 1)
+        if low > high:
+            return 0
+
+        chunk = int.from_bytes(self.bits[low // 8:high // 8 + 1], 'little') >> (low % 8)
+        chunk &= (1 << (high - low + 1)) - 1
+        total = chunk.bit_count()
+        if self.extra:
+            total += sum(count for offset, count in self.extra.items() if low <= offset <= high)
+        return total
+
+    def count_since(self, start) -> int:
+        """
+        Presenças de um dia em diante (ex.: "nos últimos 90 dias")
+        """
+        if self.epoch is None:
+            return 0
+        return self.count_range(start, self.epoch + timedelta(days=len(self.bits) * 8))
+
+    def days(self, limit: Optional[int] = None) -> List[str]:
+        """
+        Lista de dias (ISO-8601) em ordem, repetindo dias com mais de uma presença.
+        Com limit, para de decodificar depois dos primeiros limit dias.
+        """
+        result = []
+        if self.epoch is None or limit == 0:
+            return result
+        base = self.epoch.toordinal()
+        extra = self.extra
+        for index, byte in enumerate(self.bits):
+            if not byte:
+                continue
+            for bit in _BYTE_BITS[byte]:
+                offset = index * 8 + bit
+                day = _iso_day(base + offset)
+                if extra and offset in extra:
+                    result.extend([day] * (1 + extra[offset]))
+                else:
+                    result.append(day)
+            if limit is not None and len(result) >= limit:
+                return result[:limit]
+        return result
+
+    def to_bytes(self) -> bytes:
+        if self.epoch is None:
+            return b''
+        parts = [_HEADER.pack(ENCODING_VERSION, self.epoch.toordinal(), len(self.bits)), bytes(self.bits)]
+        for offset in sorted(self.extra):
+            parts.append(_EXTRA.pack(offset, self.extra[offset]))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'PresenceBitmap':
+        if not data:
+            return cls()
+        version, ordinal, length = _HEADER.unpack_from(data, 0)
+        if version != ENCODING_VERSION:
+            raise ValueError(f'Versão de bitmap de presenças desconhecida: {version}')
+        start = _HEADER.size
+        bits = bytearray(data[start:start + length])
+        extra = {}
+        for position in range(start + length, len(data), _EXTRA.size):
+            offset, count = _EXTRA.unpack_from(data, position)
+            extra[offset] = count
+        return cls(date.fromordinal(ordinal), bits, extra)
+
+    @classmethod
+    def from_iso_list(cls, history: Iterable, epoch: Optional[date] = None,
+                      invalid: Optional[List] = None) -> 'PresenceBitmap':
+        """
+        Converte o formato antigo (lista de datas ISO-8601) para o bitmap.
+        O histórico antigo guardava o texto enviado pelo cliente: entradas que
+        não são datas (ex.: '15/03/2024') são ignoradas e registradas no log
+        (e acrescentadas a invalid, se informado).
+        """
+        bitmap = cls(epoch)
+        skipped = []
+        for value in sorted(history, key=lambda item: str(item)):
+            try:
+                bitmap.add(value)
+            except (TypeError, ValueError):
+                skipped.append(value)
+        if skipped:
+            logger.warning(f"{len(skipped)} data(s) inválida(s) ignorada(s) no histórico de presenças: {skipped[:5]}")
+            if invalid is not None:
+                invalid.extend(skipped)
+        return bitmap
@@ -1,19 +1,77 @@
 import logging
-from datetime import datetime
-from typing import Dict, List, Optional
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional
+from firebase_admin import firestore
+from google.api_core import exceptions as google_exceptions
 from config.firebase_config import get_db
+from models.graduation_rules import get_rules
+from models.pagination import paginate_query, DEFAULT_PAGE_SIZE
+from models.presence_bitmap import PresenceBitmap, to_day
+from services.write_buffer import write_buffer
+from services.single_flight import single_flight
+from services.storage_policy import storage_call
+from services.tenancy import collection_path
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Versão do layout dos documentos em 'students'. A versão 2 é o layout
+# canônico: o documento do aluno contém todos os dados de perfil e não
+# depende mais da coleção 'users'.
+SCHEMA_VERSION = 2
+# 'legacy' mantém a leitura de fallback em 'users' e a escrita nas duas
+# coleções; 'canonical' usa apenas 'students' (após scripts/migrate_identity.py)
+IDENTITY_MODE = os.getenv('STUDENT_IDENTITY_MODE', 'legacy')
+
+# Limite de documentos por chamada get_all
+MAX_READ_CHUNK = 300
+
+# Tentativas de add_presence quando o documento muda entre a leitura e a gravação
+MAX_CONFLICT_RETRIES = 5
+
+# Campos da representação do aluno na API (na ordem de to_dict)
+STUDENT_FIELDS = ('uid', 'name', 'email', 'belt', 'age', 'address', 'education', 'degrees',
+                  'start_date', 'photo_url', 'photo_variants', 'photo_thumbnail',
+                  'extra_activities', 'total_presences',
+                  'last_presence_date', 'history_presences', 'presences_for_next_degree', 'next_belt',
+                  'streak_weeks', 'best_streak_weeks', 'streak_last_week')
+# Resposta compacta das rotas de alteração: apenas os contadores
+COUNTER_FIELDS = ('uid', 'total_presences', 'degrees', 'presences_for_next_degree')
+# Campos gravados necessários para montar cada campo da API (os demais são iguais)
+_STORAGE_DEPENDENCIES = {
+    'history_presences': ('presence_bitmap', 'history_presences', 'start_date'),
+    'photo_thumbnail': ('photo_variants', 'photo_url'),
+    'presences_for_next_degree': ('belt', 'degrees', 'extra_activities', 'total_presences'),
+    'next_belt': ('belt',)
+}
+
 class Student:
     """
     Modelo para representar um estudante de jiu-jitsu
     """
     
+    # Funções chamadas depois que um aluno é gravado: hook(student, event)
+    _save_hooks: List[Callable] = []
+    
+    # Campos derivados e o método que os calcula
+    _COMPUTED_FIELDS = {
+        'presences_for_next_degree': 'calculate_presences_for_next_degree',
+        'next_belt': 'get_next_belt'
+    }
+    
+    # Campos gravados lidos quando o aluno veio de uma leitura parcial (iter_all
+    # com fields); alunos parciais não podem ser gravados
+    _field_mask: Optional[tuple] = None
+    
+    # Documento como foi lido/gravado pela última vez (None para alunos novos):
+    # save() grava apenas os campos que diferem dele
+    _stored: Optional[Dict] = None
+    
     def __init__(self, uid: str, name: str, email: str, belt: str, age: int, 
                  address: str = "", education: str = "", degrees: int = 0, 
-                 start_date: str = None, photo_url: str = "", extra_activities: int = 0):
+                 start_date: str = None, photo_url: str = "", extra_activities: int = 0,
+                 photo_variants: Dict = None):
         self.uid = uid
         self.name = name
         self.email = email
@@ -24,33 +82,101 @@ class Student:
         self.degrees = degrees
         self.start_date = start_date or datetime.now().strftime("%Y-%m-%d")
         self.photo_url = photo_url
+        # URLs da foto enviada: digest, original e miniaturas (small, medium)
+        self.photo_variants = photo_variants or {}
         self.extra_activities = extra_activities  # Número de atividades extras feitas
         self.total_presences = 0
         self.last_presence_date = None
-        self.history_presences = []
+        self.presences = PresenceBitmap(self._start_day())
+        # Semanas seguidas com presença: atual, recorde e segunda-feira da última
+        self.streak_weeks = 0
+        self.best_streak_weeks = 0
+        self.streak_last_week = None
+        # Dias das presenças aplicadas neste objeto (não gravados): os hooks
+        # usam para atualizar os rankings dos períodos de presenças retroativas
+        self.marked_days = set()
+    
+    def _start_day(self):
+        try:
+            return to_day(self.start_date)
+        except ValueError:
+            return None
     
-    def to_dict(self) -> Dict:
+    @property
+    def photo_thumbnail(self) -> str:
         """
-        Converte o objeto Student para um dicionário
+        Miniatura usada nas listagens (a foto original enquanto não há miniatura)
         """
-        return {
-            'uid': self.uid,
-            'name': self.name,
-            'email': self.email,
-            'belt': self.belt,
-            'age': self.age,
-            'address': self.address,
-            'education': self.education,
-            'degrees': self.degrees,
-            'start_date': self.start_date,
-            'photo_url': self.photo_url,
-            'extra_activities': self.extra_activities,
-            'total_presences': self.total_presences,
-            'last_presence_date': self.last_presence_date,
-            'history_presences': self.history_presences,
-            'presences_for_next_degree': self.calculate_presences_for_next_degree(),
-            'next_belt': self.get_next_belt()
-        }
+        return self.photo_variants.get('small') or self.photo_url
+    
+    @property
+    def history_presences(self) -> List[str]:
+        """
+        Dias de presença (ISO-8601) decodificados do bitmap
+        """
+        return self.presences.days()
+    
+    @history_presences.setter
+    def history_presences(self, history: List) -> None:
+        self.presences = PresenceBitmap.from_iso_list(history or [], self._start_day())
+    
+    def to_dict(self, fields: Optional[Iterable[str]] = None) -> Dict:
+        """
+        Converte o objeto Student para um dicionário. Com fields, apenas os
+        campos pedidos são montados (o histórico só é decodificado se pedido).
+        """
+        if fields is None:
+            fields = STUDENT_FIELDS
+        data = {}
+        for field in fields:
+            method = self._COMPUTED_FIELDS.get(field)
+            data[field] = getattr(self, method)() if method else getattr(self, field)
+        return data
+    
+    @classmethod
+    def fields_from_args(cls, args, mutation: bool = False) -> Optional[tuple]:
+        """
+        Campos pedidos na query string (fields=name,belt). Em rotas de
+        alteração, compact=1 retorna apenas os contadores alterados.
+        Lança ValueError se algum campo for desconhecido.
+        """
+        if mutation and args.get('compact', '').lower() in ('1', 'true'):
+            return COUNTER_FIELDS
+        value = args.get('fields')
+        if not value:
+            return None
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in STUDENT_FIELDS]
+        if unknown:
+            raise ValueError(f"Campos desconhecidos: {', '.join(unknown)}")
+        # O uid sempre acompanha a resposta
+        return tuple(['uid'] + [field for field in fields if field != 'uid'])
+    
+    @staticmethod
+    def storage_fields(fields: Optional[Iterable[str]]) -> Optional[tuple]:
+        """
+        Máscara de campos do Firestore para montar os campos pedidos da API
+        (None lê o documento inteiro)
+        """
+        if fields is None:
+            return None
+        mask = {'uid'}
+        for field in fields:
+            mask.update(_STORAGE_DEPENDENCIES.get(field, (field,)))
+        return tuple(sorted(mask))
+    
+    def to_storage_dict(self) -> Dict:
+        """
+        Dicionário gravado no Firestore: o histórico vai como bitmap compacto
+        no lugar da lista de datas
+        """
+        if self._field_mask is not None:
+            raise ValueError(f"Aluno {self.uid} foi lido parcialmente e não pode ser gravado")
+        data = self.to_dict([field for field in STUDENT_FIELDS if field not in ('history_presences', 'photo_thumbnail')])
+        data['history_presences'] = firestore.DELETE_FIELD
+        data['presence_bitmap'] = self.presences.to_bytes()
+        data['schema_version'] = SCHEMA_VERSION
+        return data
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'Student':
@@ -73,41 +199,39 @@ class Student:
                 degrees=data.get('degrees', 0),
                 start_date=data.get('start_date'),
                 photo_url=data.get('photo_url', ''),
-                extra_activities=data.get('extra_activities', 0)
+                extra_activities=data.get('extra_activities', 0),
+                # Os dados podem ser compartilhados entre leituras agrupadas
+                photo_variants=dict(data.get('photo_variants') or {})
             )
             student.total_presences = data.get('total_presences', 0)
             student.last_presence_date = data.get('last_presence_date')
-            student.history_presences = data.get('history_presences', [])
+            student.streak_weeks = data.get('streak_weeks', 0)
+            student.best_streak_weeks = data.get('best_streak_weeks', 0)
+            student.streak_last_week = data.get('streak_last_week')
+            if data.get('presence_bitmap'):
+                student.presences = PresenceBitmap.from_bytes(data['presence_bitmap'])
+            else:
+                # Documento ainda no formato antigo (lista de datas)
+                student.history_presences = data.get('history_presences', [])
+            # Somente leitura: os dados podem ser compartilhados entre leituras agrupadas
+            student._stored = data
             return student
         except Exception as e:
             logger.error(f"Erro ao criar Student a partir de dados: {e}")
             return None
     
-    def get_belt_requirements(self) -> Dict:
+    def get_belt_requirements(self) -> Mapping:
         """
-        Retorna os requisitos de presenças para cada faixa baseado nas regras de negócio
+        Retorna os requisitos de presenças da faixa atual, a partir das regras
+        de graduação compiladas (somente leitura)
         """
-        requirements = {
-            'branca': {'normal': 50, 'with_activity': 45},
-            'azul': {'normal': 90, 'with_activity': 85},
-            'roxa': {'normal': 70, 'with_activity': 65},
-            'marrom': {'normal': 80, 'with_activity': 70},
-            'preta': {'type': 'time_based'}  # Faixa preta é baseada em tempo
-        }
-        return requirements.get(self.belt, {'normal': 50, 'with_activity': 45})
+        return get_rules().for_belt(self.belt)
     
     def get_next_belt(self) -> str:
         """
         Retorna a próxima faixa baseada na faixa atual
         """
-        belt_progression = {
-            'branca': 'azul',
-            'azul': 'roxa',
-            'roxa': 'marrom',
-            'marrom': 'preta',
-            'preta': 'preta'  # Faixa preta não muda
-        }
-        return belt_progression.get(self.belt, 'azul')
+        return get_rules().next_belt(self.belt)
     
     def calculate_presences_for_next_degree(self) -> int:
         """
@@ -115,37 +239,16 @@ class Student:
         baseado nas novas regras de graduação com atividades extras
         """
         try:
-            # Para faixa preta, usar regras de tempo
-            if self.belt == 'preta':
-                return 0  # Faixa preta é baseada em tempo, não presenças
-            
-            # Obter requisitos da faixa atual
-            requirements = self.get_belt_requirements()
-            
-            # --- CORREÇÃO APLICADA AQUI ---
             # Garante que os valores sejam inteiros antes de comparar
-            extra_activities = int(self.extra_activities)
-            degrees = int(self.degrees)
-            total_presences = int(self.total_presences)
-            
-            # Calcular presenças necessárias para o próximo grau
-            if extra_activities > degrees:
-                # Aluno fez atividade extra para este grau
-                presences_needed = requirements['with_activity']
-            else:
-                # Aluno não fez atividade extra para este grau
-                presences_needed = requirements['normal']
+            total_presences_needed = get_rules().required_presences(
+                self.belt, int(self.degrees), int(self.extra_activities))
             
-            # Calcular presenças acumuladas necessárias até o grau atual
-            total_presences_needed = 0
-            for degree in range(degrees + 1):
-                if extra_activities > degree:
-                    total_presences_needed += requirements['with_activity']
-                else:
-                    total_presences_needed += requirements['normal']
+            # Faixas baseadas em tempo (preta) não dependem de presenças
+            if total_presences_needed == 0:
+                return 0
             
             # Retornar quantas presenças faltam
-            return max(0, total_presences_needed - total_presences)
+            return max(0, total_presences_needed - int(self.total_presences))
         
         except Exception as e:
             logger.error(f"Erro ao calcular presenças para próximo grau: {e}")
@@ -153,29 +256,22 @@ class Student:
     
     def is_ready_for_next_belt(self) -> bool:
         """
-        Verifica se o aluno está pronto para a próxima faixa (completou 4 graus)
+        Verifica se o aluno está pronto para a próxima faixa (completou todos os graus)
         """
-        return self.degrees >= 4 and self.calculate_presences_for_next_degree() == 0
+        return self.degrees >= get_rules().max_degrees and self.calculate_presences_for_next_degree() == 0
     
     def can_graduate_with_activity(self) -> bool:
         """
         Verifica se o aluno pode se graduar fazendo uma atividade extra
         """
-        if self.belt == 'preta':
-            return False  # Faixa preta não usa atividades extras
-        
         requirements = self.get_belt_requirements()
+        if requirements['time_based']:
+            return False  # Faixa preta não usa atividades extras
         
-        # Calcular presenças necessárias se fizer atividade extra
-        total_with_activity = 0
-        for degree in range(self.degrees + 1):
-            if degree <= self.extra_activities:  # Já fez atividade para este grau
-                total_with_activity += requirements['with_activity']
-            else:  # Faria atividade para este grau
-                total_with_activity += requirements['with_activity']
-        
-        # Calcular presenças necessárias sem atividade extra
-        total_without_activity = requirements['normal'] * (self.degrees + 1)
+        # Presenças necessárias pelo caminho com atividade e sem atividade
+        steps = self.degrees + 1
+        total_with_activity = requirements['with_activity'] * steps
+        total_without_activity = requirements['normal'] * steps
         
         # Pode se graduar com atividade se tem presenças suficientes para o caminho com atividade
         # mas não tem para o caminho sem atividade
@@ -193,9 +289,140 @@ class Student:
             logger.error(f"Erro ao adicionar atividade extra para {self.uid}: {e}")
             return False
     
+    def apply_presence(self, date: datetime = None, update_degree: bool = True) -> None:
+        """
+        Aplica uma presença apenas em memória (contadores, histórico e grau),
+        sem salvar no Firestore
+        """
+        if date is None:
+            date = datetime.now()
+        
+        self.total_presences += 1
+        self.last_presence_date = date.isoformat() if isinstance(date, datetime) else date
+        self.presences.add(date)
+        self.marked_days.add(to_day(date))
+        self.update_streak(date)
+        
+        if update_degree:
+            self.refresh_degree()
+    
+    @staticmethod
+    def week_start(value) -> str:
+        """
+        Segunda-feira (ISO-8601) da semana do dia informado
+        """
+        day = to_day(value)
+        return (day - timedelta(days=day.weekday())).isoformat()
+    
+    def update_streak(self, value) -> None:
+        """
+        Atualiza a sequência de semanas com presença. Presenças lançadas em
+        semanas anteriores à última não mexem na sequência (rebuild_streak
+        recalcula a partir do histórico).
+        """
+        week = self.week_start(value)
+        last_week = self.streak_last_week
+        if last_week and week <= last_week:
+            return
+        if last_week and self.week_start(to_day(week) - timedelta(days=7)) == last_week:
+            self.streak_weeks = int(self.streak_weeks or 0) + 1
+        else:
+            self.streak_weeks = 1
+        self.streak_last_week = week
+        self.best_streak_weeks = max(int(self.best_streak_weeks or 0), self.streak_weeks)
+    
+    def rebuild_streak(self) -> None:
+        """
+        Recalcula a sequência atual e o recorde a partir do histórico de presenças
+        """
+        self.streak_weeks = 0
+        self.best_streak_weeks = 0
+        self.streak_last_week = None
+        for week in sorted({self.week_start(day) for day in self.presences.days()}):
+            self.update_streak(week)
+    
+    def active_streak_weeks(self, today=None) -> int:
+        """
+        Sequência ainda em aberto: a última semana com presença é a atual ou a anterior
+        """
+        if not self.streak_last_week:
+            return 0
+        previous_week = self.week_start(to_day(today or datetime.now()) - timedelta(days=7))
+        return int(self.streak_weeks or 0) if self.streak_last_week >= previous_week else 0
+    
+    def streak_fields(self) -> Dict:
+        return {
+            'streak_weeks': self.streak_weeks,
+            'best_streak_weeks': self.best_streak_weeks,
+            'streak_last_week': self.streak_last_week
+        }
+    
+    def refresh_degree(self) -> bool:
+        """
+        Avança um grau se o aluno já atingiu as presenças necessárias.
+        Retorna True se o grau mudou.
+        """
+        if self.calculate_presences_for_next_degree() == 0 and self.degrees < get_rules().max_degrees:
+            self.degrees += 1
+            logger.info(f"Estudante {self.uid} avançou para o grau {self.degrees}")
+            return True
+        return False
+    
+    def presence_fields(self) -> Dict:
+        """
+        Campos alterados por uma presença (sem os campos derivados de graduação)
+        """
+        return {
+            'total_presences': self.total_presences,
+            'last_presence_date': self.last_presence_date,
+            'presence_bitmap': self.presences.to_bytes(),
+            'history_presences': firestore.DELETE_FIELD,
+            **self.streak_fields()
+        }
+    
+    def graduation_fields(self) -> Dict:
+        """
+        Campos derivados do estado de graduação
+        """
+        return {
+            'degrees': self.degrees,
+            'presences_for_next_degree': self.calculate_presences_for_next_degree(),
+            'next_belt': self.get_next_belt()
+        }
+    
+    @classmethod
+    def save_presences(cls, students: List['Student']) -> bool:
+        """
+        Grava apenas os campos de presença de vários alunos em um único commit
+        """
+        try:
+            db = get_db()
+            if db is None:
+                logger.error("Falha ao conectar com o banco de dados")
+                return False
+            
+            # O Firestore aceita no máximo 500 operações por batch
+            for start in range(0, len(students), 450):
+                batch = db.batch()
+                for student in students[start:start + 450]:
+                    batch.set(db.collection(collection_path('students')).document(student.uid), student.presence_fields(), merge=True)
+                storage_call(batch.commit)
+            single_flight.forget_collection(collection_path('students'))
+            
+            for student in students:
+                student.run_save_hooks('presence_marked')
+            
+            logger.info(f"Presenças gravadas para {len(students)} estudante(s)")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao gravar presenças em lote: {e}")
+            return False
+    
     def add_presence(self, date: datetime = None) -> bool:
         """
-        Adiciona uma presença para o estudante
+        Adiciona uma presença para o estudante. A presença é aplicada sobre o
+        documento atual e gravada com precondição (last_update_time), para não
+        sobrescrever presenças gravadas por outro processo desde a leitura.
         """
         if date is None:
             date = datetime.now()
@@ -206,19 +433,43 @@ class Student:
                 logger.error("Falha ao conectar com o banco de dados")
                 return False
             
-            # Atualizar dados do estudante
-            self.total_presences += 1
-            self.last_presence_date = date.isoformat() if isinstance(date, datetime) else date
-            self.history_presences.append(date.isoformat() if isinstance(date, datetime) else date)
+            path = collection_path('students')
+            if not write_buffer.flush_document(path, self.uid):
+                logger.error(f"Escritas pendentes do estudante {self.uid} não foram gravadas")
+                return False
             
-            # Verificar se pode avançar de grau
-            if self.calculate_presences_for_next_degree() == 0 and self.degrees < 4:
-                self.degrees += 1
-                logger.info(f"Estudante {self.uid} avançou para o grau {self.degrees}")
+            ref = db.collection(path).document(self.uid)
+            for _ in range(MAX_CONFLICT_RETRIES):
+                snapshot = storage_call(ref.get)
+                current = Student.from_dict(snapshot.to_dict()) if snapshot.exists else None
+                if current is None:
+                    logger.error(f"Estudante {self.uid} não encontrado para adicionar presença")
+                    return False
+                current.apply_presence(date)
+                fields = {**current.presence_fields(), **current.graduation_fields()}
+                try:
+                    storage_call(ref.update, fields, option=db.write_option(last_update_time=snapshot.update_time))
+                except (google_exceptions.FailedPrecondition, google_exceptions.Conflict):
+                    continue
+                break
+            else:
+                logger.error(f"Estudante {self.uid} alterado concorrentemente {MAX_CONFLICT_RETRIES} vezes; presença não gravada")
+                return False
+            single_flight.forget_collection(path)
+            
+            # Este objeto passa a refletir o documento gravado
+            self.total_presences = current.total_presences
+            self.last_presence_date = current.last_presence_date
+            self.presences = current.presences
+            self.degrees = current.degrees
+            self.streak_weeks = current.streak_weeks
+            self.best_streak_weeks = current.best_streak_weeks
+            self.streak_last_week = current.streak_last_week
+            self.marked_days.update(current.marked_days)
+            self._stored = {**current._stored, **fields}
+            self._stored.pop('history_presences', None)
             
-            # Salvar no Firestore
-            student_ref = db.collection('students').document(self.uid)
-            student_ref.set(self.to_dict(), merge=True)
+            self.run_save_hooks('presence_marked')
             
             logger.info(f"Presença adicionada para estudante {self.uid}")
             return True
@@ -246,9 +497,48 @@ class Student:
             return False
 
 
+    @classmethod
+    def register_save_hook(cls, hook: Callable) -> None:
+        """
+        Registra uma função chamada sempre que um aluno é gravado.
+        Recebe o aluno e o tipo do evento ('student_updated', 'presence_marked'
+        ou 'degree_promoted').
+        """
+        if hook not in cls._save_hooks:
+            cls._save_hooks.append(hook)
+    
+    def run_save_hooks(self, event: str) -> None:
+        """
+        Executa os hooks de gravação; falhas em um hook não afetam a gravação
+        """
+        for hook in self._save_hooks:
+            try:
+                hook(self, event)
+            except Exception as e:
+                logger.error(f"Erro no hook de gravação do estudante {self.uid}: {e}")
+    
+    def _changed_fields(self, data: Dict) -> Dict:
+        """
+        Campos de data que diferem do documento lido (todos, para alunos novos)
+        """
+        if self._stored is None:
+            return dict(data)
+        changed = {}
+        for field, value in data.items():
+            if value is firestore.DELETE_FIELD:
+                # Só remove campos que ainda existem no documento
+                if field in self._stored:
+                    changed[field] = value
+            elif field not in self._stored or self._stored[field] != value:
+                changed[field] = value
+        return changed
+    
     def save(self) -> bool:
         """
-        Salva o estudante no Firestore
+        Salva o estudante no Firestore. Grava apenas os campos alterados desde
+        a leitura (um aluno lido antes de uma presença marcada em outro
+        processo não sobrescreve os contadores) e só retorna True depois do
+        commit.
         """
         try:
             db = get_db()
@@ -256,27 +546,50 @@ class Student:
                 logger.error("Falha ao conectar com o banco de dados")
                 return False
             
-            # Salvar na coleção users
-            user_ref = db.collection('users').document(self.uid)
-            user_data = {
-                'uid': self.uid,
-                'email': self.email,
-                'role': 'aluno',
-                'name': self.name,
-                'belt': self.belt,
-                'age': self.age,
-                'address': self.address,
-                'education': self.education,
-                'degrees': self.degrees,
-                'start_date': self.start_date,
-                'photo_url': self.photo_url,
-                'extra_activities': self.extra_activities
-            }
-            user_ref.set(user_data, merge=True)
+            # Monta antes de tudo: falha para alunos lidos parcialmente
+            storage_data = self.to_storage_dict()
+            changed = self._changed_fields(storage_data)
+            
+            batch = db.batch()
+            # No modo legado a coleção users é mantida em sincronia
+            if IDENTITY_MODE != 'canonical':
+                user_data = {
+                    'uid': self.uid,
+                    'email': self.email,
+                    'role': 'aluno',
+                    'name': self.name,
+                    'belt': self.belt,
+                    'age': self.age,
+                    'address': self.address,
+                    'education': self.education,
+                    'degrees': self.degrees,
+                    'start_date': self.start_date,
+                    'photo_url': self.photo_url,
+                    'extra_activities': self.extra_activities
+                }
+                user_changed = self._changed_fields(user_data)
+                if user_changed:
+                    if not write_buffer.flush_document(collection_path('users'), self.uid):
+                        logger.error(f"Escritas pendentes do usuário {self.uid} não foram gravadas")
+                        return False
+                    batch.set(db.collection(collection_path('users')).document(self.uid), user_changed, merge=True)
             
-            # Salvar na coleção students
-            student_ref = db.collection('students').document(self.uid)
-            student_ref.set(self.to_dict(), merge=True)
+            # Salvar na coleção students (depois das escritas agrupadas pendentes do aluno)
+            if changed:
+                if not write_buffer.flush_document(collection_path('students'), self.uid):
+                    logger.error(f"Escritas pendentes do estudante {self.uid} não foram gravadas")
+                    return False
+                batch.set(db.collection(collection_path('students')).document(self.uid), changed, merge=True)
+            storage_call(batch.commit)
+            single_flight.forget_collection(collection_path('students'))
+            if IDENTITY_MODE != 'canonical':
+                single_flight.forget_collection(collection_path('users'))
+            
+            stored = {**(self._stored or {}), **changed}
+            stored.pop('history_presences', None)
+            self._stored = stored
+            
+            self.run_save_hooks('student_updated')
             
             logger.info(f"Estudante {self.uid} salvo com sucesso")
             return True
@@ -301,71 +614,136 @@ class Student:
                 
             logger.debug(f"Buscando estudante com UID: {uid}")
             
-            # Primeiro, tentar buscar na coleção 'students'
-            student_data_ref = db.collection("students").document(uid)
-            student_data_doc = student_data_ref.get()
+            # Garante que escritas pendentes deste aluno sejam lidas de volta
+            path = collection_path('students')
+            write_buffer.flush_document(path, uid)
             
-            if student_data_doc.exists:
-                logger.debug("Dados completos do aluno encontrados na coleção 'students'")
-                return cls.from_dict(student_data_doc.to_dict())
-            else:
-                logger.warning(f"Dados completos do aluno {uid} não encontrados na coleção 'students'. Tentando coleção 'users'.")
-                # Se não encontrar em 'students', tentar buscar na coleção 'users'
-                user_ref = db.collection("users").document(uid)
-                user_doc = user_ref.get()
-                
-                if user_doc.exists:
-                    user_data = user_doc.to_dict()
-                    if user_data.get("role") == "aluno":
-                        logger.debug(f"Aluno encontrado na coleção 'users', criando entrada na coleção 'students'.")
-                        # Criar dados básicos na coleção students se não existir
-                        basic_student_data = {
-                            'uid': uid,
-                            'name': user_data.get('name', ''),
-                            'email': user_data.get('email', ''),
-                            'belt': user_data.get('belt', 'branca'),
-                            'age': user_data.get('age', 0),
-                            'address': user_data.get('address', ''),
-                            'education': user_data.get('education', ''),
-                            'degrees': user_data.get('degrees', 0),
-                            'start_date': user_data.get('start_date', datetime.now().strftime("%Y-%m-%d")),
-                            'photo_url': user_data.get('photo_url', ''),
-                            'extra_activities': user_data.get('extra_activities', 0),
-                            'total_presences': 0,
-                            'last_presence_date': None,
-                            'history_presences': []
-                        }
-                        student_data_ref.set(basic_student_data)
-                        return cls.from_dict(basic_student_data)
-                    else:
-                        logger.debug(f"Usuário {uid} na coleção 'users' não é um aluno (role: {user_data.get('role')}).")
-                else:
-                    logger.debug(f"Documento para UID {uid} NÃO encontrado em nenhuma coleção.")
-            return None
+            # Leituras simultâneas do mesmo aluno compartilham uma única chamada
+            data = single_flight.do(('student', path, uid), lambda: cls._fetch_student_data(db, uid))
+            return cls.from_dict(data) if data else None
         except Exception as e:
             logger.error(f"Erro ao buscar estudante com UID {uid}: {e}")
             return None
     
     @classmethod
-    def get_all(cls) -> List['Student']:
+    def get_many(cls, uids: Iterable[str]) -> Dict[str, 'Student']:
+        """
+        Busca vários estudantes com leituras em lote (get_all), sem o fallback
+        em 'users'. Retorna {uid: Student} apenas para os encontrados.
+        """
+        db = get_db()
+        path = collection_path('students')
+        uids = list(dict.fromkeys(uids))
+        for uid in uids:
+            write_buffer.flush_document(path, uid)
+        
+        students = {}
+        for start in range(0, len(uids), MAX_READ_CHUNK):
+            refs = [db.collection(path).document(uid) for uid in uids[start:start + MAX_READ_CHUNK]]
+            docs = storage_call(lambda **kwargs: list(db.get_all(refs, **kwargs)))
+            for doc in docs:
+                student = cls.from_dict(doc.to_dict()) if doc.exists else None
+                if student:
+                    students[doc.id] = student
+        return students
+    
+    @classmethod
+    def _fetch_student_data(cls, db, uid: str) -> Optional[Dict]:
         """
-        Retorna todos os estudantes
+        Lê os dados do aluno em 'students' (com fallback em 'users' no modo legado)
+        """
+        # Primeiro, tentar buscar na coleção 'students'
+        student_data_ref = db.collection(collection_path("students")).document(uid)
+        student_data_doc = storage_call(student_data_ref.get)
+        
+        if student_data_doc.exists:
+            logger.debug("Dados completos do aluno encontrados na coleção 'students'")
+            return student_data_doc.to_dict()
+        elif IDENTITY_MODE == 'canonical':
+            # Layout canônico: sem fallback em 'users' e sem escrita na leitura
+            logger.debug(f"Documento para UID {uid} NÃO encontrado na coleção 'students'.")
+        else:
+            logger.warning(f"Dados completos do aluno {uid} não encontrados na coleção 'students'. Tentando coleção 'users'.")
+            # Se não encontrar em 'students', tentar buscar na coleção 'users'
+            user_ref = db.collection(collection_path("users")).document(uid)
+            user_doc = storage_call(user_ref.get)
+            
+            if user_doc.exists:
+                user_data = user_doc.to_dict()
+                if user_data.get("role") == "aluno":
+                    logger.debug(f"Aluno encontrado na coleção 'users', criando entrada na coleção 'students'.")
+                    # Criar dados básicos na coleção students se não existir
+                    basic_student_data = {
+                        'uid': uid,
+                        'name': user_data.get('name', ''),
+                        'email': user_data.get('email', ''),
+                        'belt': user_data.get('belt', 'branca'),
+                        'age': user_data.get('age', 0),
+                        'address': user_data.get('address', ''),
+                        'education': user_data.get('education', ''),
+                        'degrees': user_data.get('degrees', 0),
+                        'start_date': user_data.get('start_date', datetime.now().strftime("%Y-%m-%d")),
+                        'photo_url': user_data.get('photo_url', ''),
+                        'extra_activities': user_data.get('extra_activities', 0),
+                        'total_presences': 0,
+                        'last_presence_date': None,
+                        'history_presences': [],
+                        'schema_version': SCHEMA_VERSION
+                    }
+                    storage_call(student_data_ref.set, basic_student_data)
+                    return basic_student_data
+                else:
+                    logger.debug(f"Usuário {uid} na coleção 'users' não é um aluno (role: {user_data.get('role')}).")
+            else:
+                logger.debug(f"Documento para UID {uid} NÃO encontrado em nenhuma coleção.")
+        return None
+    
+    @classmethod
+    def iter_all(cls, page_size: int = DEFAULT_PAGE_SIZE, fields: Optional[Iterable[str]] = None,
+                 tenant: Optional[str] = None) -> Iterator['Student']:
+        """
+        Percorre o cadastro página por página (cursor por ID), com memória
+        constante. Com fields, lê apenas os campos necessários para montar
+        esses campos da API (sem o histórico, se não for pedido).
+        """
+        path = collection_path('students', tenant)
+        mask = cls.storage_fields(fields)
+        for data in cls._iter_documents(path, mask, page_size):
+            student = cls.from_dict(data)
+            if student:
+                student._field_mask = mask
+                yield student
+    
+    @staticmethod
+    def _iter_documents(path: str, mask: Optional[tuple], page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[Dict]:
+        """
+        Percorre os documentos brutos do cadastro (depois de gravar as escritas pendentes)
+        """
+        write_buffer.flush(path)
+        query = get_db().collection(path).order_by('__name__')
+        if mask is not None:
+            query = query.select(mask)
+        for doc in paginate_query(query, page_size):
+            yield doc.to_dict()
+    
+    @classmethod
+    def get_all(cls, fields: Optional[Iterable[str]] = None) -> List['Student']:
+        """
+        Retorna todos os estudantes (prefira iter_all em tarefas sobre o cadastro inteiro)
         """
         try:
-            db = get_db()
-            if db is None:
-                logger.error("Falha ao conectar com o banco de dados")
-                return []
-                
-            students_ref = db.collection('students')
-            docs = students_ref.stream()
+            path = collection_path('students')
+            mask = cls.storage_fields(fields)
+            # Listagens simultâneas com a mesma máscara compartilham a leitura
+            key = ('students_all', path, mask)
+            documents = single_flight.do(key, lambda: list(cls._iter_documents(path, mask)))
             
             students = []
-            for doc in docs:
-                student = cls.from_dict(doc.to_dict())
+            for data in documents:
+                student = cls.from_dict(data)
                 if student:
+                    student._field_mask = mask
                     students.append(student)
-            
             logger.info(f"Encontrados {len(students)} estudantes")
             return students
         except Exception as e:
@@ -373,12 +751,20 @@ class Student:
             return []
     
     @classmethod
-    def get_students_close_to_graduation(cls, max_presences: int = 10) -> List['Student']:
+    def get_students_close_to_graduation(cls, max_presences: int = 10,
+                                         students: Iterable['Student'] = None,
+                                         fields: Optional[Iterable[str]] = None) -> List['Student']:
         """
-        Retorna estudantes que estão próximos da graduação (10 presenças ou menos)
+        Retorna estudantes que estão próximos da graduação (10 presenças ou menos).
+        Aceita uma lista já carregada para evitar uma nova leitura do cadastro;
+        senão percorre o cadastro guardando só os selecionados, lidos com os
+        campos pedidos (fields) mais os usados no cálculo.
         """
         try:
-            students = cls.get_all()
+            if students is None:
+                if fields is not None:
+                    fields = tuple(fields) + ('presences_for_next_degree',)
+                students = cls.iter_all(fields=fields)
             close_to_graduation = []
             
             for student in students:
@@ -0,0 +1,263 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from google.api_core import exceptions as google_exceptions
+from config.firebase_config import get_db
+from models.student import Student
+from services.write_buffer import write_buffer
+from services.storage_policy import storage_call
+from services.tenancy import collection_path
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+SORTABLE_FIELDS = ('name', 'belt', 'degrees', 'total_presences', 'last_presence_date', 'start_date')
+BELT_ORDER = {'branca': 0, 'azul': 1, 'roxa': 2, 'marrom': 3, 'preta': 4}
+MAX_LIMIT = 1000
+
+# Ordem de preferência do campo de intervalo enviado ao Firestore
+# (o Firestore aceita desigualdade em apenas um campo por consulta)
+RANGE_FIELD_PRIORITY = ('degrees', 'total_presences', 'last_presence_date')
+
+# Campo ausente no documento (diferente de um campo gravado como nulo)
+_MISSING = object()
+
+def _parse_int(args, name: str) -> Optional[int]:
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} deve ser um número inteiro')
+
+def _type_rank(value) -> int:
+    """
+    Posição do tipo na ordenação do Firestore (nulo, booleano, número, texto)
+    """
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    return 4
+
+def _stored_value(student: Student, field: str):
+    """
+    Valor como está gravado no documento (sem os padrões de from_dict)
+    """
+    if student._stored is None:
+        return getattr(student, field, _MISSING)
+    return student._stored.get(field, _MISSING)
+
+def _parse_date(args, name: str) -> Optional[str]:
+    """
+    Datas de presença são gravadas como texto ISO-8601, então a comparação é textual
+    """
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    return value.replace('Z', '')
+
+class StudentQuery:
+    """
+    Filtros e ordenação do cadastro de alunos.
+
+    A parte que o Firestore consegue atender (igualdade de faixa, um campo de
+    intervalo e a ordenação) vira consulta com índice composto; o restante é
+    avaliado em memória sobre o resultado.
+
+    A avaliação em memória segue a semântica do Firestore, para que o
+    resultado não dependa de existir índice: filtros só comparam valores do
+    mesmo tipo ("3" gravado como texto não atende degrees >= 2), documentos
+    sem o campo de filtro ou de ordenação ficam de fora, tipos são ordenados
+    como no Firestore (nulo, booleano, número, texto) e textos por código
+    (maiúsculas antes de minúsculas, sem casefold).
+    """
+
+    def __init__(self, belt: str = None, degree_min: int = None, degree_max: int = None,
+                 min_presences: int = None, last_presence_after: str = None,
+                 last_presence_before: str = None, sort: str = None, limit: int = None):
+        self.belt = belt
+        self.degree_min = degree_min
+        self.degree_max = degree_max
+        self.min_presences = min_presences
+        self.last_presence_after = last_presence_after
+        self.last_presence_before = last_presence_before
+        self.sort_field, self.descending = self._parse_sort(sort)
+        self.limit = limit
+
+    @staticmethod
+    def _parse_sort(sort: Optional[str]) -> Tuple[Optional[str], bool]:
+        if not sort:
+            return None, False
+        descending = sort.startswith('-')
+        field = sort.lstrip('-')
+        if field not in SORTABLE_FIELDS:
+            raise ValueError(f"sort deve ser um de: {', '.join(SORTABLE_FIELDS)}")
+        return field, descending
+
+    @classmethod
+    def from_args(cls, args) -> 'StudentQuery':
+        """
+        Cria a consulta a partir da query string; lança ValueError se inválida
+        """
+        limit = _parse_int(args, 'limit')
+        if limit is not None:
+            limit = max(1, min(limit, MAX_LIMIT))
+        return cls(
+            belt=args.get('belt') or None,
+            degree_min=_parse_int(args, 'degree_min'),
+            degree_max=_parse_int(args, 'degree_max'),
+            min_presences=_parse_int(args, 'min_presences'),
+            last_presence_after=_parse_date(args, 'last_presence_after'),
+            last_presence_before=_parse_date(args, 'last_presence_before'),
+            sort=args.get('sort'),
+            limit=limit
+        )
+
+    def is_empty(self) -> bool:
+        return not any([
+            self.belt, self.degree_min is not None, self.degree_max is not None,
+            self.min_presences is not None, self.last_presence_after, self.last_presence_before,
+            self.sort_field, self.limit
+        ])
+
+    def _range_filters(self) -> Dict[str, List[Tuple[str, object]]]:
+        filters = {}
+        if self.degree_min is not None:
+            filters.setdefault('degrees', []).append(('>=', self.degree_min))
+        if self.degree_max is not None:
+            filters.setdefault('degrees', []).append(('<=', self.degree_max))
+        if self.min_presences is not None:
+            filters.setdefault('total_presences', []).append(('>=', self.min_presences))
+        if self.last_presence_after:
+            filters.setdefault('last_presence_date', []).append(('>', self.last_presence_after))
+        if self.last_presence_before:
+            filters.setdefault('last_presence_date', []).append(('<', self.last_presence_before))
+        return filters
+
+    def matches(self, student: Student) -> bool:
+        """
+        Avalia todos os filtros em memória
+        """
+        if self.belt and _stored_value(student, 'belt') != self.belt:
+            return False
+        # Como no order_by do Firestore, documentos sem o campo de ordenação ficam de fora
+        if self.sort_field and _stored_value(student, self.sort_field) is _MISSING:
+            return False
+        for field, conditions in self._range_filters().items():
+            value = _stored_value(student, field)
+            for op, expected in conditions:
+                # O Firestore só compara valores do mesmo tipo
+                if value is _MISSING or _type_rank(value) != _type_rank(expected):
+                    return False
+                if op == '>=' and not value >= expected:
+                    return False
+                if op == '<=' and not value <= expected:
+                    return False
+                if op == '>' and not value > expected:
+                    return False
+                if op == '<' and not value < expected:
+                    return False
+        return True
+
+    def _sort_key(self, student: Student):
+        value = _stored_value(student, self.sort_field)
+        if self.sort_field == 'belt':
+            # A ordenação por faixa segue a progressão (sempre em memória)
+            return BELT_ORDER.get(value, len(BELT_ORDER))
+        rank = _type_rank(value)
+        # Dentro do mesmo tipo a comparação é a do Python (textos por código, como no Firestore)
+        return (rank, value if rank in (1, 2, 3) else 0)
+
+    def sort(self, students: List[Student]) -> List[Student]:
+        if self.sort_field:
+            students.sort(key=self._sort_key, reverse=self.descending)
+        return students
+
+    def _build_firestore_query(self, collection) -> Tuple[object, bool]:
+        """
+        Monta a consulta do Firestore. Retorna (consulta, completa), onde
+        completa indica que filtros, ordenação e limite foram todos enviados.
+        """
+        query = collection
+        complete = True
+
+        if self.belt:
+            query = query.where('belt', '==', self.belt)
+
+        range_filters = self._range_filters()
+        range_field = None
+        if self.sort_field in range_filters:
+            range_field = self.sort_field
+        else:
+            range_field = next((field for field in RANGE_FIELD_PRIORITY if field in range_filters), None)
+
+        if range_field:
+            for op, value in range_filters[range_field]:
+                query = query.where(range_field, op, value)
+            if len(range_filters) > 1:
+                complete = False
+
+        # A primeira ordenação precisa ser no campo de intervalo
+        order_field = range_field or self.sort_field
+        if order_field:
+            direction = 'DESCENDING' if self.descending and order_field == self.sort_field else 'ASCENDING'
+            query = query.order_by(order_field, direction=direction)
+            if self.sort_field and self.sort_field != order_field:
+                complete = False
+            # A ordenação por faixa segue a progressão, não a ordem alfabética
+            if order_field == 'belt':
+                complete = False
+
+        if complete and self.limit:
+            query = query.limit(self.limit)
+
+        return query, complete
+
+    def _finish(self, students: Iterable[Student]) -> List[Student]:
+        students = self.sort([student for student in students if self.matches(student)])
+        return students[:self.limit] if self.limit else students
+
+    def _query_fields(self, fields: Optional[Iterable[str]]) -> Optional[tuple]:
+        """
+        Campos da API pedidos mais os usados nos filtros e na ordenação
+        """
+        if fields is None:
+            return None
+        needed = list(fields)
+        if self.belt:
+            needed.append('belt')
+        needed.extend(self._range_filters())
+        if self.sort_field:
+            needed.append(self.sort_field)
+        return tuple(dict.fromkeys(needed))
+
+    def execute(self, fields: Optional[Iterable[str]] = None) -> List[Student]:
+        """
+        Executa a consulta no Firestore, caindo para avaliação em memória
+        sobre o cadastro completo quando não há índice. Com fields, lê apenas
+        os campos necessários (alunos parciais, como em Student.iter_all).
+        """
+        write_buffer.flush(collection_path('students'))
+        fields = self._query_fields(fields)
+        mask = Student.storage_fields(fields)
+        try:
+            query, complete = self._build_firestore_query(get_db().collection(collection_path('students')))
+            if mask is not None:
+                query = query.select(mask)
+            docs = storage_call(query.get)
+            students = []
+            for doc in docs:
+                student = Student.from_dict(doc.to_dict())
+                if student:
+                    student._field_mask = mask
+                    students.append(student)
+            return students if complete else self._finish(students)
+        except google_exceptions.FailedPrecondition as e:
+            # Índice composto ausente: avalia tudo em memória
+            logger.warning(f"Consulta de alunos sem índice, avaliando em memória: {e}")
+            return self._finish(Student.iter_all(fields=fields))
@@ -1,5 +1,7 @@
 from typing import Dict, Optional
 from config.firebase_config import get_db
+from services.storage_policy import storage_call
+from services.tenancy import collection_path
 
 class Teacher:
     """
@@ -40,9 +42,9 @@ class Teacher:
         try:
             db = get_db()
             # ALTERAÇÃO: Salvar na coleção 'teachers'
-            teacher_ref = db.collection('teachers').document(self.uid)
+            teacher_ref = db.collection(collection_path('teachers')).document(self.uid)
             # O método self.to_dict() já formata os dados corretamente
-            teacher_ref.set(self.to_dict(), merge=True)
+            storage_call(teacher_ref.set, self.to_dict(), merge=True)
             return True
         except Exception as e:
             print(f"Erro ao salvar professor: {e}")
@@ -54,8 +56,8 @@ class Teacher:
         try:
             db = get_db()
             # ALTERAÇÃO: Procurar na coleção 'teachers' em vez de 'users'
-            teacher_ref = db.collection('teachers').document(uid)
-            doc = teacher_ref.get()
+            teacher_ref = db.collection(collection_path('teachers')).document(uid)
+            doc = storage_call(teacher_ref.get)
 
             if doc.exists:
                 # Não precisamos mais verificar o 'role' aqui
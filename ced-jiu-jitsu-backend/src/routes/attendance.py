@@ -2,14 +2,33 @@ from flask import Blueprint, request, jsonify
 from datetime import datetime
 from models.student import Student
 from models.class_session import ClassSession
-from middleware.auth import require_auth, require_teacher
+from models.attendance_mark import sync_class_sessions
+from services.tasks import schedule_graduation_refresh
+from services.serialization import serialize_class, serialize_students
+from services.checkin import (checkin_buffer, issue_token, verify_token, CheckinNotConfigured,
+                              CheckinQueueFull, InvalidCheckinToken, DEFAULT_TOKEN_MINUTES, MAX_TOKEN_MINUTES)
+from middleware.auth import require_auth, require_teacher, require_student
+from middleware.fields import student_fields
+from middleware.rate_limit import rate_limit, concurrency_limit
 
 attendance_bp = Blueprint('attendance', __name__)
 
+# Limite de aulas aceitas em uma única sincronização
+MAX_SYNC_SESSIONS = 50
+
+def _parse_sync_date(value) -> datetime:
+    """
+    Data de uma aula sincronizada, sempre com fuso (datas sem fuso usam o do
+    servidor), para que datas com e sem 'Z' possam ser comparadas
+    """
+    class_date = datetime.fromisoformat(value.replace('Z', '+00:00')) if value else datetime.now()
+    return class_date if class_date.tzinfo else class_date.astimezone()
+
 @attendance_bp.route('/mark', methods=['POST'])
 @require_auth
 @require_teacher
-def mark_attendance():
+@student_fields(mutation=True)
+def mark_attendance(fields):
     """
     Marca presença para um ou mais estudantes (apenas para professores)
     """
@@ -44,26 +63,31 @@ def mark_attendance():
             return jsonify({'error': 'Erro ao salvar aula'}), 500
         
         # Marcar presença para cada estudante
-        updated_students = []
+        students = []
         errors = []
         
         for student_uid in student_uids:
             student = Student.get_by_uid(student_uid)
             if student:
-                if student.add_presence(class_date):
-                    student_dict = student.to_dict()
-                    student_dict['presences_for_next_degree'] = student.calculate_presences_for_next_degree()
-                    updated_students.append(student_dict)
-                else:
-                    errors.append(f'Erro ao marcar presença para {student.name}')
+                student.apply_presence(class_date, update_degree=False)
+                students.append(student)
             else:
                 errors.append(f'Estudante com UID {student_uid} não encontrado')
         
+        # Grava as presenças de todos em um único commit
+        if students and not Student.save_presences(students):
+            return jsonify({'error': 'Erro ao salvar presenças'}), 500
+        
+        # O recálculo de graduação roda em segundo plano
+        job_id = schedule_graduation_refresh([student.uid for student in students])
+        updated_students = serialize_students(students, fields)
+        
         response_data = {
             'success': True,
             'message': f'Presença marcada para {len(updated_students)} estudante(s)',
             'class_id': class_session.class_id,
-            'updated_students': updated_students
+            'updated_students': updated_students,
+            'graduation_job_id': job_id
         }
         
         if errors:
@@ -74,6 +98,153 @@ def mark_attendance():
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@attendance_bp.route('/sync', methods=['POST'])
+@require_auth
+@require_teacher
+def sync_attendance():
+    """
+    Sincroniza aulas marcadas offline (apenas para professores).
+    Cada aula traz uma chave de idempotência gerada pelo cliente; reenvios
+    da mesma chave não contam a presença novamente.
+    """
+    try:
+        data = request.get_json()
+        current_user = request.current_user
+        
+        sessions_data = data.get('sessions') if data else None
+        if not isinstance(sessions_data, list) or len(sessions_data) == 0:
+            return jsonify({'error': 'Lista de aulas é obrigatória'}), 400
+        
+        if len(sessions_data) > MAX_SYNC_SESSIONS:
+            return jsonify({'error': f'Máximo de {MAX_SYNC_SESSIONS} aulas por sincronização'}), 400
+        
+        # Validar cada aula enfileirada
+        sessions = []
+        keys = set()
+        for index, session in enumerate(sessions_data):
+            key = session.get('idempotency_key')
+            if not key or not isinstance(key, str):
+                return jsonify({'error': f'Aula {index}: idempotency_key é obrigatória'}), 400
+            if key in keys:
+                return jsonify({'error': f'Aula {index}: idempotency_key repetida ({key})'}), 400
+            keys.add(key)
+            
+            student_uids = session.get('student_uids')
+            if not isinstance(student_uids, list) or len(student_uids) == 0:
+                return jsonify({'error': f'Aula {index}: lista de estudantes deve conter pelo menos um UID'}), 400
+            
+            try:
+                class_date = _parse_sync_date(session.get('date'))
+            except (AttributeError, ValueError):
+                return jsonify({'error': f'Aula {index}: data inválida'}), 400
+            
+            sessions.append({
+                'idempotency_key': key,
+                'date': class_date,
+                'student_uids': student_uids
+            })
+        
+        result = sync_class_sessions(sessions, current_user['uid'])
+        
+        # O recálculo de graduação roda em segundo plano
+        job_id = schedule_graduation_refresh(result['student_uids'])
+        
+        response_data = {
+            # Sessões com 'failed' precisam ser reenviadas
+            'success': not any(s.get('failed') for s in result['sessions']),
+            'message': f"{sum(s['applied'] for s in result['sessions'])} presença(s) aplicada(s)",
+            'sessions': result['sessions'],
+            'commits': result['commits'],
+            'graduation_job_id': job_id
+        }
+        
+        if result['errors']:
+            response_data['errors'] = result['errors']
+        
+        return jsonify(response_data), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@attendance_bp.route('/checkin/open', methods=['POST'])
+@require_auth
+@require_teacher
+def open_checkin():
+    """
+    Abre uma aula para check-in pelos próprios alunos (apenas para professores).
+    Retorna o token assinado exibido como QR code no quiosque.
+    Parâmetros opcionais: date e minutes (validade do token).
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        current_user = request.current_user
+        
+        class_date = data.get('date')
+        try:
+            class_date = datetime.fromisoformat(class_date.replace('Z', '+00:00')) if class_date else datetime.now()
+        except (AttributeError, ValueError):
+            return jsonify({'error': 'Data inválida'}), 400
+        
+        minutes = data.get('minutes', DEFAULT_TOKEN_MINUTES)
+        if not isinstance(minutes, int) or not 1 <= minutes <= MAX_TOKEN_MINUTES:
+            return jsonify({'error': f'minutes deve estar entre 1 e {MAX_TOKEN_MINUTES}'}), 400
+        
+        class_session = ClassSession(date=class_date, instructor_uid=current_user['uid'])
+        try:
+            # Gera o token antes de criar a aula: sem segredo configurado nada é gravado
+            token, expires_at = issue_token(class_session.class_id, class_date, current_user['uid'], minutes)
+        except CheckinNotConfigured as e:
+            return jsonify({'error': str(e)}), 500
+        
+        if not class_session.save():
+            return jsonify({'error': 'Erro ao salvar aula'}), 500
+        
+        return jsonify({
+            'success': True,
+            'class_id': class_session.class_id,
+            'token': token,
+            'expires_at': datetime.fromtimestamp(expires_at).isoformat()
+        }), 201
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@attendance_bp.route('/checkin', methods=['POST'])
+@require_auth
+@require_student
+def self_checkin():
+    """
+    Check-in do próprio aluno com o token da aula (QR code). O token é
+    validado sem leitura da aula e a presença é gravada em lote logo depois;
+    repetir o check-in na mesma aula não conta presença de novo.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        try:
+            class_info = verify_token(data.get('token'))
+        except InvalidCheckinToken as e:
+            return jsonify({'error': str(e)}), 400
+        except CheckinNotConfigured as e:
+            return jsonify({'error': str(e)}), 500
+        
+        try:
+            queued = checkin_buffer.submit(class_info, request.current_user['uid'])
+        except CheckinQueueFull:
+            response = jsonify({'error': 'Muitos check-ins simultâneos, tente novamente'})
+            response.headers['Retry-After'] = '2'
+            return response, 503
+        
+        return jsonify({
+            'success': True,
+            'class_id': class_info['class_id'],
+            'status': 'queued' if queued else 'duplicate',
+            'message': 'Check-in recebido' if queued else 'Check-in já registrado para esta aula'
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @attendance_bp.route('/history/<uid>', methods=['GET'])
 @require_auth
 def get_attendance_history(uid):
@@ -91,11 +262,11 @@ def get_attendance_history(uid):
             return jsonify({'error': 'Estudante não encontrado'}), 404
         
         # Parâmetros de paginação
-        limit = request.args.get('limit', 50, type=int)
-        offset = request.args.get('offset', 0, type=int)
+        limit = max(0, request.args.get('limit', 50, type=int))
+        offset = max(0, request.args.get('offset', 0, type=int))
         
-        # Obter histórico de presenças
-        history = student.history_presences[offset:offset + limit]
+        # Decodifica do bitmap só até o fim da página; o total vem do popcount
+        history = student.presences.days(offset + limit)[offset:]
         
         return jsonify({
             'success': True,
@@ -104,7 +275,7 @@ def get_attendance_history(uid):
             'total_presences': student.total_presences,
             'presences_for_next_degree': student.calculate_presences_for_next_degree(),
             'history': [date.isoformat() if hasattr(date, 'isoformat') else str(date) for date in history],
-            'has_more': len(student.history_presences) > offset + limit
+            'has_more': len(student.presences) > offset + limit
         }), 200
         
     except Exception as e:
@@ -151,6 +322,8 @@ def get_class_attendance(class_id):
 @attendance_bp.route('/classes', methods=['GET'])
 @require_auth
 @require_teacher
+@rate_limit
+@concurrency_limit('classes')
 def get_classes():
     """
     Retorna lista de aulas em um período (apenas para professores)
@@ -168,14 +341,7 @@ def get_classes():
         
         classes = ClassSession.get_by_date_range(start_date, end_date)
         
-        classes_data = []
-        for class_session in classes:
-            classes_data.append({
-                'class_id': class_session.class_id,
-                'date': class_session.date.isoformat(),
-                'instructor_uid': class_session.instructor_uid,
-                'attended_students_count': len(class_session.attended_students)
-            })
+        classes_data = [serialize_class(class_session) for class_session in classes]
         
         return jsonify({
             'success': True,
@@ -1,8 +1,10 @@
 from middleware.auth import require_auth, require_teacher
+from middleware.fields import student_fields
 from flask import Blueprint, request, jsonify
 from firebase_admin import auth
 from models.student import Student
 from models.teacher import Teacher
+from services.tenancy import assign_tenant_claim, TenantClaimConflict
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -23,7 +25,8 @@ def verify_token():
 @auth_bp.route('/register-student', methods=['POST'])
 @require_auth
 @require_teacher
-def register_student():
+@student_fields(mutation=True)
+def register_student(fields):
     """
     Permite que um professor cadastre um novo estudante no sistema
     """
@@ -52,13 +55,20 @@ def register_student():
             degrees=int(data.get('degrees', 0))
         )
 
-        
+        # A academia vai no claim do usuário (a partir do próximo token)
+        try:
+            assign_tenant_claim(student.uid)
+        except TenantClaimConflict as e:
+            return jsonify({'error': str(e)}), 409
+        except auth.UserNotFoundError:
+            return jsonify({'error': f'Usuário {student.uid} não encontrado no Firebase Auth'}), 400
+
         # Salvar no Firestore
         if student.save():
             return jsonify({
                 'success': True,
                 'message': 'Estudante registrado com sucesso',
-                'student': student.to_dict()
+                'student': student.to_dict(fields)
             }), 201
         else:
             return jsonify({'error': 'Erro ao salvar estudante'}), 500
@@ -89,6 +99,14 @@ def register_teacher():
             name=data['name'],
             email=data['email']
         )
+
+        # A academia vai no claim do usuário (a partir do próximo token)
+        try:
+            assign_tenant_claim(teacher.uid)
+        except TenantClaimConflict as e:
+            return jsonify({'error': str(e)}), 409
+        except auth.UserNotFoundError:
+            return jsonify({'error': f'Usuário {teacher.uid} não encontrado no Firebase Auth'}), 400
         
         # Salvar no Firestore
         if teacher.save():
@@ -0,0 +1,85 @@
+from flask import Blueprint, request, jsonify
+from models.student import Student
+from models.class_session import ClassSession
+from middleware.auth import require_auth, require_teacher
+from middleware.rate_limit import rate_limit, concurrency_limit
+from services.serialization import serialize_class, serialize_students
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime, timedelta
+import logging
+import os
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+dashboard_bp = Blueprint('dashboard', __name__)
+
+DEFAULT_CLASS_DAYS = 30
+MAX_CLASS_DAYS = 90
+DEFAULT_CLOSE_TO_GRADUATION = 10
+
+# Campos do aluno enviados no painel (sem histórico e apenas a miniatura da foto)
+ROSTER_FIELDS = ('uid', 'name', 'belt', 'degrees', 'total_presences',
+                 'last_presence_date', 'photo_thumbnail', 'presences_for_next_degree')
+
+# Threads compartilhadas para as leituras em paralelo (criadas sob demanda)
+_pool = ThreadPoolExecutor(max_workers=int(os.getenv('DASHBOARD_WORKERS', '4')),
+                           thread_name_prefix='dashboard')
+
+def _submit(fn, *args):
+    """
+    Executa fn em outra thread com o contexto atual (prazo do Firestore e requisição)
+    """
+    return _pool.submit(copy_context().run, fn, *args)
+
+@dashboard_bp.route('/', methods=['GET'])
+@dashboard_bp.route('', methods=['GET'])
+@require_auth
+@require_teacher
+@rate_limit
+@concurrency_limit('dashboard')
+def get_dashboard():
+    """
+    Dados do painel do professor em uma única resposta: cadastro resumido,
+    alunos próximos da graduação e aulas recentes (apenas para professores).
+    Parâmetros opcionais: class_days, max_presences.
+    """
+    try:
+        class_days = request.args.get('class_days', DEFAULT_CLASS_DAYS, type=int)
+        class_days = max(1, min(class_days, MAX_CLASS_DAYS))
+        max_presences = request.args.get('max_presences', DEFAULT_CLOSE_TO_GRADUATION, type=int)
+
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=class_days)
+
+        # Cadastro e aulas são lidos em paralelo; os alunos próximos da
+        # graduação saem do mesmo cadastro, sem outra leitura
+        students_future = _submit(Student.get_all, ROSTER_FIELDS)
+        classes_future = _submit(ClassSession.get_by_date_range, start_date, end_date)
+
+        students = students_future.result()
+        roster = serialize_students(students, ROSTER_FIELDS)
+        close_to_graduation = [
+            student.uid for student in Student.get_students_close_to_graduation(max_presences, students)
+        ]
+
+        classes = sorted(classes_future.result(), key=lambda class_session: class_session.date, reverse=True)
+        classes_data = [serialize_class(class_session) for class_session in classes]
+
+        return jsonify({
+            'success': True,
+            'generated_at': end_date.isoformat(),
+            'students': roster,
+            'close_to_graduation': close_to_graduation,
+            'classes': classes_data,
+            'counts': {
+                'students': len(roster),
+                'close_to_graduation': len(close_to_graduation),
+                'classes': len(classes_data)
+            }
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Erro ao montar painel: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
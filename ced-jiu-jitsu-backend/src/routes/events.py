@@ -0,0 +1,90 @@
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from services.events import current_bus, parse_event_id, HEARTBEAT_SECONDS, STREAM_MAX_SECONDS
+from services.serialization import dumps_bytes
+from middleware.auth import require_auth, require_teacher
+from middleware.rate_limit import rate_limit
+import logging
+import time
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+events_bp = Blueprint('events', __name__)
+
+# Intervalo de reconexão sugerido ao navegador (ms)
+RETRY_MILLISECONDS = 3000
+
+def _format_event(event_id: str, event_type: str, data) -> bytes:
+    return b'id: %s\nevent: %s\ndata: %s\n\n' % (event_id.encode(), event_type.encode(), dumps_bytes(data))
+
+def _reset_event() -> bytes:
+    # Sem ID: o cliente recarrega a lista e continua a partir dos próximos eventos
+    return b'event: reset\ndata: {}\n\n'
+
+def _event_stream(bus, last_event_id):
+    """
+    Envia os eventos perdidos (se houver), depois os novos, com heartbeats.
+    Encerra após STREAM_MAX_SECONDS; o navegador reconecta com Last-Event-ID.
+    """
+    sequence, missed, reset = bus.start(last_event_id)
+    # Posição do último evento enviado: depois de reconectar em outro worker,
+    # eventos que este worker ainda não tinha visto chegam e não se repetem
+    sent = None if reset else parse_event_id(last_event_id)
+    yield b'retry: %d\n\n' % RETRY_MILLISECONDS
+    if reset:
+        yield _reset_event()
+    for _, position, event_id, event_type, data in missed:
+        yield _format_event(event_id, event_type, data)
+        sent = position
+
+    closes_at = time.monotonic() + STREAM_MAX_SECONDS
+    while time.monotonic() < closes_at:
+        events, reset = bus.wait(sequence, min(HEARTBEAT_SECONDS, closes_at - time.monotonic()))
+        if not events:
+            # Comentário SSE: mantém a conexão viva através de proxies
+            yield b': heartbeat\n\n'
+            continue
+        if reset:
+            yield _reset_event()
+        for _, position, event_id, event_type, data in events:
+            if sent is not None and position <= sent:
+                continue
+            yield _format_event(event_id, event_type, data)
+            sent = position
+        sequence = events[-1][0]
+
+@events_bp.route('/stream', methods=['GET'])
+@require_auth
+@require_teacher
+@rate_limit
+def stream_events():
+    """
+    Stream (Server-Sent Events) de mudanças de alunos da academia: presença
+    marcada, grau promovido e cadastro atualizado (apenas para professores).
+
+    Cada evento traz um ID; na reconexão o navegador envia Last-Event-ID (ou
+    o cliente passa last_event_id) e recebe os eventos perdidos. Um evento
+    reset indica que a lista precisa ser recarregada uma vez.
+    O token vai no cabeçalho Authorization (EventSource com cabeçalhos).
+    """
+    try:
+        bus = current_bus()
+        if not bus.subscribe():
+            response = jsonify({'error': 'Limite de conexões de eventos atingido, tente novamente em instantes'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(RETRY_MILLISECONDS // 1000)
+            return response
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        response = Response(stream_with_context(_event_stream(bus, last_event_id)),
+                            mimetype='text/event-stream')
+        # Libera a vaga mesmo se o cliente desconectar antes do primeiro evento
+        response.call_on_close(bus.unsubscribe)
+        response.headers['Cache-Control'] = 'no-store'
+        # Evita que proxies segurem os eventos
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        logger.error(f"Erro ao abrir stream de eventos: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
@@ -0,0 +1,176 @@
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from datetime import datetime
+from models.pagination import DEFAULT_PAGE_SIZE
+from models.student import Student
+from models.class_session import ClassSession
+from middleware.auth import require_auth, require_teacher
+from middleware.rate_limit import rate_limit
+from services.storage_policy import deadline_scope
+from services.tenancy import current_tenant
+import csv
+import io
+import json
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+export_bp = Blueprint('export', __name__)
+
+# Colunas exportadas para o cadastro de alunos (o histórico completo fica no export de presenças)
+STUDENT_EXPORT_FIELDS = [
+    'uid', 'name', 'email', 'belt', 'degrees', 'age', 'address', 'education',
+    'start_date', 'extra_activities', 'total_presences', 'last_presence_date'
+]
+
+ATTENDANCE_EXPORT_FIELDS = ['class_id', 'date', 'instructor_uid', 'student_uid']
+# Campos lidos de cada aula
+CLASS_SOURCE_FIELDS = ('class_id', 'date', 'instructor_uid', 'attended_students')
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+def _serialize_value(value):
+    """
+    Converte datas (datetime ou timestamp do Firestore) para ISO-8601
+    """
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+def _encode_rows(rows, fields, export_format):
+    """
+    Transforma um iterador de dicionários em pedaços de texto NDJSON ou CSV.
+
+    O status HTTP já foi enviado quando a leitura falha no meio do export.
+    Em NDJSON a última linha passa a ser um registro de erro (_error,
+    truncated); em CSV, que não tem como marcar o erro, a conexão é
+    interrompida sem o fim da resposta e o cliente vê a transferência
+    incompleta em vez de um arquivo que parece completo.
+    """
+    exported = 0
+    try:
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(fields)
+            yield buffer.getvalue()
+            for row in rows:
+                buffer.seek(0)
+                buffer.truncate(0)
+                writer.writerow([_serialize_value(row.get(field, '')) for field in fields])
+                exported += 1
+                yield buffer.getvalue()
+        else:
+            for row in rows:
+                record = {field: _serialize_value(row.get(field)) for field in fields}
+                exported += 1
+                yield json.dumps(record, ensure_ascii=False) + '\n'
+    except Exception as e:
+        logger.error(f"Exportação interrompida após {exported} linha(s): {e}")
+        if export_format == 'csv':
+            raise
+        yield json.dumps({
+            '_error': f'Exportação interrompida: {str(e)}',
+            'truncated': True,
+            'rows_exported': exported
+        }, ensure_ascii=False) + '\n'
+
+def _stream_response(chunks, export_format, filename):
+    """
+    Monta a resposta em streaming para o formato pedido
+    """
+    response = Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.{export_format}'
+    # Evita que proxies segurem a resposta até o fim
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def _get_export_params():
+    """
+    Lê formato e tamanho de página da query string
+    """
+    export_format = request.args.get('format', 'ndjson').lower()
+    page_size = request.args.get('page_size', DEFAULT_PAGE_SIZE, type=int)
+    page_size = max(1, min(page_size, 1000))
+    return export_format, page_size
+
+def _student_rows(page_size, tenant):
+    """
+    Itera sobre o cadastro página por página, lendo só as colunas exportadas.
+    A academia é recebida como parâmetro porque o gerador roda depois da view.
+    Erros de leitura sobem para _encode_rows, que sinaliza o corte.
+    """
+    # O export dura mais que o prazo normal de uma requisição
+    with deadline_scope(None):
+        for student in Student.iter_all(page_size, fields=STUDENT_EXPORT_FIELDS, tenant=tenant):
+            yield student.to_dict(STUDENT_EXPORT_FIELDS)
+
+def _attendance_rows(page_size, tenant, start_date=None, end_date=None):
+    """
+    Itera sobre as aulas em ordem de data, gerando uma linha por aluno presente
+    """
+    with deadline_scope(None):
+        classes = ClassSession.iter_range(start_date, end_date, page_size,
+                                          fields=CLASS_SOURCE_FIELDS, tenant=tenant)
+        for class_session in classes:
+            for student_uid in class_session.attended_students:
+                yield {
+                    'class_id': class_session.class_id,
+                    'date': class_session.date,
+                    'instructor_uid': class_session.instructor_uid,
+                    'student_uid': student_uid
+                }
+
+@export_bp.route('/students', methods=['GET'])
+@require_auth
+@require_teacher
+@rate_limit
+def export_students():
+    """
+    Exporta o cadastro completo de alunos em NDJSON ou CSV (apenas para professores)
+    """
+    try:
+        export_format, page_size = _get_export_params()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': 'Formato inválido. Use ndjson ou csv'}), 400
+
+        chunks = _encode_rows(_student_rows(page_size, current_tenant()), STUDENT_EXPORT_FIELDS, export_format)
+        return _stream_response(chunks, export_format, 'alunos')
+
+    except Exception as e:
+        logger.error(f"Erro ao exportar alunos: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@export_bp.route('/attendance', methods=['GET'])
+@require_auth
+@require_teacher
+@rate_limit
+def export_attendance():
+    """
+    Exporta o histórico de presenças (uma linha por aluno por aula) em NDJSON ou CSV
+    (apenas para professores)
+    """
+    try:
+        export_format, page_size = _get_export_params()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': 'Formato inválido. Use ndjson ou csv'}), 400
+
+        # Intervalo de datas opcional
+        start_date_str = request.args.get('start_date')
+        end_date_str = request.args.get('end_date')
+        start_date = datetime.fromisoformat(start_date_str.replace('Z', '+00:00')) if start_date_str else None
+        end_date = datetime.fromisoformat(end_date_str.replace('Z', '+00:00')) if end_date_str else None
+
+        rows = _attendance_rows(page_size, current_tenant(), start_date, end_date)
+        chunks = _encode_rows(rows, ATTENDANCE_EXPORT_FIELDS, export_format)
+        return _stream_response(chunks, export_format, 'presencas')
+
+    except ValueError:
+        return jsonify({'error': 'Datas devem estar no formato ISO-8601'}), 400
+    except Exception as e:
+        logger.error(f"Erro ao exportar presenças: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
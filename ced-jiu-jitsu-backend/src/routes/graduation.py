@@ -0,0 +1,119 @@
+from flask import Blueprint, request, jsonify
+from models.graduation_rules import graduation_rules, RulesSaveConflict
+from middleware.auth import require_auth, require_teacher
+from services.tasks import schedule_graduation_recompute
+from services.graduation_forecast import forecast_caches, DEFAULT_WINDOW_DAYS
+from datetime import date, timedelta
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+graduation_bp = Blueprint('graduation', __name__)
+
+@graduation_bp.route('/rules', methods=['GET'])
+@require_auth
+@require_teacher
+def get_graduation_rules():
+    """
+    Retorna a tabela de graduação vigente (apenas para professores)
+    """
+    try:
+        return jsonify({
+            'success': True,
+            'rules': graduation_rules.get().to_dict()
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Erro ao buscar regras de graduação: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@graduation_bp.route('/rules', methods=['PUT'])
+@require_auth
+@require_teacher
+def update_graduation_rules():
+    """
+    Atualiza a tabela de graduação e agenda o recálculo dos campos derivados
+    dos alunos (apenas para professores)
+    """
+    try:
+        data = request.get_json()
+        current_user = request.current_user
+
+        try:
+            compiled = graduation_rules.save(data, updated_by=current_user['uid'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except RulesSaveConflict as e:
+            return jsonify({'error': str(e)}), 409
+
+        job_id = schedule_graduation_recompute(compiled.version)
+
+        return jsonify({
+            'success': True,
+            'message': f'Regras de graduação atualizadas para a versão {compiled.version}',
+            'rules': compiled.to_dict(),
+            'recompute_job_id': job_id
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Erro ao atualizar regras de graduação: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+# Maior horizonte aceito em within_days
+MAX_WITHIN_DAYS = 3650
+
+def _int_arg(name: str, default=None, minimum: int = None, maximum: int = None):
+    """
+    Parâmetro inteiro da query string; lança ValueError se inválido ou fora do intervalo
+    """
+    value = request.args.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f'{name} deve ser um número inteiro')
+    if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+        raise ValueError(f'{name} deve estar entre {minimum} e {maximum}')
+    return number
+
+@graduation_bp.route('/forecast', methods=['GET'])
+@require_auth
+@require_teacher
+def get_graduation_forecast():
+    """
+    Projeta quando cada aluno deve chegar ao próximo grau e à próxima faixa,
+    com base no ritmo recente de presenças (apenas para professores).
+    Parâmetros opcionais: window_days, belt, within_days.
+    """
+    try:
+        try:
+            window_days = _int_arg('window_days', DEFAULT_WINDOW_DAYS, 7, 365)
+            within_days = _int_arg('within_days', None, 0, MAX_WITHIN_DAYS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        belt = request.args.get('belt')
+
+        result = forecast_caches.current().get(window_days)
+        forecast = result['forecast']
+
+        if belt:
+            forecast = [item for item in forecast if item['belt'] == belt]
+        if within_days is not None:
+            limit_date = (date.today() + timedelta(days=within_days)).isoformat()
+            forecast = [item for item in forecast
+                        if item['next_degree_date'] and item['next_degree_date'] <= limit_date]
+
+        return jsonify({
+            'success': True,
+            'generated_at': result['generated_at'],
+            'rules_version': result['rules_version'],
+            'window_days': window_days,
+            'forecast': forecast,
+            'count': len(forecast)
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Erro ao calcular previsão de graduação: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
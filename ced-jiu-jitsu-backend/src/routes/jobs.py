@@ -0,0 +1,32 @@
+from flask import Blueprint, jsonify
+from services.task_executor import executor
+from services.tenancy import current_tenant, DEFAULT_TENANT
+from middleware.auth import require_auth, require_teacher
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+@require_auth
+@require_teacher
+def get_job_status(job_id):
+    """
+    Retorna o status de uma tarefa em segundo plano (apenas para professores)
+    """
+    try:
+        job = executor.get_job(job_id)
+        # Tarefas de outras academias não são visíveis
+        if not job or (job['tenant'] or DEFAULT_TENANT) != current_tenant():
+            return jsonify({'error': 'Tarefa não encontrada'}), 404
+
+        return jsonify({
+            'success': True,
+            'job': job
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Erro ao buscar tarefa {job_id}: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
@@ -0,0 +1,43 @@
+from flask import Blueprint, request, jsonify
+from services.leaderboards import get_leaderboard
+from middleware.auth import require_auth
+from middleware.rate_limit import rate_limit
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+leaderboards_bp = Blueprint('leaderboards', __name__)
+
+@leaderboards_bp.route('/<period>', methods=['GET'])
+@require_auth
+@rate_limit
+def get_period_leaderboard(period):
+    """
+    Ranking de presenças do mês ou do ano (period = month ou year), com a
+    sequência de semanas de cada aluno. Parâmetros opcionais: key (ex.:
+    2026-10 ou 2026; padrão é o período atual) e limit.
+    """
+    try:
+        try:
+            leaderboard = get_leaderboard(period, request.args.get('key'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        entries = leaderboard['entries']
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            entries = entries[:max(1, limit)]
+
+        return jsonify({
+            'success': True,
+            'period': leaderboard['period'],
+            'key': leaderboard['key'],
+            'updated_at': leaderboard['updated_at'],
+            'leaderboard': [{'position': position, **entry} for position, entry in enumerate(entries, 1)],
+            'total': len(entries)
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Erro ao buscar ranking {period}: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
@@ -0,0 +1,41 @@
+from flask import Blueprint, jsonify
+from services.write_buffer import write_buffer
+from services.task_executor import executor
+from services.storage_policy import storage_policy
+from services.single_flight import single_flight
+from services.leaderboards import leaderboard_updater
+from services.checkin import checkin_buffer
+from services.events import get_event_stats
+from middleware.auth import require_auth, require_teacher
+from middleware.rate_limit import get_rate_limit_stats
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/', methods=['GET'])
+@metrics_bp.route('', methods=['GET'])
+@require_auth
+@require_teacher
+def get_metrics():
+    """
+    Retorna as métricas internas deste worker (apenas para professores)
+    """
+    try:
+        return jsonify({
+            'success': True,
+            'write_buffer': write_buffer.stats(),
+            'task_executor': executor.stats(),
+            'storage_policy': storage_policy.stats(),
+            'rate_limits': get_rate_limit_stats(),
+            'events': get_event_stats(),
+            'single_flight': single_flight.stats(),
+            'leaderboards': leaderboard_updater.stats(),
+            'checkin': checkin_buffer.stats()
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Erro ao buscar métricas: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
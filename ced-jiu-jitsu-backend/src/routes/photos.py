@@ -0,0 +1,95 @@
+from flask import Blueprint, request, jsonify, Response
+from models.student import Student
+from middleware.auth import require_auth
+from middleware.rate_limit import rate_limit
+from services.blob_storage import get_blob_backend, IMMUTABLE_CACHE_CONTROL
+from services.photos import store_original, schedule_thumbnails, InvalidPhoto, PHOTO_MAX_BYTES
+from services.single_flight import single_flight
+from services.storage_policy import storage_call
+from services.tenancy import collection_path
+from services.write_buffer import write_buffer
+from config.firebase_config import get_db
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+photos_bp = Blueprint('photos', __name__)
+
+@photos_bp.route('/students/<student_uid>', methods=['POST'])
+@require_auth
+@rate_limit
+def upload_student_photo(student_uid):
+    """
+    Recebe a foto de um aluno (campo multipart "photo"). As miniaturas são
+    geradas em segundo plano; o próprio aluno ou um professor pode enviar.
+    """
+    try:
+        current_user = request.current_user
+        if current_user['role'] != 'professor' and current_user['uid'] != student_uid:
+            return jsonify({'error': 'Acesso negado'}), 403
+
+        if request.content_length and request.content_length > PHOTO_MAX_BYTES + 64 * 1024:
+            return jsonify({'error': 'Arquivo muito grande'}), 413
+
+        upload = request.files.get('photo')
+        if upload is None:
+            return jsonify({'error': 'Campo photo é obrigatório'}), 400
+
+        student = Student.get_by_uid(student_uid)
+        if not student:
+            return jsonify({'error': 'Estudante não encontrado'}), 404
+
+        try:
+            photo = store_original(student_uid, upload.read(PHOTO_MAX_BYTES + 1))
+        except InvalidPhoto as e:
+            return jsonify({'error': str(e)}), 400
+
+        previous_variants = set(student.photo_variants)
+        student.photo_url = photo['original']
+        student.photo_variants = {'digest': photo['digest'], 'original': photo['original']}
+        if not student.save():
+            return jsonify({'error': 'Erro ao salvar foto'}), 500
+
+        # O save grava com merge, que mescla mapas: as miniaturas da foto
+        # anterior continuariam no documento. update() substitui o mapa inteiro.
+        if previous_variants - set(student.photo_variants):
+            path = collection_path('students')
+            write_buffer.flush_document(path, student_uid)
+            storage_call(get_db().collection(path).document(student_uid).update,
+                         {'photo_variants': student.photo_variants})
+            single_flight.forget_collection(path)
+
+        job_id = schedule_thumbnails(student_uid, photo)
+
+        return jsonify({
+            'success': True,
+            'message': 'Foto recebida; miniaturas em processamento',
+            'photo_url': student.photo_url,
+            'photo_variants': student.photo_variants,
+            'thumbnail_job_id': job_id
+        }), 202
+
+    except Exception as e:
+        logger.error(f"Erro ao enviar foto do aluno {student_uid}: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@photos_bp.route('/<path:path>', methods=['GET'])
+def get_photo(path):
+    """
+    Serve as fotos do armazenamento configurado (disco local ou o bucket
+    privado do Cloud Storage). Os caminhos mudam a cada envio, então o
+    cache é imutável e navegadores/CDN não voltam a pedir a mesma foto.
+    """
+    try:
+        stored = get_blob_backend().get(path)
+    except Exception as e:
+        logger.error(f"Erro ao ler foto {path}: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+    if stored is None:
+        return jsonify({'error': 'Foto não encontrada'}), 404
+
+    data, content_type = stored
+    response = Response(data, mimetype=content_type)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
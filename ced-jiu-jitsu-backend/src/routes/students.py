@@ -1,6 +1,14 @@
 from flask import Blueprint, request, jsonify
+from firebase_admin import auth
 from models.student import Student
+from models.student_query import StudentQuery
 from middleware.auth import require_auth, require_teacher
+from middleware.fields import student_fields
+from middleware.rate_limit import rate_limit, concurrency_limit
+from services.tasks import schedule_graduation_refresh
+from services.search_index import student_indexes, DEFAULT_LIMIT, MAX_LIMIT
+from services.serialization import serialize_students
+from services.tenancy import assign_tenant_claim, TenantClaimConflict
 import logging
 
 # Configurar logging
@@ -10,7 +18,8 @@ students_bp = Blueprint('students', __name__)
 
 @students_bp.route('/update-profile', methods=['PUT'])
 @require_auth
-def update_profile():
+@student_fields(mutation=True)
+def update_profile(fields):
     """
     Permite que um aluno atualize suas informações pessoais
     """
@@ -38,7 +47,7 @@ def update_profile():
             return jsonify({
                 'success': True,
                 'message': 'Perfil atualizado com sucesso',
-                'student': student.to_dict()
+                'student': student.to_dict(fields)
             }), 200
         else:
             return jsonify({'error': 'Erro ao salvar alterações'}), 500
@@ -49,7 +58,8 @@ def update_profile():
 
 @students_bp.route('/profile', methods=['GET'])
 @require_auth
-def get_profile():
+@student_fields()
+def get_profile(fields):
     """
     Retorna as informações do perfil do aluno logado
     """
@@ -63,7 +73,7 @@ def get_profile():
         
         return jsonify({
             'success': True,
-            'student': student.to_dict()
+            'student': student.to_dict(fields)
         }), 200
         
     except Exception as e:
@@ -73,13 +83,27 @@ def get_profile():
 @students_bp.route('/', methods=['GET'])
 @require_auth
 @require_teacher
-def get_all_students():
+@rate_limit
+@concurrency_limit('roster')
+@student_fields()
+def get_all_students(fields):
     """
-    Retorna todos os estudantes (apenas para professores)
+    Retorna os estudantes (apenas para professores).
+    Aceita filtros opcionais: belt, degree_min, degree_max, min_presences,
+    last_presence_after, last_presence_before, sort (ex.: -total_presences), limit
+    e fields (ex.: fields=name,belt,degrees).
     """
     try:
-        students = Student.get_all()
-        students_data = [student.to_dict() for student in students]
+        try:
+            student_query = StudentQuery.from_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if student_query.is_empty():
+            students = Student.get_all(fields)
+        else:
+            students = student_query.execute(fields)
+        students_data = serialize_students(students, fields)
         
         return jsonify({
             'success': True,
@@ -90,16 +114,50 @@ def get_all_students():
         logger.error(f"Erro ao buscar estudantes: {e}")
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@students_bp.route('/search', methods=['GET'])
+@require_auth
+@require_teacher
+@rate_limit
+def search_students():
+    """
+    Busca alunos por parte do nome ou e-mail, sem diferenciar acentos
+    (apenas para professores)
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Parâmetro q é obrigatório'}), 400
+        
+        limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+        limit = max(1, min(limit, MAX_LIMIT))
+        
+        student_index = student_indexes.current()
+        student_index.ensure_built()
+        results = student_index.search(query, limit)
+        
+        return jsonify({
+            'success': True,
+            'students': results,
+            'count': len(results)
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Erro ao buscar alunos: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @students_bp.route('/close-to-graduation', methods=['GET'])
 @require_auth
 @require_teacher
-def get_students_close_to_graduation():
+@rate_limit
+@concurrency_limit('close_to_graduation')
+@student_fields()
+def get_students_close_to_graduation(fields):
     """
     Retorna estudantes próximos da graduação (apenas para professores)
     """
     try:
-        students = Student.get_students_close_to_graduation()
-        students_data = [student.to_dict() for student in students]
+        students = Student.get_students_close_to_graduation(fields=fields)
+        students_data = serialize_students(students, fields)
         
         return jsonify({
             'success': True,
@@ -114,7 +172,8 @@ def get_students_close_to_graduation():
 @students_bp.route('', methods=['POST'])
 @require_auth
 @require_teacher
-def create_student():
+@student_fields(mutation=True)
+def create_student(fields):
     """
     Cria um novo estudante (apenas para professores)
     """
@@ -141,13 +200,21 @@ def create_student():
             photo_url=data.get('photo_url', ''),
             extra_activities=int(data.get('extra_activities', 0))
         )
+
+        # A academia vai no claim do usuário (a partir do próximo token)
+        try:
+            assign_tenant_claim(student.uid)
+        except TenantClaimConflict as e:
+            return jsonify({'error': str(e)}), 409
+        except auth.UserNotFoundError:
+            return jsonify({'error': f'Usuário {student.uid} não encontrado no Firebase Auth'}), 400
         
         # Salvar estudante
         if student.save():
             return jsonify({
                 'success': True,
                 'message': 'Estudante criado com sucesso',
-                'student': student.to_dict()
+                'student': student.to_dict(fields)
             }), 201
         else:
             return jsonify({'error': 'Erro ao salvar estudante'}), 500
@@ -158,7 +225,8 @@ def create_student():
 
 @students_bp.route('/<student_uid>', methods=['PUT'])
 @require_teacher
-def update_student(student_uid):
+@student_fields(mutation=True)
+def update_student(student_uid, fields):
     """
     Atualiza um estudante (apenas para professores)
     """
@@ -197,7 +265,7 @@ def update_student(student_uid):
             return jsonify({
                 'success': True,
                 'message': 'Estudante atualizado com sucesso',
-                'student': student.to_dict()
+                'student': student.to_dict(fields)
             }), 200
         else:
             return jsonify({'error': 'Erro ao salvar alterações'}), 500
@@ -208,7 +276,8 @@ def update_student(student_uid):
 
 @students_bp.route('/<student_uid>/extra-activity', methods=['POST'])
 @require_teacher
-def add_extra_activity(student_uid):
+@student_fields(mutation=True)
+def add_extra_activity(student_uid, fields):
     """
     Adiciona uma atividade extra para um estudante (apenas para professores)
     """
@@ -219,7 +288,7 @@ def add_extra_activity(student_uid):
             return jsonify({'error': 'Estudante não encontrado'}), 404
         
         # Verificar se o aluno pode fazer atividade extra
-        if student.belt == 'preta':
+        if student.get_belt_requirements()['time_based']:
             return jsonify({'error': 'Faixa preta não utiliza atividades extras'}), 400
         
         # Adicionar atividade extra
@@ -227,7 +296,7 @@ def add_extra_activity(student_uid):
             return jsonify({
                 'success': True,
                 'message': 'Atividade extra adicionada com sucesso',
-                'student': student.to_dict()
+                'student': student.to_dict(fields)
             }), 200
         else:
             return jsonify({'error': 'Erro ao adicionar atividade extra'}), 500
@@ -238,7 +307,8 @@ def add_extra_activity(student_uid):
 
 @students_bp.route('/<student_uid>/remove-extra-activity', methods=['POST'])
 @require_teacher
-def remove_extra_activity(student_uid):
+@student_fields(mutation=True)
+def remove_extra_activity(student_uid, fields):
     """
     Remove uma atividade extra de um estudante (apenas para professores)
     """
@@ -259,7 +329,7 @@ def remove_extra_activity(student_uid):
             return jsonify({
                 'success': True,
                 'message': 'Atividade extra removida com sucesso',
-                'student': student.to_dict()
+                'student': student.to_dict(fields)
             }), 200
         else:
             return jsonify({'error': 'Erro ao remover atividade extra'}), 500
@@ -270,7 +340,8 @@ def remove_extra_activity(student_uid):
 
 @students_bp.route('/attendance', methods=['POST'])
 @require_teacher
-def mark_attendance():
+@student_fields(mutation=True)
+def mark_attendance(fields):
     """
     Marca presença para múltiplos estudantes (apenas para professores)
     """
@@ -283,27 +354,34 @@ def mark_attendance():
         student_uids = data['student_uids']
         date = data.get('date')  # Data opcional
         
-        updated_students = []
+        students = []
         errors = []
         
         for uid in student_uids:
             try:
                 student = Student.get_by_uid(uid)
                 if student:
-                    if student.add_presence(date):
-                        updated_students.append(student.to_dict())
-                    else:
-                        errors.append(f"Erro ao marcar presença para {uid}")
+                    student.apply_presence(date, update_degree=False)
+                    students.append(student)
                 else:
                     errors.append(f"Estudante {uid} não encontrado")
             except Exception as e:
                 errors.append(f"Erro ao processar {uid}: {str(e)}")
         
+        # Grava as presenças de todos em um único commit
+        if students and not Student.save_presences(students):
+            return jsonify({'error': 'Erro ao salvar presenças'}), 500
+        
+        # O recálculo de graduação roda em segundo plano
+        job_id = schedule_graduation_refresh([student.uid for student in students])
+        updated_students = serialize_students(students, fields)
+        
         return jsonify({
             'success': True,
             'message': f'Presença marcada para {len(updated_students)} estudante(s)',
             'updated_students': updated_students,
-            'errors': errors
+            'errors': errors,
+            'graduation_job_id': job_id
         }), 200
         
     except Exception as e:
@@ -348,7 +426,8 @@ def get_attendance_history(student_uid):
 
 @students_bp.route('/<student_uid>', methods=['GET'])
 @require_auth
-def get_student(student_uid):
+@student_fields()
+def get_student(student_uid, fields):
     """
     Retorna informações de um estudante específico
     """
@@ -367,7 +446,7 @@ def get_student(student_uid):
         
         return jsonify({
             'success': True,
-            'student': student.to_dict()
+            'student': student.to_dict(fields)
         }), 200
         
     except Exception as e:
@@ -379,7 +458,8 @@ def get_student(student_uid):
 @students_bp.route('/<student_uid>/set-attendance', methods=['POST'])
 @require_auth
 @require_teacher
-def set_student_attendance(student_uid):
+@student_fields(mutation=True)
+def set_student_attendance(student_uid, fields):
     """
     Permite que um professor defina manualmente o total de presenças de um aluno.
     (Apenas para professores)
@@ -399,7 +479,7 @@ def set_student_attendance(student_uid):
             return jsonify({
                 'success': True,
                 'message': f'Total de presenças de {student.name} atualizado para {new_total}.',
-                'student': student.to_dict()
+                'student': student.to_dict(fields)
             }), 200
         else:
             return jsonify({'error': 'Erro ao atualizar as presenças'}), 500
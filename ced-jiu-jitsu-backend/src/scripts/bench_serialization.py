@@ -0,0 +1,106 @@
+"""
+Compara a serialização das listagens de alunos e aulas: json da biblioteca
+padrão sobre to_dict (como o jsonify fazia antes) e o provider da API.
+
+Usa dados sintéticos; não acessa o Firestore.
+
+Uso (a partir de src/):
+    python -m scripts.bench_serialization --students 3000 --repeat 20
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from models.class_session import ClassSession
+from models.graduation_rules import graduation_rules
+from models.student import Student
+from services.serialization import dumps_bytes, orjson, serialize_class, serialize_students
+from services.tenancy import DEFAULT_TENANT
+
+BELTS = ('branca', 'azul', 'roxa', 'marrom', 'preta')
+
+def make_students(count: int, history_size: int):
+    start = datetime(2020, 1, 6)
+    students = []
+    for index in range(count):
+        student = Student(
+            uid=f'student_{index:05d}',
+            name=f'Aluno {index}',
+            email=f'aluno{index}@example.com',
+            belt=random.choice(BELTS),
+            age=random.randint(8, 60),
+            degrees=random.randint(0, 4),
+            start_date=start.strftime('%Y-%m-%d'),
+            extra_activities=random.randint(0, 2)
+        )
+        for day in sorted(random.sample(range(2000), history_size)):
+            student.apply_presence(start + timedelta(days=day), update_degree=False)
+        students.append(student)
+    return students
+
+def make_classes(count: int, students):
+    start = datetime(2024, 1, 1, 19, 0, tzinfo=timezone.utc)
+    return [
+        ClassSession(
+            class_id=f'class_{index:05d}',
+            date=start + timedelta(days=index),
+            instructor_uid='teacher',
+            attended_students=[student.uid for student in random.sample(students, 30)]
+        )
+        for index in range(count)
+    ]
+
+def measure(label: str, fn, repeat: int):
+    fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(fn())
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    median = timings[len(timings) // 2]
+    print(f'{label:<44} mediana {median:8.2f} ms   {size / 1024:8.1f} KiB')
+    return median
+
+def legacy_classes(classes):
+    return [{
+        'class_id': class_session.class_id,
+        'date': class_session.date.isoformat(),
+        'instructor_uid': class_session.instructor_uid,
+        'attended_students_count': len(class_session.attended_students)
+    } for class_session in classes]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de serialização das respostas')
+    parser.add_argument('--students', type=int, default=3000)
+    parser.add_argument('--history', type=int, default=120, help='presenças por aluno')
+    parser.add_argument('--classes', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    # Evita a consulta das regras no Firestore durante o benchmark
+    graduation_rules.for_tenant(DEFAULT_TENANT)._checked_at = time.monotonic() + 10 ** 9
+
+    random.seed(42)
+    students = make_students(args.students, args.history)
+    classes = make_classes(args.classes, students)
+    print(f'encoder: {"orjson" if orjson else "json (orjson não instalado)"}; '
+          f'{args.students} alunos, {args.history} presenças cada, {args.classes} aulas\n')
+
+    for label, fields in (('cadastro completo', None), ('cadastro sem histórico', (
+            'uid', 'name', 'belt', 'degrees', 'total_presences', 'presences_for_next_degree'))):
+        before = measure(f'{label}: json + to_dict', lambda: json.dumps(
+            {'students': [student.to_dict(fields) for student in students]}, sort_keys=True).encode(), args.repeat)
+        after = measure(f'{label}: provider da API', lambda: dumps_bytes(
+            {'students': serialize_students(students, fields)}), args.repeat)
+        print(f'{"":<44} {before / after:.1f}x mais rápido\n')
+
+    before = measure('aulas: json', lambda: json.dumps(
+        {'classes': legacy_classes(classes)}, sort_keys=True).encode(), args.repeat)
+    after = measure('aulas: provider da API', lambda: dumps_bytes(
+        {'classes': [serialize_class(class_session) for class_session in classes]}), args.repeat)
+    print(f'{"":<44} {before / after:.1f}x mais rápido')
+
+if __name__ == '__main__':
+    main()
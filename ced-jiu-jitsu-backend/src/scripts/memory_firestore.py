@@ -0,0 +1,425 @@
+"""
+Substituto do Firestore em memória para o replay de carga
+(scripts.replay_traffic). Implementa só a parte da API usada pelo backend:
+documentos, consultas com where/order_by/limit/start_after/select, get_all,
+batches, transações, ArrayUnion e precondição last_update_time.
+
+Cada operação é contada por rótulo (o endpoint em execução), para o
+relatório de leituras e escritas por endpoint.
+"""
+import copy
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+from firebase_admin import firestore
+from google.api_core import exceptions as google_exceptions
+
+BACKGROUND_LABEL = '(segundo plano)'
+
+_label: ContextVar[str] = ContextVar('memory_firestore_label', default=BACKGROUND_LABEL)
+
+def _normalize(value):
+    """
+    Copia o valor como o Firestore devolveria (datas sempre com fuso UTC)
+    """
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, bytearray):
+        return bytes(value)
+    return value
+
+def _order_key(value):
+    # Ordem entre tipos semelhante à do Firestore: nulo, booleano, número, data, texto, bytes
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, _normalize(value).timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    if isinstance(value, bytes):
+        return (5, value)
+    return (6, str(value))
+
+_MISSING = object()
+
+def _matches(value, op: str, expected) -> bool:
+    if value is _MISSING:
+        return False
+    if op == 'array_contains':
+        return isinstance(value, list) and expected in value
+    if op == 'in':
+        return value in expected
+    if op == 'not-in':
+        return value not in expected
+    left, right = _order_key(value), _order_key(_normalize(expected))
+    if op == '==':
+        return left == right
+    if op == '!=':
+        return left != right
+    if left[0] != right[0]:
+        # Comparações de intervalo só valem entre valores do mesmo tipo
+        return False
+    return {'<': left < right, '<=': left <= right, '>': left > right, '>=': left >= right}[op]
+
+class MemorySnapshot:
+    def __init__(self, reference: 'MemoryDocument', data: Optional[Dict], update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field: str):
+        return (self._data or {}).get(field)
+
+class MemoryDocument:
+    def __init__(self, db: 'MemoryFirestore', collection: str, doc_id: str):
+        self._db = db
+        self.collection_path = collection
+        self.id = doc_id
+        self.path = f'{collection}/{doc_id}'
+
+    def get(self, transaction=None, **kwargs) -> MemorySnapshot:
+        self._db._simulate_latency()
+        with self._db._lock:
+            self._db._count('reads')
+            snapshot = self._db._snapshot(self)
+        if transaction is not None:
+            transaction._reads[self.path] = (self, snapshot.update_time)
+        return snapshot
+
+    def set(self, data: Dict, merge: bool = False, **kwargs):
+        self._db._simulate_latency()
+        with self._db._lock:
+            self._db._count('writes')
+            self._db._apply_set(self, data, merge)
+
+    def create(self, data: Dict, **kwargs):
+        self._db._simulate_latency()
+        with self._db._lock:
+            if self.id in self._db._documents.get(self.collection_path, {}):
+                raise google_exceptions.AlreadyExists(f'Documento {self.path} já existe')
+            self._db._count('writes')
+            self._db._apply_set(self, data, False)
+
+    def update(self, fields: Dict, option=None, **kwargs):
+        self._db._simulate_latency()
+        with self._db._lock:
+            self._db._count('writes')
+            self._db._apply_update(self, fields, option)
+
+    def delete(self, **kwargs):
+        self._db._simulate_latency()
+        with self._db._lock:
+            self._db._count('writes')
+            self._db._documents.get(self.collection_path, {}).pop(self.id, None)
+
+class MemoryQuery:
+    def __init__(self, db: 'MemoryFirestore', path: str, filters=(), orders=(), limit_to=None,
+                 cursor=None, fields=None):
+        self._db = db
+        self._path = path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_to
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes) -> 'MemoryQuery':
+        state = {'filters': self._filters, 'orders': self._orders, 'limit_to': self._limit,
+                 'cursor': self._cursor, 'fields': self._fields}
+        state.update(changes)
+        return MemoryQuery(self._db, self._path, **state)
+
+    def where(self, field: str = None, op: str = None, value=None, filter=None) -> 'MemoryQuery':
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field: str, direction: str = 'ASCENDING') -> 'MemoryQuery':
+        return self._copy(orders=self._orders + ((field, direction == 'DESCENDING'),))
+
+    def limit(self, count: int) -> 'MemoryQuery':
+        return self._copy(limit_to=count)
+
+    def start_after(self, snapshot: MemorySnapshot) -> 'MemoryQuery':
+        return self._copy(cursor=snapshot)
+
+    def select(self, fields: Iterable[str]) -> 'MemoryQuery':
+        return self._copy(fields=tuple(fields))
+
+    def _sort_key(self, doc_id: str, data: Dict):
+        key = []
+        for field, descending in self._orders:
+            value = _order_key(doc_id if field == '__name__' else data.get(field))
+            key.append(_Reversed(value) if descending else value)
+        # Desempate pelo ID, como no Firestore
+        key.append(doc_id)
+        return key
+
+    def _run(self) -> List[MemorySnapshot]:
+        items = []
+        for doc_id, (data, update_time) in self._db._documents.get(self._path, {}).items():
+            if not all(_matches(doc_id if field == '__name__' else data.get(field, _MISSING), op, value)
+                       for field, op, value in self._filters):
+                continue
+            # Documentos sem o campo ordenado ficam de fora
+            if any(field != '__name__' and field not in data for field, _ in self._orders):
+                continue
+            items.append((self._sort_key(doc_id, data), doc_id, data, update_time))
+        items.sort(key=lambda item: item[0])
+
+        if self._cursor is not None:
+            cursor_data = self._cursor._data or {}
+            cursor_key = self._sort_key(self._cursor.id, cursor_data)
+            items = [item for item in items if item[0] > cursor_key]
+        if self._limit is not None:
+            items = items[:self._limit]
+
+        snapshots = []
+        for _, doc_id, data, update_time in items:
+            if self._fields is not None:
+                data = {field: data[field] for field in self._fields if field in data}
+            snapshots.append(MemorySnapshot(MemoryDocument(self._db, self._path, doc_id),
+                                            copy.deepcopy(data), update_time))
+        return snapshots
+
+    def get(self, **kwargs) -> List[MemorySnapshot]:
+        self._db._simulate_latency()
+        with self._db._lock:
+            snapshots = self._run()
+            self._db._count('queries')
+            # Uma consulta vazia é cobrada como uma leitura
+            self._db._count('reads', max(1, len(snapshots)))
+            return snapshots
+
+    def stream(self, **kwargs):
+        return iter(self.get(**kwargs))
+
+    def on_snapshot(self, callback):
+        raise NotImplementedError('Listeners não são suportados no Firestore em memória')
+
+class _Reversed:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __gt__(self, other):
+        return self.value < other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+class MemoryCollection(MemoryQuery):
+    def __init__(self, db: 'MemoryFirestore', path: str):
+        super().__init__(db, path)
+
+    def document(self, doc_id: str) -> MemoryDocument:
+        return MemoryDocument(self._db, self._path, doc_id)
+
+class MemoryBatch:
+    def __init__(self, db: 'MemoryFirestore'):
+        self._db = db
+        self._operations = []
+
+    def set(self, reference: MemoryDocument, data: Dict, merge: bool = False):
+        self._operations.append(('set', reference, data, merge))
+
+    def create(self, reference: MemoryDocument, data: Dict):
+        self._operations.append(('create', reference, data, None))
+
+    def update(self, reference: MemoryDocument, fields: Dict, option=None):
+        self._operations.append(('update', reference, fields, option))
+
+    def delete(self, reference: MemoryDocument):
+        self._operations.append(('delete', reference, None, None))
+
+    def commit(self, **kwargs):
+        self._db._simulate_latency()
+        with self._db._lock:
+            self._check_reads()
+            # Tudo ou nada: as precondições são verificadas antes de aplicar
+            for kind, reference, _, option in self._operations:
+                if kind == 'update':
+                    self._db._check_update(reference, option)
+                elif kind == 'create' and reference.id in self._db._documents.get(reference.collection_path, {}):
+                    raise google_exceptions.AlreadyExists(f'Documento {reference.path} já existe')
+            for kind, reference, data, extra in self._operations:
+                if kind == 'set':
+                    self._db._apply_set(reference, data, extra)
+                elif kind == 'create':
+                    self._db._apply_set(reference, data, False)
+                elif kind == 'update':
+                    self._db._apply_update(reference, data, None)
+                else:
+                    self._db._documents.get(reference.collection_path, {}).pop(reference.id, None)
+            self._db._count('writes', len(self._operations))
+            self._db._count('commits')
+        self._operations = []
+
+    def _check_reads(self):
+        pass
+
+class MemoryTransaction(MemoryBatch):
+    """
+    Transação otimista: no commit, se algum documento lido mudou, lança
+    Aborted e firestore.transactional executa a função de novo
+    """
+
+    def __init__(self, db: 'MemoryFirestore', max_attempts: int = 5, read_only: bool = False):
+        super().__init__(db)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+        self._reads: Dict[str, tuple] = {}
+
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+
+    @property
+    def id(self):
+        return self._id
+
+    def _begin(self, retry_id=None):
+        with self._db._lock:
+            self._id = self._db._tick()
+
+    def _clean_up(self):
+        self._operations = []
+        self._reads = {}
+        self._id = None
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _check_reads(self):
+        for reference, update_time in self._reads.values():
+            if self._db._snapshot(reference).update_time != update_time:
+                raise google_exceptions.Aborted(f'Documento {reference.path} alterado durante a transação')
+
+    def _commit(self):
+        self.commit()
+        self._clean_up()
+
+class MemoryFirestore:
+    """
+    Cliente do Firestore em memória, seguro entre threads
+    """
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        # coleção -> id -> (dados, horário da última escrita)
+        self._documents: Dict[str, Dict[str, tuple]] = {}
+        self._lock = threading.RLock()
+        self._clock = 0
+        self._operations: Dict[str, Dict[str, int]] = {}
+
+    # API usada pelo backend
+
+    def collection(self, path: str) -> MemoryCollection:
+        return MemoryCollection(self, path)
+
+    def batch(self) -> MemoryBatch:
+        return MemoryBatch(self)
+
+    def transaction(self, **kwargs) -> MemoryTransaction:
+        return MemoryTransaction(self, **kwargs)
+
+    def get_all(self, references: Iterable[MemoryDocument], **kwargs):
+        references = list(references)
+        self._simulate_latency()
+        with self._lock:
+            self._count('reads', len(references))
+            snapshots = [self._snapshot(reference) for reference in references]
+        return iter(snapshots)
+
+    def write_option(self, last_update_time=None):
+        return {'last_update_time': last_update_time}
+
+    # Contagem de operações
+
+    @contextmanager
+    def label(self, name: str):
+        token = _label.set(name)
+        try:
+            yield
+        finally:
+            _label.reset(token)
+
+    def _count(self, operation: str, amount: int = 1):
+        counters = self._operations.setdefault(_label.get(), {'reads': 0, 'writes': 0, 'queries': 0, 'commits': 0})
+        counters[operation] += amount
+
+    def operations(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return copy.deepcopy(self._operations)
+
+    def reset_operations(self):
+        with self._lock:
+            self._operations = {}
+
+    # Armazenamento
+
+    def _simulate_latency(self):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def _snapshot(self, reference: MemoryDocument) -> MemorySnapshot:
+        data, update_time = self._documents.get(reference.collection_path, {}).get(reference.id, (None, None))
+        return MemorySnapshot(reference, copy.deepcopy(data), update_time)
+
+    def _apply_set(self, reference: MemoryDocument, data: Dict, merge: bool):
+        collection = self._documents.setdefault(reference.collection_path, {})
+        current = dict(collection[reference.id][0]) if merge and reference.id in collection else {}
+        for key, value in data.items():
+            if value is firestore.DELETE_FIELD:
+                current.pop(key, None)
+            elif isinstance(value, firestore.ArrayUnion):
+                existing = list(current.get(key) or [])
+                existing.extend(item for item in _normalize(value.values) if item not in existing)
+                current[key] = existing
+            else:
+                current[key] = _normalize(copy.deepcopy(value))
+        collection[reference.id] = (current, self._tick())
+
+    def _check_update(self, reference: MemoryDocument, option):
+        collection = self._documents.get(reference.collection_path, {})
+        if reference.id not in collection:
+            raise google_exceptions.NotFound(f'Documento {reference.path} não encontrado')
+        expected = (option or {}).get('last_update_time')
+        if expected is not None and collection[reference.id][1] != expected:
+            raise google_exceptions.FailedPrecondition(f'Documento {reference.path} alterado')
+
+    def _apply_update(self, reference: MemoryDocument, fields: Dict, option):
+        self._check_update(reference, option)
+        self._apply_set(reference, fields, merge=True)
+
+    def load(self, collection: str, doc_id: str, data: Dict):
+        """
+        Carrega um documento sem contar como operação (dados iniciais)
+        """
+        with self._lock:
+            self._documents.setdefault(collection, {})[doc_id] = (_normalize(copy.deepcopy(data)), self._tick())
@@ -0,0 +1,147 @@
+"""
+Reconcilia as coleções 'users' e 'students' no layout canônico: cada aluno
+passa a ter um único documento em 'students' com todos os dados de perfil e
+o campo schema_version.
+
+Depois da migração, configure STUDENT_IDENTITY_MODE=canonical para que o
+modelo deixe de ler e gravar a coleção 'users'.
+
+Uso (a partir de src/):
+    python -m scripts.migrate_identity --dry-run
+    python -m scripts.migrate_identity
+"""
+import argparse
+import logging
+from datetime import datetime
+from config.firebase_config import get_db
+from models.pagination import paginate_query
+from models.student import SCHEMA_VERSION
+from services.storage_policy import storage_call
+from services.tenancy import collection_path, tenant_scope
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 450
+READ_CHUNK_SIZE = 300
+
+# Campos de perfil que existiam nas duas coleções e valores padrão
+PROFILE_DEFAULTS = {
+    'name': '',
+    'email': '',
+    'belt': 'branca',
+    'age': 0,
+    'address': '',
+    'education': '',
+    'degrees': 0,
+    'start_date': None,
+    'photo_url': '',
+    'extra_activities': 0
+}
+
+def canonical_update(uid, user_data, student_data):
+    """
+    Campos que faltam no documento de 'students'. Valores já presentes em
+    'students' prevalecem; conflitos são apenas registrados.
+    """
+    student_data = student_data or {}
+    update = {}
+    conflicts = []
+
+    for field, default in PROFILE_DEFAULTS.items():
+        user_value = user_data.get(field)
+        if field in student_data and student_data[field] not in (None, ''):
+            if user_value not in (None, '') and user_value != student_data[field]:
+                conflicts.append(field)
+            continue
+        value = user_value if user_value not in (None, '') else default
+        if field == 'start_date' and not value:
+            value = datetime.now().strftime("%Y-%m-%d")
+        update[field] = value
+
+    if not student_data:
+        update.update({'uid': uid, 'total_presences': 0, 'last_presence_date': None})
+    if student_data.get('schema_version') != SCHEMA_VERSION:
+        update['schema_version'] = SCHEMA_VERSION
+    return update, conflicts
+
+def _read_students(db, uids):
+    """
+    Lê os documentos de 'students' em lotes (uma chamada por lote)
+    """
+    found = {}
+    for start in range(0, len(uids), READ_CHUNK_SIZE):
+        refs = [db.collection(collection_path('students')).document(uid) for uid in uids[start:start + READ_CHUNK_SIZE]]
+        for doc in storage_call(lambda **kwargs: list(db.get_all(refs, **kwargs))):
+            if doc.exists:
+                found[doc.id] = doc.to_dict()
+    return found
+
+def migrate(dry_run: bool = False):
+    db = get_db()
+    batch = db.batch()
+    pending = 0
+    stats = {'created': 0, 'completed': 0, 'unchanged': 0, 'conflicts': 0, 'versioned': 0}
+
+    def write(ref, data):
+        nonlocal batch, pending
+        if dry_run:
+            return
+        batch.set(ref, data, merge=True)
+        pending += 1
+        if pending >= BATCH_SIZE:
+            storage_call(batch.commit)
+            batch = db.batch()
+            pending = 0
+
+    # 1. Alunos conhecidos pela coleção 'users'
+    seen = set()
+    page = []
+    query = db.collection(collection_path('users')).where('role', '==', 'aluno').order_by('__name__')
+    for doc in paginate_query(query):
+        page.append(doc)
+        if len(page) < READ_CHUNK_SIZE:
+            continue
+        _reconcile_page(db, page, stats, seen, write)
+        page = []
+    if page:
+        _reconcile_page(db, page, stats, seen, write)
+
+    # 2. Documentos de 'students' sem usuário correspondente só recebem a versão
+    for doc in paginate_query(db.collection(collection_path('students')).order_by('__name__')):
+        if doc.id in seen:
+            continue
+        if (doc.to_dict() or {}).get('schema_version') != SCHEMA_VERSION:
+            write(doc.reference, {'schema_version': SCHEMA_VERSION})
+            stats['versioned'] += 1
+
+    if pending:
+        storage_call(batch.commit)
+
+    logger.info(f"{'[simulação] ' if dry_run else ''}Migração de identidade: {stats}")
+    return stats
+
+def _reconcile_page(db, user_docs, stats, seen, write):
+    existing = _read_students(db, [doc.id for doc in user_docs])
+    for user_doc in user_docs:
+        uid = user_doc.id
+        seen.add(uid)
+        student_data = existing.get(uid)
+        update, conflicts = canonical_update(uid, user_doc.to_dict() or {}, student_data)
+
+        if conflicts:
+            stats['conflicts'] += 1
+            logger.warning(f"Aluno {uid}: valores diferentes em 'users' para {conflicts}; mantendo 'students'")
+        if not update:
+            stats['unchanged'] += 1
+            continue
+        stats['created' if student_data is None else 'completed'] += 1
+        write(db.collection(collection_path('students')).document(uid), update)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Reconcilia 'users' e 'students' no layout canônico")
+    parser.add_argument('--dry-run', action='store_true', help='apenas relata, sem gravar')
+    parser.add_argument('--tenant', help='academia (padrão: coleções de primeiro nível)')
+    args = parser.parse_args()
+    with tenant_scope(args.tenant):
+        migrate(dry_run=args.dry_run)
@@ -0,0 +1,90 @@
+"""
+Converte o histórico de presenças dos alunos (lista de datas) para o bitmap
+compacto (campo presence_bitmap).
+
+Uso (a partir de src/):
+    python -m scripts.migrate_presence_bitmap --dry-run
+    python -m scripts.migrate_presence_bitmap
+"""
+import argparse
+import logging
+from firebase_admin import firestore
+from config.firebase_config import get_db
+from models.pagination import paginate_query
+from models.presence_bitmap import PresenceBitmap, to_day
+from services.storage_policy import storage_call
+from services.tenancy import collection_path, tenant_scope
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 450
+
+def encode_history(data, invalid=None):
+    """
+    Gera o bitmap a partir do histórico antigo do documento; datas que não
+    podem ser lidas são ignoradas e acrescentadas a invalid
+    """
+    try:
+        epoch = to_day(data['start_date']) if data.get('start_date') else None
+    except ValueError:
+        epoch = None
+    return PresenceBitmap.from_iso_list(data.get('history_presences') or [], epoch, invalid)
+
+def migrate(dry_run: bool = False):
+    db = get_db()
+    batch = db.batch()
+    pending = 0
+    migrated = 0
+    skipped = 0
+    invalid_dates = 0
+    size_before = 0
+    size_after = 0
+
+    query = db.collection(collection_path('students')).order_by('__name__')
+    for doc in paginate_query(query):
+        data = doc.to_dict() or {}
+        if 'presence_bitmap' in data or not isinstance(data.get('history_presences'), list):
+            skipped += 1
+            continue
+
+        invalid = []
+        bitmap = encode_history(data, invalid)
+        if invalid:
+            invalid_dates += len(invalid)
+            logger.warning(f"Aluno {doc.id}: {len(invalid)} data(s) inválida(s) descartada(s): {invalid[:5]}")
+        if len(bitmap) != len(data['history_presences']):
+            logger.warning(f"Aluno {doc.id}: {len(data['history_presences'])} presença(s) no histórico, "
+                           f"{len(bitmap)} no bitmap")
+
+        size_before += sum(len(str(item)) + 1 for item in data['history_presences'])
+        encoded = bitmap.to_bytes()
+        size_after += len(encoded)
+        migrated += 1
+
+        if dry_run:
+            continue
+        batch.set(doc.reference, {
+            'presence_bitmap': encoded,
+            'history_presences': firestore.DELETE_FIELD
+        }, merge=True)
+        pending += 1
+        if pending >= BATCH_SIZE:
+            storage_call(batch.commit)
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        storage_call(batch.commit)
+
+    logger.info(f"{'[simulação] ' if dry_run else ''}{migrated} aluno(s) convertido(s), {skipped} ignorado(s), "
+                f"{invalid_dates} data(s) inválida(s) descartada(s); "
+                f"histórico: {size_before} bytes -> {size_after} bytes")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Converte o histórico de presenças para bitmap')
+    parser.add_argument('--dry-run', action='store_true', help='apenas calcula, sem gravar')
+    parser.add_argument('--tenant', help='academia (padrão: coleções de primeiro nível)')
+    args = parser.parse_args()
+    with tenant_scope(args.tenant):
+        migrate(dry_run=args.dry_run)
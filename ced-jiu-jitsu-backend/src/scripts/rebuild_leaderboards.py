@@ -0,0 +1,38 @@
+"""
+Reconstrói os rankings de presença (12 meses e o ano) e as sequências de
+semanas dos alunos a partir do histórico gravado. Use no backfill inicial
+e depois de correções que reduzem presenças (reconcile_students), já que as
+atualizações incrementais só somam.
+
+Uso (a partir de src/):
+    python -m scripts.rebuild_leaderboards --dry-run
+    python -m scripts.rebuild_leaderboards --year 2025
+"""
+import argparse
+import json
+import logging
+from models.pagination import DEFAULT_PAGE_SIZE
+from services.leaderboards import rebuild_leaderboards
+from services.tenancy import tenant_scope
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reconstrói os rankings de presença e as sequências dos alunos')
+    parser.add_argument('--year', type=int, help='ano reconstruído (padrão: ano atual)')
+    parser.add_argument('--dry-run', action='store_true', help='apenas relata, sem gravar')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help='documentos por página')
+    parser.add_argument('--report', help='arquivo JSON para o relatório')
+    parser.add_argument('--tenant', help='academia (padrão: coleções de primeiro nível)')
+    args = parser.parse_args()
+
+    with tenant_scope(args.tenant):
+        report = rebuild_leaderboards(year=args.year, dry_run=args.dry_run, page_size=args.page_size)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, ensure_ascii=False, indent=2, default=str)
+        logger.info(f"Relatório gravado em {args.report}")
+    else:
+        logger.info(f"Alunos por ranking: {report['boards']}")
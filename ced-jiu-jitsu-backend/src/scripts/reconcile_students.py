@@ -0,0 +1,42 @@
+"""
+Reconstrói os contadores dos alunos (total de presenças, histórico, última
+presença e grau) a partir da coleção 'classes' e corrige os documentos que
+divergirem.
+
+Rode primeiro com --dry-run e confira o relatório: alunos com presenças
+lançadas à mão (set_total_presences) ou anteriores ao registro de aulas
+terão o total reduzido. Use --keep-degrees para não mexer nos graus.
+
+Uso (a partir de src/):
+    python -m scripts.reconcile_students --dry-run --report relatorio.json
+    python -m scripts.reconcile_students
+"""
+import argparse
+import json
+import logging
+from models.pagination import DEFAULT_PAGE_SIZE
+from services.reconciliation import reconcile_students
+from services.tenancy import tenant_scope
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reconcilia os contadores dos alunos com as aulas registradas')
+    parser.add_argument('--dry-run', action='store_true', help='apenas relata, sem gravar')
+    parser.add_argument('--keep-degrees', action='store_true', help='não corrige os graus')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help='documentos por página')
+    parser.add_argument('--report', help='arquivo JSON para o relatório completo')
+    parser.add_argument('--tenant', help='academia (padrão: coleções de primeiro nível)')
+    args = parser.parse_args()
+
+    with tenant_scope(args.tenant):
+        report = reconcile_students(dry_run=args.dry_run, fix_degrees=not args.keep_degrees,
+                                    page_size=args.page_size)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, ensure_ascii=False, indent=2, default=str)
+        logger.info(f"Relatório gravado em {args.report}")
+    else:
+        logger.info(f"Campos divergentes: {report['fields']}")
@@ -0,0 +1,331 @@
+"""
+Reproduz um tráfego capturado (TRAFFIC_CAPTURE_PATH) contra uma instância
+local da API com o Firestore em memória e relata latências (p50/p90/p99) e
+operações de armazenamento por endpoint.
+
+Os alunos e professores que aparecem na captura são criados com dados
+sintéticos (determinísticos pela --seed), junto com um cadastro extra e um
+histórico de aulas. Os tokens são substituídos por identidades de replay.
+
+Limites de taxa, janela do buffer de escrita etc. seguem as variáveis de
+ambiente de sempre, então a mesma captura mede o efeito de cada ajuste.
+
+Cada worker grava a própria captura (captura.<pid>.ndjson); passar o
+caminho configurado em TRAFFIC_CAPTURE_PATH junta os arquivos de todos os
+processos e suas rotações.
+
+Uso (a partir de src/):
+    python -m scripts.replay_traffic captura.ndjson --speed 1
+    python -m scripts.replay_traffic captura.1234.ndjson captura.1234.ndjson.1 --speed 1
+    python -m scripts.replay_traffic captura.ndjson --speed 4 --storage-latency-ms 15 --report replay.json
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+REPLAY_TOKEN_PREFIX = 'replay:'
+BELTS = ('branca', 'branca', 'branca', 'azul', 'azul', 'roxa', 'marrom', 'preta')
+# Respostas que não terminam (SSE) e uploads sem corpo gravado não são reproduzidos
+SKIPPED_CONTENT_TYPES = ('text/event-stream',)
+
+def load_records(paths: List[str], limit: int = None) -> List[Dict]:
+    # Importado aqui: o módulo lê TRAFFIC_CAPTURE_PATH, que o replay desliga antes de criar o app
+    from services.traffic_capture import capture_files
+
+    files = []
+    for path in paths:
+        # Um arquivo existente é lido como está; o caminho configurado junta os arquivos por processo
+        for name in ([path] if os.path.isfile(path) else capture_files(path)):
+            if name not in files:
+                files.append(name)
+    if not files:
+        raise FileNotFoundError(f"Nenhum arquivo de captura encontrado em {', '.join(paths)}")
+
+    records = []
+    for path in files:
+        with open(path, encoding='utf-8') as capture:
+            for line in capture:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    # Arquivos de processos diferentes e rotacionados podem vir em qualquer ordem
+    records.sort(key=lambda record: record['ts'])
+    return records[:limit] if limit else records
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def _identities(records: List[Dict]) -> Dict[str, Dict[str, str]]:
+    """
+    Academia -> uid -> papel, a partir de quem fez as requisições e dos
+    alunos citados em caminhos e corpos
+    """
+    identities: Dict[str, Dict[str, str]] = {}
+    for record in records:
+        people = identities.setdefault(record.get('tenant') or '', {})
+        if record.get('uid'):
+            people[record['uid']] = record.get('role') or 'aluno'
+        for name, value in (record.get('view_args') or {}).items():
+            if name.endswith('uid') and isinstance(value, str):
+                people.setdefault(value, 'aluno')
+        body = record.get('body')
+        if isinstance(body, dict):
+            uids = list(body.get('student_uids') or [])
+            for session in body.get('sessions') or []:
+                if isinstance(session, dict):
+                    uids.extend(session.get('student_uids') or [])
+            for uid in uids:
+                if isinstance(uid, str):
+                    people.setdefault(uid, 'aluno')
+    return identities
+
+def seed(db, records: List[Dict], extra_students: int, classes: int, rng: random.Random):
+    """
+    Cria professores, alunos e aulas sintéticos no Firestore em memória
+    """
+    from models.class_session import ClassSession
+    from models.student import Student
+    from models.teacher import Teacher
+    from services.tenancy import DEFAULT_TENANT, collection_path
+
+    today = datetime.now(timezone.utc).replace(hour=19, minute=0, second=0, microsecond=0)
+    for tenant, people in sorted(_identities(records).items()):
+        tenant = tenant or DEFAULT_TENANT
+        teachers = sorted(uid for uid, role in people.items() if role == 'professor') or ['replay_teacher']
+        student_uids = sorted(uid for uid, role in people.items() if role != 'professor')
+        student_uids += [f'replay_student_{index:05d}' for index in range(extra_students)]
+
+        for uid in teachers:
+            db.load(collection_path('teachers', tenant), uid, Teacher(uid, f'Professor {uid[:6]}', '').to_dict())
+
+        students = {}
+        for uid in student_uids:
+            start = today - timedelta(days=rng.randint(classes, classes * 3))
+            students[uid] = Student(uid=uid, name=f'Aluno {uid[:8]}', email=f'{uid[:8]}@replay.local',
+                                    belt=rng.choice(BELTS), age=rng.randint(8, 60),
+                                    start_date=start.strftime('%Y-%m-%d'),
+                                    extra_activities=rng.randint(0, 1))
+
+        # Histórico de aulas (uma por dia) com presença aplicada nos alunos
+        for index in range(classes):
+            class_date = today - timedelta(days=classes - index)
+            attended = rng.sample(student_uids, min(len(student_uids), rng.randint(10, 40)))
+            class_session = ClassSession(class_id=f'replay_class_{index:05d}', date=class_date,
+                                         instructor_uid=rng.choice(teachers), attended_students=attended)
+            db.load(collection_path('classes', tenant), class_session.class_id, class_session.to_dict())
+            for uid in attended:
+                students[uid].apply_presence(class_date, update_degree=False)
+
+        # As regras padrão valem enquanto a academia não grava as suas
+        for uid, student in students.items():
+            while student.refresh_degree():
+                pass
+            db.load(collection_path('students', tenant), uid, student.to_storage_dict())
+            db.load(collection_path('users', tenant), uid, {'uid': uid, 'role': 'aluno', 'email': student.email})
+
+class Replayer:
+    def __init__(self, app, db, records: List[Dict], speed: float, workers: int):
+        self.app = app
+        self.db = db
+        self.records = records
+        self.speed = speed
+        self.workers = workers
+        self.results = []
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def label(record: Dict) -> str:
+        return f"{record['method']} {record.get('rule') or record['path']}"
+
+    def _headers(self, record: Dict) -> Dict:
+        from services.tenancy import DEFAULT_TENANT
+        headers = dict(record.get('headers') or {})
+        if record.get('uid'):
+            tenant = record.get('tenant') or DEFAULT_TENANT
+            headers['Authorization'] = f"Bearer {REPLAY_TOKEN_PREFIX}{tenant}:{record['uid']}"
+        return headers
+
+    def _send(self, record: Dict, due: float, started_at: float):
+        label = self.label(record)
+        client = self.app.test_client()
+        lag = time.perf_counter() - started_at - due
+        kwargs = {'method': record['method'], 'query_string': record.get('query') or {},
+                  'headers': self._headers(record)}
+        if record.get('body') is not None:
+            kwargs['json'] = record['body']
+
+        begin = time.perf_counter()
+        with self.db.label(label):
+            try:
+                response = client.open(record['path'], **kwargs)
+                # Consome respostas em streaming (exportações)
+                response.get_data()
+                status = response.status_code
+            except Exception as e:
+                logger.error(f"Erro no replay de {label}: {e}")
+                status = 599
+        elapsed = (time.perf_counter() - begin) * 1000
+
+        with self._lock:
+            self.results.append({
+                'label': label,
+                'latency_ms': elapsed,
+                'lag_ms': max(0.0, lag * 1000),
+                'status': status,
+                'captured_status': record.get('status')
+            })
+
+    def run(self) -> float:
+        replayable = []
+        for record in self.records:
+            if record.get('content_type') in SKIPPED_CONTENT_TYPES or record.get('body_omitted'):
+                self.skipped += 1
+            else:
+                replayable.append(record)
+        if not replayable:
+            return 0.0
+
+        first_ts = replayable[0]['ts']
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for record in replayable:
+                due = (record['ts'] - first_ts) / self.speed if self.speed > 0 else 0.0
+                wait = started_at + due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                pool.submit(self._send, record, due, started_at)
+        return time.perf_counter() - started_at
+
+def build_report(replayer: Replayer, operations: Dict, elapsed: float, args) -> Dict:
+    from scripts.memory_firestore import BACKGROUND_LABEL
+
+    endpoints = {}
+    for result in replayer.results:
+        entry = endpoints.setdefault(result['label'], {'latencies': [], 'lags': [], 'errors': 0,
+                                                       'status_mismatches': 0, 'statuses': {}})
+        entry['latencies'].append(result['latency_ms'])
+        entry['lags'].append(result['lag_ms'])
+        entry['statuses'][str(result['status'])] = entry['statuses'].get(str(result['status']), 0) + 1
+        if result['status'] >= 500:
+            entry['errors'] += 1
+        if result['captured_status'] is not None and result['status'] != result['captured_status']:
+            entry['status_mismatches'] += 1
+
+    report_endpoints = {}
+    for label, entry in sorted(endpoints.items()):
+        latencies = sorted(entry['latencies'])
+        count = len(latencies)
+        ops = operations.get(label, {})
+        report_endpoints[label] = {
+            'requests': count,
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p90_ms': round(percentile(latencies, 0.90), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'max_ms': round(latencies[-1], 2),
+            'max_dispatch_lag_ms': round(max(entry['lags']), 2),
+            'errors': entry['errors'],
+            'status_mismatches': entry['status_mismatches'],
+            'statuses': entry['statuses'],
+            'storage': ops,
+            'storage_per_request': {name: round(value / count, 2) for name, value in ops.items()}
+        }
+
+    return {
+        'speed': args.speed,
+        'requests': len(replayer.results),
+        'skipped': replayer.skipped,
+        'elapsed_seconds': round(elapsed, 3),
+        'storage_latency_ms': args.storage_latency_ms,
+        'endpoints': report_endpoints,
+        'background_storage': operations.get(BACKGROUND_LABEL, {})
+    }
+
+def print_report(report: Dict):
+    print(f"\n{report['requests']} requisição(ões) em {report['elapsed_seconds']}s "
+          f"(velocidade {report['speed']}x, {report['skipped']} ignorada(s))\n")
+    header = f"{'endpoint':<48} {'n':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'erros':>6} {'leit/req':>9} {'escr/req':>9}"
+    print(header)
+    print('-' * len(header))
+    for label, entry in report['endpoints'].items():
+        per_request = entry['storage_per_request']
+        print(f"{label[:48]:<48} {entry['requests']:>6} {entry['p50_ms']:>8.1f} {entry['p90_ms']:>8.1f} "
+              f"{entry['p99_ms']:>8.1f} {entry['errors']:>6} {per_request.get('reads', 0):>9.1f} "
+              f"{per_request.get('writes', 0):>9.1f}")
+    print(f"\nArmazenamento em segundo plano: {report['background_storage']}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay de tráfego capturado com Firestore em memória')
+    parser.add_argument('captures', nargs='+', help='arquivos NDJSON da captura (inclusive os rotacionados)')
+    parser.add_argument('--speed', type=float, default=1.0, help='1 = tempo real, 4 = 4x mais rápido, 0 = sem espera')
+    parser.add_argument('--workers', type=int, default=16, help='requisições simultâneas')
+    parser.add_argument('--students', type=int, default=200, help='alunos sintéticos além dos da captura')
+    parser.add_argument('--classes', type=int, default=120, help='aulas sintéticas no histórico')
+    parser.add_argument('--storage-latency-ms', type=float, default=0.0, help='latência simulada por chamada')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--limit', type=int, help='reproduz só as primeiras N requisições')
+    parser.add_argument('--drain-seconds', type=float, default=2.0,
+                        help='espera pelas tarefas em segundo plano antes do relatório')
+    parser.add_argument('--report', help='arquivo JSON para o relatório')
+    args = parser.parse_args()
+
+    # A configuração é lida na importação dos módulos: fila de tarefas e
+    # arquivos locais vão para um diretório temporário e a captura fica desligada
+    workdir = tempfile.mkdtemp(prefix='replay_')
+    os.environ['TASK_QUEUE_PATH'] = os.path.join(workdir, 'tasks.db')
+    os.environ['BLOB_BACKEND'] = 'local'
+    os.environ['BLOB_LOCAL_ROOT'] = os.path.join(workdir, 'blobs')
+    os.environ['TRAFFIC_CAPTURE_PATH'] = ''
+    os.environ['EVENT_SOURCE'] = 'hooks'
+
+    import firebase_admin.auth
+    import config.firebase_config as firebase_config
+    from scripts.memory_firestore import MemoryFirestore
+
+    db = MemoryFirestore(latency_seconds=args.storage_latency_ms / 1000)
+    firebase_config.db = db
+    firebase_config.initialize_firebase = lambda: None
+
+    def verify_replay_token(token, *_, **__):
+        if not token.startswith(REPLAY_TOKEN_PREFIX):
+            raise ValueError('Token de replay inválido')
+        tenant, _, uid = token[len(REPLAY_TOKEN_PREFIX):].partition(':')
+        return {'uid': uid, 'tenant': tenant}
+
+    firebase_admin.auth.verify_id_token = verify_replay_token
+
+    records = load_records(args.captures, args.limit)
+    seed(db, records, args.students, args.classes, random.Random(args.seed))
+
+    from main import app
+    from services.write_buffer import write_buffer
+
+    replayer = Replayer(app, db, records, args.speed, args.workers)
+    elapsed = replayer.run()
+
+    time.sleep(args.drain_seconds)
+    write_buffer.flush()
+
+    report = build_report(replayer, db.operations(), elapsed, args)
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, ensure_ascii=False, indent=2)
+        print(f"\nRelatório gravado em {args.report}")
+
+if __name__ == '__main__':
+    main()
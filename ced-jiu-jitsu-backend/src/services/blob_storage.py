@@ -0,0 +1,129 @@
+import abc
+import logging
+import os
+import threading
+from typing import Optional, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# 'gcs' (Cloud Storage, produção) ou 'local' (disco, desenvolvimento e testes)
+BLOB_BACKEND = os.getenv('BLOB_BACKEND', 'gcs' if os.getenv('BLOB_BUCKET') else 'local')
+BLOB_BUCKET = os.getenv('BLOB_BUCKET', '')
+DEFAULT_LOCAL_ROOT = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'blobs')
+LOCAL_ROOT = os.getenv('BLOB_LOCAL_ROOT', DEFAULT_LOCAL_ROOT)
+# Prefixo das URLs das fotos: servidas pela própria API em qualquer backend
+# (o bucket é privado, então a URL pública do Cloud Storage daria 403)
+# Origem da API nas URLs gravadas (o frontend fica em outro domínio); vazio
+# gera URLs relativas
+PHOTO_URL_PREFIX = os.getenv('PHOTO_URL_BASE', '').rstrip('/') + '/api/photos/'
+
+# Caminhos são endereçados pelo conteúdo, então podem ficar em cache para sempre
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+class BlobBackend(abc.ABC):
+    """
+    Interface dos armazenamentos de arquivos (fotos e miniaturas)
+    """
+
+    @abc.abstractmethod
+    def put(self, path: str, data: bytes, content_type: str,
+            cache_control: str = IMMUTABLE_CACHE_CONTROL) -> str:
+        """
+        Grava o arquivo e retorna a URL usada pelo frontend
+        """
+
+    @abc.abstractmethod
+    def get(self, path: str) -> Optional[Tuple[bytes, str]]:
+        """
+        Retorna (conteúdo, content type) ou None se não existir
+        """
+
+class GCSBlobBackend(BlobBackend):
+    """
+    Google Cloud Storage, usando o bucket do projeto Firebase. O bucket
+    continua privado: os arquivos são lidos com a credencial do servidor
+    e servidos pela rota /api/photos.
+    """
+
+    def __init__(self, bucket_name: str = BLOB_BUCKET):
+        self.bucket_name = bucket_name
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            from firebase_admin import storage
+            self._bucket = storage.bucket(self.bucket_name or None)
+        return self._bucket
+
+    def put(self, path, data, content_type, cache_control=IMMUTABLE_CACHE_CONTROL):
+        blob = self.bucket.blob(path)
+        blob.cache_control = cache_control
+        blob.upload_from_string(data, content_type=content_type)
+        return PHOTO_URL_PREFIX + path
+
+    def get(self, path):
+        blob = self.bucket.get_blob(path)
+        if blob is None:
+            return None
+        return blob.download_as_bytes(), blob.content_type
+
+class LocalBlobBackend(BlobBackend):
+    """
+    Arquivos em disco, servidos pela rota /api/photos
+    """
+
+    def __init__(self, root: str = LOCAL_ROOT):
+        self.root = os.path.abspath(root)
+
+    def _full_path(self, path: str) -> str:
+        full_path = os.path.abspath(os.path.join(self.root, path))
+        if not full_path.startswith(self.root + os.sep):
+            raise ValueError(f'Caminho inválido: {path}')
+        return full_path
+
+    def put(self, path, data, content_type, cache_control=IMMUTABLE_CACHE_CONTROL):
+        full_path = self._full_path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Grava em arquivo temporário para que leitores nunca vejam um arquivo pela metade
+        temp_path = f'{full_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, full_path)
+        return PHOTO_URL_PREFIX + path
+
+    def get(self, path):
+        try:
+            full_path = self._full_path(path)
+            with open(full_path, 'rb') as file:
+                data = file.read()
+        except (FileNotFoundError, ValueError):
+            return None
+        return data, _content_type_for(path)
+
+def _content_type_for(path: str) -> str:
+    extension = path.rsplit('.', 1)[-1].lower()
+    return {
+        'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'
+    }.get(extension, 'application/octet-stream')
+
+_backend: Optional[BlobBackend] = None
+
+def get_blob_backend() -> BlobBackend:
+    """
+    Backend configurado por BLOB_BACKEND
+    """
+    global _backend
+    if _backend is None:
+        _backend = GCSBlobBackend() if BLOB_BACKEND == 'gcs' else LocalBlobBackend()
+        logger.info(f"Armazenamento de arquivos: {BLOB_BACKEND}")
+    return _backend
+
+def init_blob_storage(app):
+    """
+    Recusa iniciar em produção com o backend local: o disco do servidor é
+    efêmero e as fotos sumiriam no próximo deploy
+    """
+    if os.getenv('FLASK_ENV') == 'production' and BLOB_BACKEND == 'local':
+        raise RuntimeError("BLOB_BUCKET (ou BLOB_BACKEND=gcs) precisa estar definido em produção")
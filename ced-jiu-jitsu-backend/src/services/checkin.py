@@ -0,0 +1,319 @@
+import atexit
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from config.firebase_config import get_db
+from models.attendance_mark import AttendanceMark, PresenceWriter
+from services.tasks import schedule_graduation_refresh
+from services.tenancy import current_tenant, tenant_scope
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Segredo compartilhado por todos os workers para assinar os tokens de aula
+CHECKIN_SECRET = os.getenv('CHECKIN_TOKEN_SECRET', '')
+# Validade padrão e máxima do token (minutos)
+DEFAULT_TOKEN_MINUTES = int(os.getenv('CHECKIN_TOKEN_MINUTES', '30'))
+MAX_TOKEN_MINUTES = 240
+# Janela em que os check-ins são agrupados antes do commit
+FLUSH_WINDOW_SECONDS = float(os.getenv('CHECKIN_FLUSH_SECONDS', '1.0'))
+# Check-ins que disparam o commit antes do fim da janela
+FLUSH_BATCH_SIZE = int(os.getenv('CHECKIN_FLUSH_BATCH_SIZE', '200'))
+# Máximo de check-ins aguardando commit antes de recusar novos
+MAX_PENDING = int(os.getenv('CHECKIN_MAX_PENDING', '5000'))
+# Pares (aula, aluno) lembrados para descartar check-ins repetidos sem leitura
+RECENT_SIZE = 20000
+
+TOKEN_VERSION = 1
+
+if not CHECKIN_SECRET:
+    logger.warning("CHECKIN_TOKEN_SECRET não definido; o check-in pelos alunos fica desativado")
+
+class InvalidCheckinToken(Exception):
+    """
+    Token de check-in malformado, com assinatura inválida, expirado ou de outra academia
+    """
+
+class CheckinNotConfigured(Exception):
+    """
+    Lançada quando CHECKIN_TOKEN_SECRET não está definido
+    """
+
+class CheckinQueueFull(Exception):
+    """
+    Lançada quando há check-ins demais aguardando commit
+    """
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+def _sign(payload: str) -> str:
+    # O mesmo segredo precisa valer em todos os workers e sobreviver a reinícios
+    if not CHECKIN_SECRET:
+        raise CheckinNotConfigured('Check-in indisponível: CHECKIN_TOKEN_SECRET não configurado no servidor')
+    return _b64encode(hmac.new(CHECKIN_SECRET.encode('utf-8'), payload.encode('ascii'), hashlib.sha256).digest())
+
+def issue_token(class_id: str, class_date: datetime, instructor_uid: str, minutes: int) -> Tuple[str, int]:
+    """
+    Gera o token da aula (HMAC-SHA256) para o QR code do quiosque.
+    Retorna o token e o horário de expiração (epoch em segundos).
+    """
+    expires_at = int(time.time()) + minutes * 60
+    claims = {
+        'v': TOKEN_VERSION,
+        't': current_tenant(),
+        'c': class_id,
+        'd': class_date.isoformat(),
+        'i': instructor_uid,
+        'e': expires_at
+    }
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    return f'{payload}.{_sign(payload)}', expires_at
+
+def verify_token(token: str) -> Dict:
+    """
+    Valida o token sem ler a aula no Firestore e retorna os dados da aula
+    """
+    try:
+        payload, signature = token.split('.')
+    except (AttributeError, ValueError):
+        raise InvalidCheckinToken('Token de check-in malformado')
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise InvalidCheckinToken('Assinatura do token de check-in inválida')
+
+    try:
+        claims = json.loads(_b64decode(payload))
+        class_date = datetime.fromisoformat(claims['d'])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCheckinToken('Token de check-in malformado')
+    if claims.get('v') != TOKEN_VERSION:
+        raise InvalidCheckinToken('Versão do token de check-in não suportada')
+    if claims.get('e', 0) < time.time():
+        raise InvalidCheckinToken('Token de check-in expirado')
+    if claims.get('t') != current_tenant():
+        raise InvalidCheckinToken('Token de check-in de outra academia')
+
+    return {
+        'class_id': claims['c'],
+        'date': class_date,
+        'instructor_uid': claims['i'],
+        'expires_at': claims['e']
+    }
+
+class CheckinBuffer:
+    """
+    Fila de check-ins por processo.
+
+    Cada check-in só é validado (token) e enfileirado; o commit acontece em
+    lote depois da janela ou quando a fila atinge FLUSH_BATCH_SIZE: os alunos
+    são lidos com get_all, os já registrados em attendance_marks são
+    descartados e aula, alunos e registros de deduplicação são gravados em
+    batches, cada aluno no mesmo commit dos seus registros.
+    """
+
+    def __init__(self, window_seconds: float = FLUSH_WINDOW_SECONDS, batch_size: int = FLUSH_BATCH_SIZE,
+                 max_pending: int = MAX_PENDING):
+        self.window_seconds = window_seconds
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        # (academia, aula, aluno) -> dados da aula
+        self._pending: Dict[tuple, Dict] = {}
+        self._oldest: Optional[float] = None
+        self._recent: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+        # Métricas
+        self._accepted_total = 0
+        self._duplicates_total = 0
+        self._applied_total = 0
+        self._skipped_total = 0
+        self._not_found_total = 0
+        self._commits_total = 0
+        self._conflicts_total = 0
+        self._flush_errors_total = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+
+    def _ensure_worker(self):
+        """
+        Inicia a thread de commit no processo atual (após o fork do Gunicorn)
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='checkin-buffer', daemon=True)
+        self._thread.start()
+
+    def submit(self, class_info: Dict, student_uid: str) -> bool:
+        """
+        Enfileira o check-in. Retorna False se ele já foi recebido por este worker.
+        """
+        key = (current_tenant(), class_info['class_id'], student_uid)
+        with self._lock:
+            if key in self._pending or key in self._recent:
+                self._duplicates_total += 1
+                return False
+            if len(self._pending) >= self.max_pending:
+                raise CheckinQueueFull(f'Fila de check-in cheia ({self.max_pending} pendentes)')
+            if self.window_seconds > 0:
+                self._ensure_worker()
+            self._pending[key] = class_info
+            self._oldest = self._oldest or time.monotonic()
+            self._accepted_total += 1
+            full = len(self._pending) >= self.batch_size
+
+        if self.window_seconds <= 0:
+            self.flush()
+        elif full:
+            self._wakeup.set()
+        return True
+
+    def _remember(self, keys):
+        with self._lock:
+            for key in keys:
+                self._recent[key] = True
+                self._recent.move_to_end(key)
+            while len(self._recent) > RECENT_SIZE:
+                self._recent.popitem(last=False)
+
+    def flush(self) -> None:
+        """
+        Grava imediatamente todos os check-ins pendentes
+        """
+        # Um commit por vez: evita aplicar o mesmo par em dois flushes simultâneos
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._oldest = None
+            if not pending:
+                return
+
+            started = time.perf_counter()
+            by_tenant: Dict[str, Dict[tuple, Dict]] = {}
+            for (tenant, class_id, uid), class_info in pending.items():
+                by_tenant.setdefault(tenant, {})[(class_id, uid)] = class_info
+
+            for tenant, checkins in by_tenant.items():
+                try:
+                    with tenant_scope(tenant):
+                        failed = self._apply(checkins)
+                    self._remember((tenant, class_id, uid) for class_id, uid in checkins if (class_id, uid) not in failed)
+                    if failed:
+                        with self._lock:
+                            # Alunos em conflito voltam para a fila; os demais já foram gravados
+                            for class_id, uid in failed:
+                                self._pending.setdefault((tenant, class_id, uid), checkins[(class_id, uid)])
+                            self._oldest = self._oldest or time.monotonic()
+                except Exception as e:
+                    logger.error(f"Erro ao gravar {len(checkins)} check-in(s) da academia {tenant}: {e}")
+                    with self._lock:
+                        self._flush_errors_total += 1
+                        # Volta para a fila; os registros de deduplicação evitam contagem dupla
+                        for (class_id, uid), class_info in checkins.items():
+                            self._pending.setdefault((tenant, class_id, uid), class_info)
+                        self._oldest = self._oldest or time.monotonic()
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._last_flush_ms = elapsed_ms
+                self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+
+    def _apply(self, checkins: Dict[Tuple[str, str], Dict]) -> Set[Tuple[str, str]]:
+        """
+        Aplica os check-ins de uma academia (executado no contexto dela).
+        Retorna os pares (aula, aluno) não gravados por conflito.
+        """
+        db = get_db()
+        existing = AttendanceMark.find_existing(checkins.keys())
+        pending_by_student: Dict[str, List[Tuple[str, datetime, str]]] = {}
+        for (class_id, uid), class_info in checkins.items():
+            if (class_id, uid) not in existing:
+                pending_by_student.setdefault(uid, []).append((class_id, class_info['date'], 'checkin'))
+
+        # Só os campos de presença, com precondição por aluno e registros criados
+        # com create(); a lista de presentes da aula cresce com ArrayUnion no
+        # mesmo commit de cada registro, sem ler a aula
+        writer = PresenceWriter(db, update_roster=True)
+        writer.apply(pending_by_student, existing)
+        commits = writer.commits
+
+        for student in writer.students.values():
+            student.run_save_hooks('presence_marked')
+        schedule_graduation_refresh(list(writer.students))
+
+        failed = {(class_id, uid) for uid in writer.failed for class_id, _, _ in pending_by_student[uid]}
+        applied = len(writer.applied)
+        not_found = sum(len(pending_by_student[uid]) for uid in writer.not_found)
+        skipped = len(checkins) - applied - not_found - len(failed)
+        with self._lock:
+            self._applied_total += applied
+            self._skipped_total += skipped
+            self._not_found_total += not_found
+            self._commits_total += commits
+            self._conflicts_total += writer.conflicts
+        logger.info(f"Check-in: {applied} presença(s) aplicada(s) em {commits} commit(s), "
+                    f"{skipped} repetida(s), {len(failed)} adiada(s) por conflito")
+        return failed
+
+    def _run(self):
+        """
+        Loop da thread de commit
+        """
+        interval = max(self.window_seconds / 4, 0.05)
+        while True:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            with self._lock:
+                due = self._pending and (len(self._pending) >= self.batch_size or
+                                         time.monotonic() - self._oldest >= self.window_seconds)
+            if not due:
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Erro no loop de check-in: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'window_seconds': self.window_seconds,
+                'batch_size': self.batch_size,
+                'queue_depth': len(self._pending),
+                'accepted_total': self._accepted_total,
+                'duplicates_total': self._duplicates_total,
+                'applied_total': self._applied_total,
+                'already_marked_total': self._skipped_total,
+                'not_found_total': self._not_found_total,
+                'commits_total': self._commits_total,
+                'conflicts_total': self._conflicts_total,
+                'flush_errors_total': self._flush_errors_total,
+                'last_flush_ms': round(self._last_flush_ms, 3),
+                'max_flush_ms': round(self._max_flush_ms, 3)
+            }
+
+checkin_buffer = CheckinBuffer()
+
+@atexit.register
+def _flush_on_shutdown():
+    """
+    Garante que nenhum check-in fique pendente quando o worker é encerrado
+    """
+    try:
+        checkin_buffer.flush()
+    except Exception as e:
+        logger.error(f"Erro ao gravar check-ins no desligamento: {e}")
@@ -0,0 +1,274 @@
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from config.firebase_config import get_db
+from models.student import Student
+from services.tenancy import TenantLocal, collection_path, tenant_scope
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Workers do Gunicorn (a mesma variável que o Gunicorn lê)
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+# Origem dos eventos: 'hooks' (gravações feitas por este worker) ou
+# 'firestore' (um listener da coleção students por academia, que também vê
+# as gravações dos outros workers). Com mais de um worker, 'hooks' perderia
+# os eventos gravados pelos outros, então o padrão passa a ser 'firestore'.
+EVENT_SOURCE = os.getenv('EVENT_SOURCE', 'firestore' if WEB_CONCURRENCY > 1 else 'hooks')
+# Eventos guardados para retomada com Last-Event-ID
+EVENT_HISTORY_SIZE = int(os.getenv('EVENT_HISTORY_SIZE', '1000'))
+# Intervalo entre heartbeats quando não há eventos
+HEARTBEAT_SECONDS = float(os.getenv('EVENT_HEARTBEAT_SECONDS', '15'))
+# Tempo máximo de uma conexão; o cliente reconecta e retoma pelo último ID
+STREAM_MAX_SECONDS = float(os.getenv('EVENT_STREAM_MAX_SECONDS', '300'))
+# Threads por worker (o mesmo valor passado ao Gunicorn em --threads)
+WEB_THREADS = int(os.getenv('WEB_THREADS', '16'))
+# Threads de cada worker que ficam livres para as outras rotas
+EVENT_RESERVED_THREADS = int(os.getenv('EVENT_RESERVED_THREADS', '4'))
+# Conexões de eventos simultâneas em cada worker (somando todas as academias).
+# Cada conexão ocupa uma thread, então o limite fica abaixo das threads.
+MAX_SUBSCRIBERS = int(os.getenv('EVENT_MAX_SUBSCRIBERS', str(max(1, WEB_THREADS - EVENT_RESERVED_THREADS))))
+
+EVENT_TYPES = ('presence_marked', 'degree_promoted', 'student_updated')
+# Campos do aluno enviados em cada evento
+EVENT_FIELDS = ('uid', 'name', 'belt', 'degrees', 'total_presences', 'last_presence_date',
+                'presences_for_next_degree', 'photo_thumbnail')
+
+# Vagas de conexão do worker, compartilhadas pelas academias
+_stream_slots = threading.BoundedSemaphore(MAX_SUBSCRIBERS)
+
+def _microseconds(value) -> int:
+    """
+    Instante (datetime do Firestore) em microssegundos desde a época Unix
+    """
+    return int(round(value.timestamp() * 1_000_000))
+
+def format_event_id(position: Tuple[int, str]) -> str:
+    return f'{position[0]}-{position[1]}'
+
+def parse_event_id(event_id: Optional[str]) -> Optional[Tuple[int, str]]:
+    """
+    Posição (microssegundos, desempate) de um Last-Event-ID; None se inválido
+    """
+    if not event_id:
+        return None
+    microseconds, _, tiebreak = event_id.partition('-')
+    if not microseconds.isdigit():
+        return None
+    return int(microseconds), tiebreak
+
+class EventBus:
+    """
+    Fila circular de eventos de uma academia neste worker. Todas as conexões
+    leem do mesmo buffer (uma única origem, vários leitores) e esperam novos
+    eventos numa Condition.
+
+    Os IDs têm a forma "<microssegundos>-<desempate>". No modo 'firestore' o
+    instante é o update_time do documento e o desempate é o uid, então todos
+    os workers dão o mesmo ID ao mesmo evento e o cliente retoma em qualquer
+    um deles. No modo 'hooks' o instante é o relógio do worker e o desempate
+    uma sequência local.
+
+    Abaixo do piso (_floor) o barramento não sabe o que aconteceu: o início
+    do listener, o reinício do worker ou o último evento descartado do
+    buffer. Um ID abaixo do piso pede ao cliente que recarregue a lista
+    (evento reset).
+    """
+
+    def __init__(self, history_size: int = EVENT_HISTORY_SIZE):
+        self._events = deque(maxlen=history_size)
+        # Sequência local, usada só para acordar as conexões deste worker
+        self._sequence = 0
+        self._floor = (_microseconds(datetime.now(timezone.utc)), '')
+        self._last_position = self._floor
+        self._condition = threading.Condition()
+        self._subscribers = 0
+
+        # Métricas
+        self._published_total = 0
+        self._resets_total = 0
+        self._rejected_total = 0
+
+    def raise_floor(self, position: Tuple[int, str]) -> None:
+        """
+        Marca que eventos até position podem não estar no buffer
+        """
+        with self._condition:
+            self._floor = max(self._floor, position)
+            self._last_position = max(self._last_position, self._floor)
+
+    def publish(self, event_type: str, data: Dict, position: Optional[Tuple[int, str]] = None) -> str:
+        with self._condition:
+            self._sequence += 1
+            if position is None:
+                now = _microseconds(datetime.now(timezone.utc))
+                position = (max(now, self._last_position[0]), f'{self._sequence:012d}')
+            if len(self._events) == self._events.maxlen:
+                # O evento mais antigo sai do buffer
+                self._floor = max(self._floor, self._events[0][1])
+            self._last_position = max(self._last_position, position)
+            event_id = format_event_id(position)
+            self._events.append((self._sequence, position, event_id, event_type, data))
+            self._published_total += 1
+            self._condition.notify_all()
+        return event_id
+
+    def start(self, last_event_id: Optional[str]) -> Tuple[int, List, bool]:
+        """
+        Ponto de partida de uma conexão: a sequência atual, os eventos
+        perdidos desde last_event_id e se o cliente precisa recarregar
+        """
+        position = parse_event_id(last_event_id)
+        with self._condition:
+            if not last_event_id:
+                missed, reset = [], False
+            elif position is None or position < self._floor:
+                missed, reset = [], True
+            else:
+                missed, reset = [event for event in self._events if event[1] > position], False
+            if reset:
+                self._resets_total += 1
+            return self._sequence, missed, reset
+
+    def wait(self, after: int, timeout: float) -> Tuple[List, bool]:
+        """
+        Eventos com sequência maior que after; espera até timeout se não houver.
+        Retorna (eventos, reset); reset indica que um leitor lento perdeu
+        eventos já descartados do buffer.
+        """
+        with self._condition:
+            if self._sequence <= after:
+                self._condition.wait(timeout)
+            if self._sequence <= after:
+                return [], False
+            events = [event for event in self._events if event[0] > after]
+            reset = events[0][0] > after + 1
+            if reset:
+                self._resets_total += 1
+            return events, reset
+
+    def subscribe(self) -> bool:
+        if not _stream_slots.acquire(blocking=False):
+            with self._condition:
+                self._rejected_total += 1
+            return False
+        with self._condition:
+            self._subscribers += 1
+        return True
+
+    def unsubscribe(self) -> None:
+        with self._condition:
+            if self._subscribers == 0:
+                return
+            self._subscribers -= 1
+        _stream_slots.release()
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                'floor': format_event_id(self._floor),
+                'subscribers': self._subscribers,
+                'buffered': len(self._events),
+                'published_total': self._published_total,
+                'resets_total': self._resets_total,
+                'rejected_total': self._rejected_total
+            }
+
+def student_event(student: Student, event_type: str) -> Dict:
+    """
+    Dados compactos de um evento de aluno
+    """
+    return {
+        'type': event_type,
+        'at': datetime.now().isoformat(),
+        'student': student.to_dict(EVENT_FIELDS)
+    }
+
+class StudentListener:
+    """
+    Assinatura única da coleção students de uma academia (modo 'firestore').
+    O tipo do evento é deduzido comparando com o último estado visto.
+    """
+
+    def __init__(self, tenant: str, bus: EventBus):
+        self.tenant = tenant
+        self.bus = bus
+        self._counters: Dict[str, Tuple[int, int]] = {}
+        self._initialized = False
+        self._watch = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self) -> None:
+        if self._watch is not None:
+            return
+        with self._lock:
+            if self._watch is None:
+                query = get_db().collection(collection_path('students', self.tenant))
+                self._watch = query.on_snapshot(self._on_snapshot)
+                logger.info(f"Listener de alunos iniciado para a academia {self.tenant}")
+
+    def _classify(self, uid: str, student: Student) -> str:
+        previous = self._counters.get(uid)
+        current = (int(student.total_presences), int(student.degrees))
+        self._counters[uid] = current
+        if previous is None:
+            return 'student_updated'
+        if current[1] > previous[1]:
+            return 'degree_promoted'
+        if current[0] > previous[0]:
+            return 'presence_marked'
+        return 'student_updated'
+
+    def _on_snapshot(self, snapshot, changes, read_time):
+        # Roda na thread do listener; as regras de graduação são da academia
+        with tenant_scope(self.tenant):
+            # Ordem dos IDs: update_time e depois uid (um batch grava vários
+            # documentos com o mesmo update_time)
+            changes = sorted(changes, key=lambda change: (_microseconds(change.document.update_time)
+                                                          if change.document.update_time else 0,
+                                                          change.document.id))
+            for change in changes:
+                uid = change.document.id
+                if change.type.name == 'REMOVED':
+                    self._counters.pop(uid, None)
+                    continue
+                student = Student.from_dict(change.document.to_dict() or {})
+                if student is None:
+                    continue
+                event_type = self._classify(uid, student)
+                # O primeiro snapshot só carrega o estado atual
+                if self._initialized and change.document.update_time:
+                    position = (_microseconds(change.document.update_time), uid)
+                    self.bus.publish(event_type, student_event(student, event_type), position)
+            if not self._initialized and read_time:
+                # Eventos anteriores ao início do listener não estão no buffer
+                self.bus.raise_floor((_microseconds(read_time), '\uffff'))
+            self._initialized = True
+
+# Um barramento (e no modo 'firestore' um listener) por academia
+event_buses = TenantLocal(lambda tenant: EventBus())
+student_listeners = TenantLocal(lambda tenant: StudentListener(tenant, event_buses.for_tenant(tenant)))
+
+def current_bus() -> EventBus:
+    """
+    Barramento da academia atual, iniciando o listener se configurado
+    """
+    if EVENT_SOURCE == 'firestore':
+        student_listeners.current().ensure_started()
+    return event_buses.current()
+
+def _publish_student_event(student: Student, event: str = 'student_updated'):
+    if event in EVENT_TYPES:
+        event_buses.current().publish(event, student_event(student, event))
+
+if EVENT_SOURCE == 'hooks':
+    Student.register_save_hook(_publish_student_event)
+
+def get_event_stats() -> Dict:
+    return {
+        'source': EVENT_SOURCE,
+        'tenants': {tenant: bus.stats() for tenant, bus in event_buses.items()}
+    }
@@ -0,0 +1,151 @@
+import logging
+import math
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from models.graduation_rules import get_rules
+from models.student import Student
+from services.tenancy import TenantLocal
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW_DAYS = 90
+# Campos lidos de cada aluno (o histórico vem como bitmap, sem decodificar)
+FORECAST_FIELDS = ('uid', 'name', 'belt', 'degrees', 'extra_activities', 'total_presences',
+                   'start_date', 'history_presences')
+# Limite de segurança para marcações feitas em outros workers: cada worker tem
+# o seu cache, então este é o tempo máximo de divergência entre eles
+CACHE_TTL_SECONDS = float(os.getenv('FORECAST_CACHE_TTL_SECONDS', '120'))
+
+def _iso(value) -> str:
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+def _project(presences_needed: int, rate_per_day: float, today: date) -> Optional[str]:
+    """
+    Data prevista para completar as presenças restantes no ritmo atual
+    """
+    if presences_needed <= 0:
+        return today.isoformat()
+    if rate_per_day <= 0:
+        return None
+    return (today + timedelta(days=math.ceil(presences_needed / rate_per_day))).isoformat()
+
+def build_forecast(students: Iterable[Student], window_days: int = DEFAULT_WINDOW_DAYS) -> List[Dict]:
+    """
+    Calcula a previsão de graduação do cadastro inteiro em uma única passada.
+
+    O ritmo de cada aluno é a média de presenças por dia na janela recente,
+    contada direto no bitmap de presenças (popcount), sem decodificar o histórico.
+    """
+    rules = get_rules()
+    today = date.today()
+    cutoff_day = today - timedelta(days=window_days)
+    cutoff = cutoff_day.isoformat()
+    today_iso = today.isoformat()
+
+    forecast = []
+    for student in students:
+        rule = rules.for_belt(student.belt)
+        if rule['time_based']:
+            continue
+
+        recent = student.presences.count_since(cutoff_day)
+
+        # Alunos que começaram há menos tempo que a janela usam o período real
+        observed_days = window_days
+        start_date = student.start_date if isinstance(student.start_date, str) else _iso(student.start_date)
+        if start_date and start_date[:10] > cutoff:
+            try:
+                observed_days = max(1, (today - date.fromisoformat(start_date[:10])).days)
+            except ValueError:
+                pass
+        rate_per_day = recent / observed_days
+
+        degrees = int(student.degrees)
+        extra_activities = int(student.extra_activities)
+        total_presences = int(student.total_presences)
+
+        next_step = 'degree' if degrees < rules.max_degrees else 'belt'
+        presences_for_next_degree = max(0, rules.required_presences(student.belt, degrees, extra_activities) - total_presences)
+        presences_for_next_belt = max(0, rules.required_presences(student.belt, rules.max_degrees, extra_activities) - total_presences)
+
+        forecast.append({
+            'uid': student.uid,
+            'name': student.name,
+            'belt': student.belt,
+            'degrees': degrees,
+            'next_step': next_step,
+            'next_belt': rule['next'],
+            'recent_presences': recent,
+            'presences_per_week': round(rate_per_day * 7, 2),
+            'presences_for_next_degree': presences_for_next_degree,
+            'next_degree_date': _project(presences_for_next_degree, rate_per_day, today),
+            'presences_for_next_belt': presences_for_next_belt,
+            'next_belt_date': _project(presences_for_next_belt, rate_per_day, today)
+        })
+
+    # Alunos sem previsão (sem presenças recentes) ficam no fim
+    forecast.sort(key=lambda item: (item['next_degree_date'] is None, item['next_degree_date'] or today_iso))
+    return forecast
+
+class ForecastCache:
+    """
+    Guarda a última previsão calculada até a próxima marcação de presença
+    (ou mudança nas regras de graduação)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._attendance_version = 0
+        self._rules_version = None
+        self._entries: Dict[tuple, tuple] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self, student: Student = None, event: str = None):
+        """
+        Hook de gravação de aluno: qualquer presença ou edição invalida a previsão
+        """
+        with self._lock:
+            self._attendance_version += 1
+            self._entries.clear()
+
+    def get(self, window_days: int = DEFAULT_WINDOW_DAYS) -> Dict:
+        rules_version = get_rules().version
+        key = (window_days, rules_version)
+        with self._lock:
+            if rules_version != self._rules_version:
+                # Regras novas (gravadas aqui ou em outro worker): descarta tudo
+                self._rules_version = rules_version
+                self._attendance_version += 1
+                self._entries.clear()
+            entry = self._entries.get(key)
+            version = self._attendance_version
+            if entry and entry[0] == version and time.monotonic() - entry[1] < CACHE_TTL_SECONDS:
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        result = {
+            'generated_at': datetime.now().isoformat(),
+            'window_days': window_days,
+            'rules_version': rules_version,
+            'forecast': build_forecast(Student.iter_all(fields=FORECAST_FIELDS), window_days)
+        }
+
+        with self._lock:
+            # Só guarda se nenhuma presença foi marcada durante o cálculo
+            if self._attendance_version == version:
+                self._entries[key] = (version, time.monotonic(), result)
+        return result
+
+# Uma previsão em cache por academia
+forecast_caches = TenantLocal(lambda tenant: ForecastCache())
+
+def _invalidate_forecast(student: Student = None, event: str = None):
+    forecast_caches.current().invalidate(student, event)
+
+Student.register_save_hook(_invalidate_forecast)
@@ -0,0 +1,390 @@
+import atexit
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from google.api_core import exceptions as google_exceptions
+from config.firebase_config import get_db
+from models.pagination import DEFAULT_PAGE_SIZE
+from models.presence_bitmap import to_day
+from models.student import Student
+from services.single_flight import single_flight
+from services.storage_policy import storage_call
+from services.tenancy import collection_path, current_tenant
+from services.write_buffer import write_buffer
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+LEADERBOARDS_COLLECTION = 'leaderboards'
+PERIODS = ('month', 'year')
+# Alunos mantidos em cada ranking
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', '50'))
+# Janela em que as presenças são agrupadas antes de gravar os rankings.
+# Com 0 cada presença atualiza os rankings na própria requisição.
+FLUSH_WINDOW_SECONDS = float(os.getenv('LEADERBOARD_FLUSH_SECONDS', '1.0'))
+# Tentativas quando outro worker grava o mesmo ranking ao mesmo tempo
+MAX_CONFLICT_RETRIES = 5
+# Validade do último colocado conhecido: uma reconstrução feita em outro
+# processo pode baixar o mínimo, e até lá candidatos válidos seriam descartados
+KNOWN_TTL_SECONDS = float(os.getenv('LEADERBOARD_KNOWN_TTL_SECONDS', '60'))
+# Campos lidos de cada aluno na reconstrução
+REBUILD_FIELDS = ('uid', 'name', 'belt', 'degrees', 'history_presences',
+                  'streak_weeks', 'best_streak_weeks', 'streak_last_week')
+
+_PERIOD_KEYS = {'month': re.compile(r'^\d{4}-(0[1-9]|1[0-2])$'), 'year': re.compile(r'^\d{4}$')}
+
+def period_key(period: str, value) -> str:
+    """
+    Chave do período que contém o dia: '2026-10' (mês) ou '2026' (ano)
+    """
+    day = to_day(value)
+    return day.strftime('%Y-%m') if period == 'month' else str(day.year)
+
+def validate_period(period: str, key: Optional[str] = None) -> str:
+    """
+    Valida período e chave (padrão: período atual); lança ValueError se inválidos
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Período inválido: {period}. Use {' ou '.join(PERIODS)}")
+    key = key or period_key(period, date.today())
+    if not _PERIOD_KEYS[period].match(key):
+        raise ValueError(f'Chave de período inválida para {period}: {key}')
+    return key
+
+def period_bounds(period: str, key: str) -> Tuple[date, date]:
+    """
+    Primeiro e último dia do período
+    """
+    if period == 'year':
+        return date(int(key), 1, 1), date(int(key), 12, 31)
+    year, month = (int(part) for part in key.split('-'))
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    return date(year, month, 1), next_month - timedelta(days=1)
+
+def board_id(period: str, key: str) -> str:
+    return f'{period}_{key}'
+
+def leaderboard_entry(student: Student, period: str, key: str, today: date = None) -> Dict:
+    """
+    Posição do aluno no ranking: presenças no período contadas no bitmap
+    """
+    start, end = period_bounds(period, key)
+    return {
+        'uid': student.uid,
+        'name': student.name,
+        'belt': student.belt,
+        'degrees': student.degrees,
+        'presences': student.presences.count_range(start, end),
+        'streak_weeks': student.active_streak_weeks(today),
+        'best_streak_weeks': int(student.best_streak_weeks or 0)
+    }
+
+def _rank(entry: Dict) -> tuple:
+    # Empate: quem está há mais semanas seguidas fica à frente
+    return entry['presences'], entry['streak_weeks'], entry['uid']
+
+def merge_top(entries: Iterable[Dict], candidates: Iterable[Dict], size: int = LEADERBOARD_SIZE) -> List[Dict]:
+    """
+    Junta os candidatos ao ranking gravado e mantém os size maiores.
+    As presenças de um período só crescem, então vale o maior valor de cada aluno.
+    """
+    by_uid = {entry['uid']: entry for entry in entries}
+    for candidate in candidates:
+        current = by_uid.get(candidate['uid'])
+        if current is None or candidate['presences'] >= current['presences']:
+            by_uid[candidate['uid']] = candidate
+    return heapq.nlargest(size, (entry for entry in by_uid.values() if entry['presences'] > 0), key=_rank)
+
+def _document(period: str, key: str, entries: List[Dict], size: int) -> Dict:
+    return {
+        'period': period,
+        'key': key,
+        'size': size,
+        'entries': entries,
+        # Presenças mínimas para entrar no ranking quando ele está cheio
+        'min_presences': entries[-1]['presences'] if len(entries) >= size else 0,
+        'updated_at': datetime.now().isoformat()
+    }
+
+class LeaderboardUpdater:
+    """
+    Mantém os rankings mensais e anuais a cada presença, sem varrer o cadastro.
+
+    A posição do aluno é calculada no próprio bitmap de presenças. Alunos que
+    não superam o último colocado (conhecido pelo último ranking gravado) são
+    descartados sem leitura; os demais são agrupados por ranking e gravados
+    depois da janela, com uma leitura e uma escrita por ranking e precondição
+    de horário de atualização contra escritas concorrentes de outros workers.
+    """
+
+    def __init__(self, window_seconds: float = FLUSH_WINDOW_SECONDS, size: int = LEADERBOARD_SIZE):
+        self.window_seconds = window_seconds
+        self.size = size
+        # (coleção, período, chave) -> uid -> entrada
+        self._pending: Dict[tuple, Dict[str, Dict]] = {}
+        self._enqueued_at: Dict[tuple, float] = {}
+        # (coleção, período, chave) -> (presenças mínimas, ranking cheio, uids, quando)
+        self._known: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+        # Métricas
+        self._candidates_total = 0
+        self._skipped_total = 0
+        self._writes_total = 0
+        self._conflicts_total = 0
+        self._errors_total = 0
+
+    def _ensure_worker(self):
+        """
+        Inicia a thread de gravação no processo atual (após o fork do Gunicorn)
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='leaderboards', daemon=True)
+        self._thread.start()
+
+    def _qualifies(self, board: tuple, entry: Dict) -> bool:
+        if entry['presences'] <= 0:
+            return False
+        known = self._known.get(board)
+        if known is None or time.monotonic() - known[3] >= KNOWN_TTL_SECONDS:
+            return True
+        min_presences, full, uids, _ = known
+        # O mínimo conhecido nunca é maior que o atual, então o descarte é seguro
+        return not full or entry['uid'] in uids or entry['presences'] > min_presences
+
+    def remember(self, board: tuple, document: Dict):
+        entries = document.get('entries') or []
+        with self._lock:
+            self._known[board] = (document.get('min_presences', 0), len(entries) >= self.size,
+                                  frozenset(entry['uid'] for entry in entries), time.monotonic())
+
+    def record(self, student: Student, days: Iterable[date] = ()) -> None:
+        """
+        Atualiza os rankings do período atual e dos períodos das presenças
+        aplicadas (days; presenças lançadas com data retroativa, como na
+        sincronização offline). Sem days, usa a data da última presença.
+        """
+        path = collection_path(LEADERBOARDS_COLLECTION)
+        today = date.today()
+        days = {today, *days}
+        if len(days) == 1 and student.last_presence_date:
+            try:
+                days.add(to_day(student.last_presence_date))
+            except ValueError:
+                pass
+
+        boards = {(path, period, period_key(period, day)) for day in days for period in PERIODS}
+        with self._lock:
+            for board in boards:
+                entry = leaderboard_entry(student, board[1], board[2], today)
+                if not self._qualifies(board, entry):
+                    self._skipped_total += 1
+                    continue
+                self._candidates_total += 1
+                pending = self._pending.setdefault(board, {})
+                pending[student.uid] = entry
+                self._enqueued_at.setdefault(board, time.monotonic())
+            if self.window_seconds > 0:
+                self._ensure_worker()
+
+        if self.window_seconds <= 0:
+            self.flush()
+
+    def _write_board(self, board: tuple, candidates: List[Dict]) -> Dict:
+        """
+        Lê o ranking, junta os candidatos e grava com precondição
+        """
+        path, period, key = board
+        db = get_db()
+        ref = db.collection(path).document(board_id(period, key))
+        for _ in range(MAX_CONFLICT_RETRIES):
+            snapshot = storage_call(ref.get)
+            current = snapshot.to_dict() if snapshot.exists else {}
+            document = _document(period, key, merge_top(current.get('entries') or [], candidates, self.size), self.size)
+            try:
+                if snapshot.exists:
+                    storage_call(ref.update, document, option=db.write_option(last_update_time=snapshot.update_time))
+                else:
+                    storage_call(ref.create, document)
+            except (google_exceptions.FailedPrecondition, google_exceptions.Conflict):
+                with self._lock:
+                    self._conflicts_total += 1
+                continue
+            single_flight.forget_collection(path)
+            self.remember(board, document)
+            return document
+        raise RuntimeError(f'Ranking {board_id(period, key)} alterado concorrentemente {MAX_CONFLICT_RETRIES} vezes')
+
+    def _drain(self, expired_only: bool) -> Dict[tuple, Dict[str, Dict]]:
+        now = time.monotonic()
+        with self._lock:
+            boards = [board for board, enqueued_at in self._enqueued_at.items()
+                      if not expired_only or now - enqueued_at >= self.window_seconds]
+            drained = {board: self._pending.pop(board) for board in boards}
+            for board in boards:
+                self._enqueued_at.pop(board, None)
+        return drained
+
+    def _write(self, drained: Dict[tuple, Dict[str, Dict]]):
+        for board, candidates in drained.items():
+            try:
+                self._write_board(board, list(candidates.values()))
+                with self._lock:
+                    self._writes_total += 1
+            except Exception as e:
+                logger.error(f"Erro ao gravar ranking {board_id(board[1], board[2])}: {e}")
+                with self._lock:
+                    self._errors_total += 1
+                    # Candidatos mais novos têm precedência sobre os que falharam
+                    pending = self._pending.setdefault(board, {})
+                    for uid, entry in candidates.items():
+                        if uid not in pending or pending[uid]['presences'] < entry['presences']:
+                            pending[uid] = entry
+                    self._enqueued_at.setdefault(board, time.monotonic())
+
+    def flush(self) -> None:
+        """
+        Grava imediatamente todos os rankings pendentes
+        """
+        self._write(self._drain(expired_only=False))
+
+    def forget(self, path: str, period: str, key: str) -> None:
+        """
+        Esquece o último colocado conhecido (após uma reconstrução)
+        """
+        with self._lock:
+            self._known.pop((path, period, key), None)
+
+    def _run(self):
+        """
+        Loop da thread de gravação
+        """
+        interval = max(self.window_seconds / 4, 0.05)
+        while True:
+            time.sleep(interval)
+            try:
+                self._write(self._drain(expired_only=True))
+            except Exception as e:
+                logger.error(f"Erro no loop dos rankings: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'window_seconds': self.window_seconds,
+                'size': self.size,
+                'pending_boards': len(self._pending),
+                'candidates_total': self._candidates_total,
+                'skipped_total': self._skipped_total,
+                'writes_total': self._writes_total,
+                'conflicts_total': self._conflicts_total,
+                'errors_total': self._errors_total
+            }
+
+leaderboard_updater = LeaderboardUpdater()
+
+def get_leaderboard(period: str, key: Optional[str] = None) -> Dict:
+    """
+    Ranking de um período com uma única leitura de documento.
+    Lança ValueError para período ou chave inválidos.
+    """
+    key = validate_period(period, key)
+    path = collection_path(LEADERBOARDS_COLLECTION)
+    ref = get_db().collection(path).document(board_id(period, key))
+
+    def fetch():
+        snapshot = storage_call(ref.get)
+        return snapshot.to_dict() if snapshot.exists else None
+
+    document = single_flight.do(('leaderboard', path, board_id(period, key)), fetch)
+    if document is None:
+        return {'period': period, 'key': key, 'size': leaderboard_updater.size, 'entries': [],
+                'min_presences': 0, 'updated_at': None}
+    leaderboard_updater.remember((path, period, key), document)
+    return document
+
+def rebuild_leaderboards(year: Optional[int] = None, dry_run: bool = False,
+                         page_size: int = DEFAULT_PAGE_SIZE) -> Dict:
+    """
+    Reconstrói os rankings dos 12 meses e do ano em uma única passada pelo
+    cadastro (um heap de tamanho fixo por ranking) e recalcula as sequências
+    de semanas gravadas em cada aluno. Usado no backfill e depois de correções
+    que reduzem presenças (as atualizações incrementais só somam).
+    """
+    year = year or date.today().year
+    size = leaderboard_updater.size
+    today = date.today()
+    boards = [('year', str(year))] + [('month', f'{year}-{month:02d}') for month in range(1, 13)]
+    heaps: Dict[tuple, List[tuple]] = {board: [] for board in boards}
+
+    report = {'tenant': current_tenant(), 'year': year, 'dry_run': dry_run,
+              'students': 0, 'streaks_updated': 0, 'boards': {}}
+    students_path = collection_path('students')
+    for student in Student.iter_all(page_size=page_size, fields=REBUILD_FIELDS):
+        report['students'] += 1
+        stored_streak = student.streak_fields()
+        student.rebuild_streak()
+        if student.streak_fields() != stored_streak:
+            report['streaks_updated'] += 1
+            if not dry_run:
+                write_buffer.set(students_path, student.uid, student.streak_fields())
+
+        for period, key in boards:
+            entry = leaderboard_entry(student, period, key, today)
+            if entry['presences'] <= 0:
+                continue
+            heap = heaps[(period, key)]
+            item = (_rank(entry), entry)
+            if len(heap) < size:
+                heapq.heappush(heap, item)
+            elif item[0] > heap[0][0]:
+                heapq.heapreplace(heap, item)
+
+        if report['students'] % page_size == 0 and not dry_run:
+            write_buffer.flush(students_path)
+
+    path = collection_path(LEADERBOARDS_COLLECTION)
+    documents = {}
+    for (period, key), heap in heaps.items():
+        entries = [entry for _, entry in sorted(heap, key=lambda item: item[0], reverse=True)]
+        documents[board_id(period, key)] = _document(period, key, entries, size)
+        report['boards'][board_id(period, key)] = len(entries)
+
+    if not dry_run:
+        write_buffer.flush(students_path)
+        db = get_db()
+        batch = db.batch()
+        for doc_id, document in documents.items():
+            batch.set(db.collection(path).document(doc_id), document)
+        storage_call(batch.commit)
+        single_flight.forget_collection(path)
+        for period, key in boards:
+            leaderboard_updater.forget(path, period, key)
+
+    logger.info(f"{'[simulação] ' if dry_run else ''}Rankings de {year} reconstruídos: "
+                f"{report['students']} aluno(s), {report['streaks_updated']} sequência(s) corrigida(s)")
+    return report
+
+def _record_presence(student: Student, event: str):
+    if event == 'presence_marked':
+        leaderboard_updater.record(student, student.marked_days)
+
+Student.register_save_hook(_record_presence)
+
+@atexit.register
+def _flush_on_shutdown():
+    """
+    Garante que nenhum ranking fique pendente quando o worker é encerrado
+    """
+    try:
+        leaderboard_updater.flush()
+    except Exception as e:
+        logger.error(f"Erro ao gravar rankings no desligamento: {e}")
@@ -0,0 +1,109 @@
+import hashlib
+import logging
+import os
+from io import BytesIO
+from typing import Dict, Optional
+from PIL import Image, ImageOps
+from models.student import Student
+from services.blob_storage import get_blob_backend
+from services.task_executor import executor
+from services.tenancy import collection_path
+from services.write_buffer import write_buffer
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+PHOTO_MAX_BYTES = int(os.getenv('PHOTO_MAX_BYTES', str(5 * 1024 * 1024)))
+# Formatos aceitos: formato do Pillow -> (extensão, content type)
+ALLOWED_FORMATS = {
+    'JPEG': ('jpg', 'image/jpeg'),
+    'PNG': ('png', 'image/png'),
+    'WEBP': ('webp', 'image/webp')
+}
+# Miniaturas quadradas geradas para cada foto (lado em pixels)
+THUMBNAIL_SIZES = {'small': 96, 'medium': 320}
+THUMBNAIL_QUALITY = 85
+
+class InvalidPhoto(ValueError):
+    """
+    Lançada quando o arquivo enviado não é uma imagem aceita
+    """
+
+def _photo_path(student_uid: str, digest: str, name: str) -> str:
+    # Arquivos separados por academia, como as coleções
+    return f"{collection_path('students')}/{student_uid}/{digest}/{name}"
+
+def store_original(student_uid: str, data: bytes) -> Dict:
+    """
+    Valida a imagem e grava o original. O caminho inclui o hash do conteúdo,
+    então cada versão tem uma URL própria e imutável.
+    """
+    if not data:
+        raise InvalidPhoto('Arquivo vazio')
+    if len(data) > PHOTO_MAX_BYTES:
+        raise InvalidPhoto(f'A foto deve ter no máximo {PHOTO_MAX_BYTES // (1024 * 1024)} MB')
+
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image_format = image.format
+            image.verify()
+    except Exception:
+        raise InvalidPhoto('Arquivo não é uma imagem válida')
+    if image_format not in ALLOWED_FORMATS:
+        raise InvalidPhoto(f"Formato não suportado; use {', '.join(sorted(ALLOWED_FORMATS))}")
+
+    extension, content_type = ALLOWED_FORMATS[image_format]
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    path = _photo_path(student_uid, digest, f'original.{extension}')
+    url = get_blob_backend().put(path, data, content_type)
+    return {'digest': digest, 'path': path, 'original': url}
+
+def _render_thumbnail(image: Image.Image, size: int) -> bytes:
+    thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    thumbnail.save(buffer, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+@executor.task('generate_photo_thumbnails')
+def generate_photo_thumbnails(student_uid: str, digest: str, path: str) -> None:
+    """
+    Gera as miniaturas de uma foto enviada e registra as URLs no aluno
+    """
+    backend = get_blob_backend()
+    stored = backend.get(path)
+    if stored is None:
+        raise RuntimeError(f"Foto original {path} não encontrada")
+
+    with Image.open(BytesIO(stored[0])) as image:
+        # Respeita a orientação gravada pela câmera
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        variants = {}
+        for name, size in THUMBNAIL_SIZES.items():
+            variants[name] = backend.put(_photo_path(student_uid, digest, f'{name}.jpg'),
+                                         _render_thumbnail(image, size), 'image/jpeg')
+
+    student = Student.get_by_uid(student_uid)
+    if not student:
+        logger.warning(f"Estudante {student_uid} não encontrado ao registrar miniaturas")
+        return
+    # Uma foto mais nova pode ter sido enviada enquanto esta era processada
+    if student.photo_variants.get('digest') != digest:
+        logger.info(f"Miniaturas da foto {digest} descartadas: o aluno {student_uid} tem uma foto mais nova")
+        return
+
+    student.photo_variants = dict(student.photo_variants, **variants)
+    write_buffer.set(collection_path('students'), student_uid, {'photo_variants': student.photo_variants})
+    student.run_save_hooks('student_updated')
+
+def schedule_thumbnails(student_uid: str, photo: Dict) -> Optional[str]:
+    """
+    Agenda a geração das miniaturas. Se a fila não aceitar a tarefa, as
+    miniaturas são geradas na própria requisição.
+    """
+    payload = {'student_uid': student_uid, 'digest': photo['digest'], 'path': photo['path']}
+    try:
+        return executor.enqueue('generate_photo_thumbnails', payload)
+    except Exception as e:
+        logger.error(f"Erro ao agendar miniaturas, gerando agora: {e}")
+        generate_photo_thumbnails(**payload)
+        return None
@@ -0,0 +1,226 @@
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from google.api_core import exceptions as google_exceptions
+from config.firebase_config import get_db
+from models.class_session import ClassSession
+from models.graduation_rules import CompiledRules, get_rules
+from models.pagination import paginate_query, DEFAULT_PAGE_SIZE
+from models.presence_bitmap import PresenceBitmap, to_day
+from models.student import Student
+from services.storage_policy import storage_call
+from services.tenancy import collection_path, current_tenant
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# O Firestore aceita no máximo 500 operações por batch
+MAX_BATCH_OPERATIONS = 450
+# Quantidade de alunos detalhados no relatório (o restante entra só nos totais)
+REPORT_SAMPLE_SIZE = 100
+
+class RebuiltPresences:
+    """
+    Presenças de um aluno reconstruídas a partir das aulas
+    """
+
+    __slots__ = ('presences', 'last_date')
+
+    def __init__(self):
+        self.presences = PresenceBitmap()
+        self.last_date = None
+
+    def add(self, class_date) -> None:
+        self.presences.add(class_date)
+        if self.last_date is None or class_date >= self.last_date:
+            self.last_date = class_date
+
+def _iter_attendances(page_size: int) -> Iterator[Tuple[datetime, List[str]]]:
+    """
+    Percorre as aulas em ordem de data, lendo só os campos usados
+    """
+    for class_session in ClassSession.iter_range(page_size=page_size, fields=('date', 'attended_students')):
+        # Um aluno repetido na mesma aula conta uma única presença
+        yield class_session.date, list(dict.fromkeys(class_session.attended_students))
+
+def rebuild_presences(page_size: int = DEFAULT_PAGE_SIZE) -> Tuple[Dict[str, RebuiltPresences], Dict]:
+    """
+    Reconstrói as presenças de cada aluno em uma única passada pelas aulas.
+    A memória cresce com o número de alunos (um bitmap por aluno), não com
+    o número de aulas.
+    """
+    rebuilt: Dict[str, RebuiltPresences] = {}
+    stats = {'classes': 0, 'attendances': 0}
+    for class_date, student_uids in _iter_attendances(page_size):
+        stats['classes'] += 1
+        stats['attendances'] += len(student_uids)
+        for uid in student_uids:
+            entry = rebuilt.get(uid)
+            if entry is None:
+                entry = rebuilt[uid] = RebuiltPresences()
+            entry.add(class_date)
+    return rebuilt, stats
+
+def _same_day(stored, rebuilt) -> bool:
+    if not stored or not rebuilt:
+        return not stored and not rebuilt
+    try:
+        return to_day(stored) == to_day(rebuilt)
+    except ValueError:
+        return False
+
+def diff_student(student: Student, rebuilt: Optional[RebuiltPresences], rules: CompiledRules,
+                 fix_degrees: bool = True) -> Dict:
+    """
+    Compara o aluno gravado com as presenças reconstruídas.
+    Retorna {campo: {'stored': ..., 'rebuilt': ...}} apenas para campos divergentes.
+    """
+    rebuilt = rebuilt or RebuiltPresences()
+    changes = {}
+
+    total = len(rebuilt.presences)
+    if int(student.total_presences) != total:
+        changes['total_presences'] = {'stored': student.total_presences, 'rebuilt': total}
+
+    stored_days = Counter(student.presences.days())
+    rebuilt_days = Counter(rebuilt.presences.days())
+    if stored_days != rebuilt_days:
+        changes['history_presences'] = {
+            'missing': sum((rebuilt_days - stored_days).values()),
+            'unexpected': sum((stored_days - rebuilt_days).values())
+        }
+
+    last_date = rebuilt.last_date.isoformat() if rebuilt.last_date else None
+    if not _same_day(student.last_presence_date, last_date):
+        changes['last_presence_date'] = {'stored': student.last_presence_date, 'rebuilt': last_date}
+
+    if fix_degrees:
+        degrees = rules.degrees_for(student.belt, total, int(student.extra_activities))
+        if degrees is not None and int(student.degrees) != degrees:
+            changes['degrees'] = {'stored': student.degrees, 'rebuilt': degrees}
+
+    return changes
+
+def apply_changes(student: Student, rebuilt: Optional[RebuiltPresences], changes: Dict) -> Dict:
+    """
+    Aplica a reconstrução no aluno (em memória) e retorna os campos a gravar
+    """
+    rebuilt = rebuilt or RebuiltPresences()
+    student.history_presences = rebuilt.presences.days()
+    student.total_presences = len(rebuilt.presences)
+    student.last_presence_date = rebuilt.last_date.isoformat() if rebuilt.last_date else None
+    student.rebuild_streak()
+    if 'degrees' in changes:
+        student.degrees = changes['degrees']['rebuilt']
+    return {**student.presence_fields(), **student.graduation_fields()}
+
+class _CorrectionWriter:
+    """
+    Grava as correções em batches. Cada escrita exige que o documento não
+    tenha mudado desde a leitura; se um batch falhar por isso, os documentos
+    são regravados um a um e os alterados no meio do caminho são ignorados.
+    """
+
+    def __init__(self, db, report: Dict):
+        self.db = db
+        self.report = report
+        self.pending = []
+
+    def add(self, doc, fields: Dict) -> None:
+        self.pending.append((doc, fields))
+        if len(self.pending) >= MAX_BATCH_OPERATIONS:
+            self.flush()
+
+    def _option(self, doc):
+        return self.db.write_option(last_update_time=doc.update_time)
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+
+        batch = self.db.batch()
+        for doc, fields in pending:
+            batch.update(doc.reference, fields, option=self._option(doc))
+        try:
+            storage_call(batch.commit)
+            self.report['commits'] += 1
+            return
+        except google_exceptions.FailedPrecondition:
+            logger.warning("Aluno alterado durante a reconciliação; regravando o batch um a um")
+
+        for doc, fields in pending:
+            try:
+                storage_call(doc.reference.update, fields, option=self._option(doc))
+                self.report['commits'] += 1
+            except google_exceptions.FailedPrecondition:
+                self.report['conflicts'] += 1
+                self.report['corrected'] -= 1
+                logger.warning(f"Aluno {doc.id} alterado durante a reconciliação; não corrigido")
+
+def reconcile_students(dry_run: bool = False, fix_degrees: bool = True,
+                       page_size: int = DEFAULT_PAGE_SIZE) -> Dict:
+    """
+    Reconstrói total de presenças, histórico, última presença e grau de cada
+    aluno a partir da coleção classes e corrige os documentos divergentes.
+
+    Com dry_run nada é gravado; o relatório mostra o que seria corrigido.
+    fix_degrees=False mantém os graus gravados (ex.: promoções feitas à mão).
+    """
+    db = get_db()
+    rules = get_rules()
+    rebuilt, class_stats = rebuild_presences(page_size)
+
+    report = {
+        'tenant': current_tenant(),
+        'dry_run': dry_run,
+        'rules_version': rules.version,
+        **class_stats,
+        'students': 0,
+        'corrected': 0,
+        'unchanged': 0,
+        'conflicts': 0,
+        'invalid': 0,
+        'commits': 0,
+        'fields': Counter(),
+        'missing_students': 0,
+        'missing_sample': [],
+        'sample': []
+    }
+    writer = _CorrectionWriter(db, report)
+
+    query = db.collection(collection_path('students')).order_by('__name__')
+    for doc in paginate_query(query, page_size):
+        report['students'] += 1
+        student = Student.from_dict(doc.to_dict() or {})
+        if student is None:
+            report['invalid'] += 1
+            rebuilt.pop(doc.id, None)
+            continue
+
+        # Cada aluno sai do mapa ao ser comparado, liberando a memória
+        presences = rebuilt.pop(doc.id, None)
+        changes = diff_student(student, presences, rules, fix_degrees)
+        if not changes:
+            report['unchanged'] += 1
+            continue
+
+        report['corrected'] += 1
+        report['fields'].update(changes.keys())
+        if len(report['sample']) < REPORT_SAMPLE_SIZE:
+            report['sample'].append({'uid': doc.id, 'changes': changes})
+        if not dry_run:
+            writer.add(doc, apply_changes(student, presences, changes))
+
+    writer.flush()
+
+    # Alunos presentes em aulas mas sem documento em students
+    report['missing_students'] = len(rebuilt)
+    report['missing_sample'] = sorted(rebuilt)[:REPORT_SAMPLE_SIZE]
+    report['fields'] = dict(report['fields'])
+
+    logger.info(f"{'[simulação] ' if dry_run else ''}Reconciliação: {report['classes']} aula(s), "
+                f"{report['students']} aluno(s), {report['corrected']} corrigido(s), "
+                f"{report['conflicts']} conflito(s), {report['missing_students']} sem cadastro")
+    return report
@@ -0,0 +1,245 @@
+import bisect
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Set
+from models.student import Student
+from services.tenancy import TenantLocal, current_tenant, tenant_scope
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# O índice é reconstruído periodicamente para incorporar gravações de outros workers
+INDEX_TTL_SECONDS = float(os.getenv('SEARCH_INDEX_TTL_SECONDS', '300'))
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Campos enviados na resposta da busca
+PROJECTION_FIELDS = ('uid', 'name', 'email', 'belt', 'degrees', 'photo_thumbnail')
+# Eventos de gravação que mudam os campos indexados ou projetados
+INDEXED_EVENTS = ('student_updated', 'degree_promoted')
+
+_NON_WORD = re.compile(r'[^a-z0-9@._]+')
+
+def normalize(text: str) -> str:
+    """
+    Remove acentos e caixa ("João" -> "joao")
+    """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return stripped.lower().strip()
+
+def tokenize(text: str) -> List[str]:
+    """
+    Divide o texto normalizado em palavras (o e-mail também vira partes)
+    """
+    tokens = []
+    for word in _NON_WORD.split(normalize(text)):
+        if not word:
+            continue
+        tokens.append(word)
+        if '@' in word:
+            tokens.extend(part for part in re.split(r'[@._]+', word) if part)
+    return tokens
+
+def trigrams(text: str) -> Set[str]:
+    """
+    Trigramas da forma normalizada, com espaços nas bordas das palavras
+    """
+    grams = set()
+    for word in tokenize(text):
+        padded = f'  {word} '
+        for index in range(len(padded) - 2):
+            grams.add(padded[index:index + 3])
+    return grams
+
+class StudentSearchIndex:
+    """
+    Índice em memória sobre nome e e-mail dos alunos: prefixo (lista ordenada
+    de tokens + busca binária) e trigramas para erros de digitação.
+
+    Só uma reconstrução roda por vez (_rebuild_lock). Alunos atualizados
+    durante a reconstrução são guardados e reaplicados no índice novo antes
+    da troca, para não voltarem à versão lida no início da varredura.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        self._built_at = None
+        # uid -> aluno atualizado durante a reconstrução em andamento
+        self._pending_updates = None
+        self._reset()
+
+    def _reset(self):
+        self._projections: Dict[str, Dict] = {}
+        self._doc_tokens: Dict[str, List[str]] = {}
+        self._doc_trigrams: Dict[str, Set[str]] = {}
+        self._sorted_tokens: List[tuple] = []
+        self._trigram_postings: Dict[str, Set[str]] = {}
+
+    def _remove(self, uid: str):
+        for token in self._doc_tokens.pop(uid, []):
+            position = bisect.bisect_left(self._sorted_tokens, (token, uid))
+            if position < len(self._sorted_tokens) and self._sorted_tokens[position] == (token, uid):
+                del self._sorted_tokens[position]
+        for gram in self._doc_trigrams.pop(uid, set()):
+            postings = self._trigram_postings.get(gram)
+            if postings:
+                postings.discard(uid)
+                if not postings:
+                    del self._trigram_postings[gram]
+        self._projections.pop(uid, None)
+
+    def _add(self, student: Student, keep_sorted: bool = True):
+        """
+        Indexa um aluno. Na montagem completa (keep_sorted=False) os tokens só
+        são acrescentados e a lista é ordenada uma vez no final.
+        """
+        text = f'{student.name} {student.email}'
+        tokens = sorted(set(tokenize(text)))
+        grams = trigrams(text)
+
+        self._projections[student.uid] = {field: getattr(student, field, None) for field in PROJECTION_FIELDS}
+        self._doc_tokens[student.uid] = tokens
+        self._doc_trigrams[student.uid] = grams
+        if keep_sorted:
+            for token in tokens:
+                bisect.insort(self._sorted_tokens, (token, student.uid))
+        else:
+            self._sorted_tokens.extend((token, student.uid) for token in tokens)
+        for gram in grams:
+            self._trigram_postings.setdefault(gram, set()).add(student.uid)
+
+    def update(self, student: Student, event: str = 'student_updated'):
+        """
+        Atualiza um aluno no índice (usado como hook de Student.save)
+        """
+        if event not in INDEXED_EVENTS:
+            return
+        with self._lock:
+            if self._pending_updates is not None:
+                self._pending_updates[student.uid] = student
+            if self._built_at is not None:
+                self._remove(student.uid)
+                self._add(student)
+
+    def rebuild(self):
+        """
+        Reconstrói o índice a partir do cadastro completo
+        """
+        with self._rebuild_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        """
+        Monta um índice novo e troca as estruturas (chamado com _rebuild_lock)
+        """
+        with self._lock:
+            self._pending_updates = {}
+        try:
+            fresh = StudentSearchIndex()
+            # Percorre o cadastro sem o histórico; só as projeções ficam no índice
+            for student in Student.iter_all(fields=PROJECTION_FIELDS):
+                fresh._add(student, keep_sorted=False)
+            fresh._sorted_tokens.sort()
+
+            # Troca as estruturas de uma vez para não bloquear buscas durante a montagem
+            with self._lock:
+                for student in self._pending_updates.values():
+                    fresh._remove(student.uid)
+                    fresh._add(student)
+                self._projections = fresh._projections
+                self._doc_tokens = fresh._doc_tokens
+                self._doc_trigrams = fresh._doc_trigrams
+                self._sorted_tokens = fresh._sorted_tokens
+                self._trigram_postings = fresh._trigram_postings
+                self._built_at = time.monotonic()
+            logger.info(f"Índice de busca reconstruído com {len(fresh._projections)} aluno(s)")
+        finally:
+            with self._lock:
+                self._pending_updates = None
+
+    def _rebuild_in_background(self, tenant: str):
+        try:
+            with tenant_scope(tenant):
+                self._rebuild()
+        except Exception as e:
+            logger.error(f"Erro ao reconstruir índice de busca da academia {tenant}: {e}")
+        finally:
+            self._rebuild_lock.release()
+
+    def ensure_built(self):
+        """
+        Na primeira busca o índice é montado e as buscas simultâneas esperam
+        a mesma montagem. Depois do TTL as buscas continuam no índice atual
+        enquanto uma única thread reconstrói em segundo plano.
+        """
+        if self._built_at is None:
+            with self._rebuild_lock:
+                if self._built_at is None:
+                    self._rebuild()
+        elif time.monotonic() - self._built_at > INDEX_TTL_SECONDS:
+            if self._rebuild_lock.acquire(blocking=False):
+                threading.Thread(target=self._rebuild_in_background, args=(current_tenant(),),
+                                 name='search-index-rebuild', daemon=True).start()
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> List[Dict]:
+        """
+        Retorna as projeções dos alunos mais relevantes para a busca
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        scores: Dict[str, float] = {}
+        with self._lock:
+            for term in terms:
+                term_scores: Dict[str, float] = {}
+
+                # Prefixo: todos os tokens que começam com o termo
+                start = bisect.bisect_left(self._sorted_tokens, (term, ''))
+                end = bisect.bisect_left(self._sorted_tokens, (term + '\uffff', ''))
+                for token, uid in self._sorted_tokens[start:end]:
+                    score = 3.0 if token == term else 2.0
+                    if score > term_scores.get(uid, 0):
+                        term_scores[uid] = score
+
+                # Trigramas (tolerância a erros de digitação) só quando o
+                # prefixo não trouxe resultados suficientes
+                query_grams = trigrams(term) if len(term_scores) < limit else None
+                if query_grams:
+                    overlap: Dict[str, int] = {}
+                    for gram in query_grams:
+                        for uid in self._trigram_postings.get(gram, ()):
+                            overlap[uid] = overlap.get(uid, 0) + 1
+                    for uid, shared in overlap.items():
+                        similarity = shared / len(query_grams)
+                        if similarity >= 0.5 and similarity > term_scores.get(uid, 0):
+                            term_scores[uid] = similarity
+
+                for uid, score in term_scores.items():
+                    scores[uid] = scores.get(uid, 0) + score
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+            return [dict(self._projections[uid], score=round(score, 3)) for uid, score in best]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'documents': len(self._projections),
+                'tokens': len(self._sorted_tokens),
+                'trigrams': len(self._trigram_postings)
+            }
+
+# Um índice por academia
+student_indexes = TenantLocal(lambda tenant: StudentSearchIndex())
+
+def _update_index(student: Student, event: str = 'student_updated'):
+    student_indexes.current().update(student, event)
+
+Student.register_save_hook(_update_index)
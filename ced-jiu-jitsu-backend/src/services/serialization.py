@@ -0,0 +1,171 @@
+import json
+import logging
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+import msgpack
+from flask import has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from models.class_session import ClassSession
+from models.graduation_rules import get_rules
+from models.student import Student, STUDENT_FIELDS
+
+try:
+    import orjson
+except ImportError:
+    # Sem orjson as respostas continuam saindo pelo json da biblioteca padrão
+    orjson = None
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+# JSON continua sendo o padrão quando o cliente aceita os dois formatos
+RESPONSE_MIMETYPES = (JSON_MIMETYPE, MSGPACK_MIMETYPE, 'application/x-msgpack')
+
+class StudentSerializer:
+    """
+    Monta a representação de vários alunos lendo as regras de graduação uma
+    única vez. Os campos derivados são calculados uma vez por combinação de
+    faixa, grau e atividades extras, e o histórico só é decodificado se pedido.
+
+    Diferente do pedido original (emitir bytes sem dicionários
+    intermediários), cada aluno ainda vira um dict pequeno, só com os campos
+    pedidos. É de propósito: a mesma lista é codificada em JSON (orjson) ou
+    em MessagePack conforme o Accept, e entra no envelope da resposta
+    ({'success': ..., 'students': [...]}) codificado numa única chamada. Bytes
+    prontos por aluno exigiriam um codificador por formato e remontar o
+    envelope à mão. O ganho medido em scripts/bench_serialization.py vem de
+    não recalcular os campos derivados e do orjson, não da ausência dos dicts.
+    """
+
+    def __init__(self, fields: Optional[Iterable[str]] = None):
+        self.fields = tuple(fields) if fields is not None else STUDENT_FIELDS
+        self.rules = get_rules()
+        self._required: Dict[tuple, int] = {}
+        self._plain_fields = tuple(
+            field for field in self.fields if field not in ('presences_for_next_degree', 'next_belt')
+        )
+        self._with_progress = 'presences_for_next_degree' in self.fields
+        self._with_next_belt = 'next_belt' in self.fields
+
+    def _presences_for_next_degree(self, student: Student) -> int:
+        try:
+            key = (student.belt, int(student.degrees), int(student.extra_activities))
+            needed = self._required.get(key)
+            if needed is None:
+                needed = self._required[key] = self.rules.required_presences(*key)
+            if needed == 0:
+                return 0
+            return max(0, needed - int(student.total_presences))
+        except (TypeError, ValueError):
+            return student.calculate_presences_for_next_degree()
+
+    def __call__(self, student: Student) -> Dict:
+        data = {field: getattr(student, field) for field in self._plain_fields}
+        if self._with_progress:
+            data['presences_for_next_degree'] = self._presences_for_next_degree(student)
+        if self._with_next_belt:
+            data['next_belt'] = self.rules.next_belt(student.belt)
+        return data
+
+    def many(self, students: Iterable[Student]) -> List[Dict]:
+        return [self(student) for student in students]
+
+def serialize_students(students: Iterable[Student], fields: Optional[Iterable[str]] = None) -> List[Dict]:
+    """
+    Representação de uma lista de alunos (rota de cadastro, próximos da graduação)
+    """
+    return StudentSerializer(fields).many(students)
+
+def serialize_class(class_session: ClassSession) -> Dict:
+    """
+    Resumo de uma aula usado nas listagens
+    """
+    class_date = class_session.date
+    return {
+        'class_id': class_session.class_id,
+        'date': class_date.isoformat() if hasattr(class_date, 'isoformat') else class_date,
+        'instructor_uid': class_session.instructor_uid,
+        'attended_students_count': len(class_session.attended_students)
+    }
+
+def _json_default(value):
+    """
+    Tipos sem representação JSON nativa. Modelos podem ser enviados direto
+    para jsonify; datas usam ISO-8601 (inclusive os timestamps do Firestore).
+    """
+    if isinstance(value, Student):
+        return StudentSerializer()(value)
+    if isinstance(value, ClassSession):
+        return serialize_class(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f'Tipo não serializável em JSON: {type(value).__name__}')
+
+def _msgpack_default(value):
+    """
+    Tipos que o MessagePack não conhece. Datas com hora viram a extensão
+    Timestamp (horários sem fuso são tratados como UTC, o fuso do servidor).
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(value)
+    if isinstance(value, (tuple, set, frozenset)):
+        return list(value)
+    return _json_default(value)
+
+def packb(obj) -> bytes:
+    return msgpack.packb(obj, default=_msgpack_default, use_bin_type=True)
+
+def dumps_bytes(obj) -> bytes:
+    """
+    Codifica em JSON direto para bytes (orjson quando disponível)
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def wants_msgpack() -> bool:
+    """
+    Verifica se o cabeçalho Accept da requisição prefere MessagePack
+    """
+    if not has_request_context():
+        return False
+    best = request.accept_mimetypes.best_match(RESPONSE_MIMETYPES, default=JSON_MIMETYPE)
+    return best != JSON_MIMETYPE
+
+class ApiJSONProvider(DefaultJSONProvider):
+    """
+    Provider usado por jsonify: codifica com orjson direto para bytes e
+    responde em MessagePack quando o cliente envia Accept: application/msgpack
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        # Opções específicas do json (indent, sort_keys...) seguem pelo caminho padrão
+        if kwargs:
+            kwargs.setdefault('default', _json_default)
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if wants_msgpack():
+            response = self._app.response_class(packb(obj), mimetype=MSGPACK_MIMETYPE)
+        else:
+            response = self._app.response_class(dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+        response.vary.add('Accept')
+        return response
+
+def init_serialization(app):
+    """
+    Registra o provider de respostas na aplicação
+    """
+    app.json_provider_class = ApiJSONProvider
+    app.json = ApiJSONProvider(app)
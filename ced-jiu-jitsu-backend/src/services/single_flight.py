@@ -0,0 +1,105 @@
+import logging
+import os
+import threading
+from typing import Callable, Dict, Hashable, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Com 0 cada chamada vai direto ao Firestore (útil para comparar no replay)
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', '1') not in ('0', 'false')
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Agrupa leituras idênticas que chegam ao mesmo tempo neste worker: a
+    primeira chamada faz a leitura e as outras esperam e recebem o mesmo
+    resultado (ou a mesma exceção).
+
+    As chaves são (tipo, caminho da coleção, identificador); o caminho já
+    separa as academias. O resultado é compartilhado entre as chamadas e
+    deve ser tratado como somente leitura (os modelos copiam o que alteram).
+    """
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self._flights: Dict[Tuple, _Flight] = {}
+        self._lock = threading.Lock()
+
+        # Métricas por tipo de leitura
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, kind: str, name: str):
+        counters = self._counters.setdefault(kind, {'calls_total': 0, 'coalesced_total': 0, 'errors_total': 0})
+        counters[name] += 1
+
+    def do(self, key: Tuple[str, str, Hashable], fn: Callable):
+        """
+        Executa fn uma única vez para chamadas simultâneas com a mesma chave
+        """
+        if not self.enabled:
+            return fn()
+
+        kind = key[0]
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self._count(kind, 'coalesced_total')
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                self._count(kind, 'calls_total')
+                leader = True
+
+        if not leader:
+            # A chamada líder é limitada pelo prazo e timeout do storage_call
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self._count(kind, 'errors_total')
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+    def forget_collection(self, path: str) -> None:
+        """
+        Chamado depois de uma escrita na coleção: leituras que começarem a
+        partir daqui não se juntam às que já estavam em andamento (e que
+        podem não ver a escrita)
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            for key in [key for key in self._flights if key[1] == path]:
+                del self._flights[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = {kind: dict(counters) for kind, counters in self._counters.items()}
+            in_flight = len(self._flights)
+        for counters in stats.values():
+            total = counters['calls_total'] + counters['coalesced_total']
+            counters['coalesced_ratio'] = round(counters['coalesced_total'] / total, 3) if total else 0.0
+        return {'enabled': self.enabled, 'in_flight': in_flight, 'reads': stats}
+
+single_flight = SingleFlight()
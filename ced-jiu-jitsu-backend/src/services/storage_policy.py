@@ -0,0 +1,248 @@
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+from flask import g, has_request_context, jsonify
+from google.api_core import exceptions as google_exceptions
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Orçamento total de tempo de uma requisição para chamadas ao Firestore
+REQUEST_DEADLINE_SECONDS = float(os.getenv('STORAGE_REQUEST_DEADLINE_SECONDS', '8'))
+# Timeout de uma chamada isolada (fora de requisição ou quando sobra mais orçamento)
+CALL_TIMEOUT_SECONDS = float(os.getenv('STORAGE_CALL_TIMEOUT_SECONDS', '5'))
+MAX_ATTEMPTS = int(os.getenv('STORAGE_MAX_ATTEMPTS', '3'))
+BACKOFF_BASE_SECONDS = 0.1
+BACKOFF_MAX_SECONDS = 2.0
+# Falhas consecutivas que abrem o circuito e por quanto tempo ele fica aberto
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('STORAGE_BREAKER_FAILURES', '5'))
+BREAKER_RESET_SECONDS = float(os.getenv('STORAGE_BREAKER_RESET_SECONDS', '30'))
+
+# Erros que valem uma nova tentativa
+TRANSIENT_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.Aborted,
+)
+
+_deadline: ContextVar[Optional[float]] = ContextVar('storage_deadline', default=None)
+
+class StorageUnavailable(Exception):
+    """
+    O Firestore está indisponível (circuito aberto ou orçamento de tempo esgotado)
+    """
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Circuit breaker simples: abre após falhas consecutivas, deixa passar uma
+    chamada de teste depois do tempo de espera e fecha se ela tiver sucesso
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.opened_total = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def retry_after(self) -> int:
+        with self._lock:
+            remaining = self.reset_seconds - (time.monotonic() - self._opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened_total += 1
+                    logger.warning(f"Circuito do Firestore aberto após {self._failures} falha(s)")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+class StoragePolicy:
+    """
+    Política aplicada a toda chamada ao Firestore: prazo da requisição,
+    novas tentativas com backoff e jitter e circuit breaker
+    """
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+        self._counters = {
+            'calls_total': 0,
+            'succeeded_total': 0,
+            'retries_total': 0,
+            'transient_errors_total': 0,
+            'deadline_exceeded_total': 0,
+            'rejected_total': 0
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _fail_fast(self, message: str, retry_after: int):
+        if has_request_context():
+            g.storage_unavailable_retry_after = retry_after
+        raise StorageUnavailable(message, retry_after)
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """
+        Executa fn repassando timeout (limitado pelo prazo restante) e
+        desativando a retentativa interna da biblioteca
+        """
+        self._count('calls_total')
+        deadline = _deadline.get()
+
+        for attempt in range(MAX_ATTEMPTS):
+            # O prazo é verificado antes do breaker: com o circuito meio aberto,
+            # allow() reserva a única chamada de teste, que precisa registrar
+            # sucesso ou falha para não deixar o circuito preso
+            timeout = CALL_TIMEOUT_SECONDS
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._count('deadline_exceeded_total')
+                    self._fail_fast('Prazo da requisição esgotado', 1)
+                timeout = min(timeout, remaining)
+
+            if not self.breaker.allow():
+                self._count('rejected_total')
+                self._fail_fast('Firestore indisponível (circuito aberto)', self.breaker.retry_after())
+
+            try:
+                result = fn(*args, timeout=timeout, retry=None, **kwargs)
+            except TRANSIENT_ERRORS as e:
+                self._count('transient_errors_total')
+                self.breaker.record_failure()
+                # Backoff exponencial com jitter completo, dentro do orçamento
+                delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+                out_of_budget = deadline is not None and time.monotonic() + delay >= deadline
+                if attempt + 1 >= MAX_ATTEMPTS or out_of_budget:
+                    try:
+                        self._fail_fast(f'Firestore indisponível: {e}', 1)
+                    except StorageUnavailable as unavailable:
+                        raise unavailable from e
+                logger.warning(f"Erro transitório no Firestore, nova tentativa em {delay:.2f}s: {e}")
+                self._count('retries_total')
+                time.sleep(delay)
+                continue
+            except Exception:
+                # O Firestore respondeu (ex.: NotFound); não conta como falha do serviço
+                self.breaker.record_success()
+                raise
+
+            self.breaker.record_success()
+            self._count('succeeded_total')
+            return result
+
+    def stats(self) -> Dict:
+        """
+        Retorna a configuração e os contadores da política
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update({
+            'breaker_state': self.breaker.state,
+            'breaker_opened_total': self.breaker.opened_total,
+            'request_deadline_seconds': REQUEST_DEADLINE_SECONDS,
+            'call_timeout_seconds': CALL_TIMEOUT_SECONDS,
+            'max_attempts': MAX_ATTEMPTS
+        })
+        return counters
+
+storage_policy = StoragePolicy()
+
+def storage_call(fn: Callable, *args, **kwargs):
+    """
+    Atalho para storage_policy.call
+    """
+    return storage_policy.call(fn, *args, **kwargs)
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """
+    Substitui o prazo atual dentro do bloco (None remove o prazo, mantendo
+    apenas o timeout por chamada). Usado por respostas em streaming, que
+    continuam lendo do Firestore depois do fim do ciclo normal da requisição.
+    """
+    token = _deadline.set(time.monotonic() + seconds if seconds is not None else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def init_storage_policy(app):
+    """
+    Registra o prazo por requisição e a resposta 503 quando o Firestore
+    está indisponível
+    """
+
+    @app.before_request
+    def _start_deadline():
+        g.storage_deadline_token = _deadline.set(time.monotonic() + REQUEST_DEADLINE_SECONDS)
+
+    @app.teardown_request
+    def _clear_deadline(exc=None):
+        token = g.pop('storage_deadline_token', None)
+        if token is not None:
+            _deadline.reset(token)
+
+    @app.after_request
+    def _degrade_on_unavailable(response):
+        # Os modelos engolem exceções e devolvem None/False; se a causa foi o
+        # Firestore indisponível, o erro vira 503 em vez de 404/500. Erros de
+        # validação e de permissão (400/403...) são mantidos.
+        retry_after = g.pop('storage_unavailable_retry_after', None)
+        if retry_after is not None and response.status_code in (404, 500):
+            response = jsonify({'error': 'Serviço temporariamente indisponível, tente novamente'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    @app.errorhandler(StorageUnavailable)
+    def _handle_unavailable(e):
+        response = jsonify({'error': 'Serviço temporariamente indisponível, tente novamente'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
@@ -0,0 +1,341 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from services.tenancy import current_tenant, tenant_scope
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'tasks.db')
+QUEUE_PATH = os.getenv('TASK_QUEUE_PATH', DEFAULT_QUEUE_PATH)
+# Número de threads de execução por worker
+MAX_WORKERS = int(os.getenv('TASK_WORKERS', '2'))
+# Máximo de tarefas pendentes antes de recusar novas
+MAX_PENDING = int(os.getenv('TASK_QUEUE_MAX_PENDING', '10000'))
+DEFAULT_MAX_ATTEMPTS = 3
+# Espera base entre tentativas (dobra a cada falha)
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 300.0
+# Tarefas "running" há mais tempo que isso são consideradas abandonadas (worker morreu)
+RUNNING_LEASE_SECONDS = 300.0
+# Por quanto tempo os jobs concluídos continuam consultáveis antes de sair da fila
+SUCCEEDED_RETENTION_SECONDS = float(os.getenv('TASK_SUCCEEDED_RETENTION_DAYS', '7')) * 86400
+FAILED_RETENTION_SECONDS = float(os.getenv('TASK_FAILED_RETENTION_DAYS', '30')) * 86400
+# Intervalo mínimo entre duas limpezas no mesmo worker
+CLEANUP_INTERVAL_SECONDS = 60.0
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+class TaskQueueFull(Exception):
+    """
+    Lançada quando a fila de tarefas atingiu o limite de pendências
+    """
+
+class TaskExecutor:
+    """
+    Executor de tarefas em segundo plano dentro do processo.
+
+    As tarefas ficam numa fila persistente (SQLite) e são executadas por um
+    pool limitado de threads, com novas tentativas e consulta de status.
+    Jobs concluídos são apagados depois do período de retenção.
+    """
+
+    def __init__(self, path: str = QUEUE_PATH, max_workers: int = MAX_WORKERS):
+        self.path = path
+        self.max_workers = max_workers
+        self._handlers: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._pid = None
+        self._initialized = False
+        self._last_cleanup = 0.0
+
+        # Métricas
+        self._succeeded_total = 0
+        self._failed_total = 0
+        self._retries_total = 0
+        self._purged_total = 0
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        if self._initialized:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    run_after REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    tenant TEXT
+                )
+            """)
+            # Filas criadas antes da separação por academia
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if 'tenant' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN tenant TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, run_after)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs (status, updated_at)')
+        self._initialized = True
+
+    def task(self, name: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> Callable:
+        """
+        Decorator que registra uma função como tarefa executável pelo nome
+        """
+        def decorator(func):
+            self._handlers[name] = {'func': func, 'max_attempts': max_attempts}
+            return func
+        return decorator
+
+    def _ensure_workers(self):
+        """
+        Inicia o pool de threads no processo atual (após o fork do Gunicorn)
+        """
+        with self._lock:
+            if self._threads and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._init_db()
+            self._recover_abandoned()
+            self._threads = []
+            for index in range(self.max_workers):
+                thread = threading.Thread(target=self._run, name=f'task-worker-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def start(self):
+        """
+        Inicia o pool neste processo, retomando as tarefas que ficaram na
+        fila (de um deploy ou reinício anterior) sem esperar um enqueue
+        """
+        self._ensure_workers()
+
+    def _after_fork(self):
+        """
+        No processo filho as threads do pai não existem e as travas podem ter
+        sido copiadas adquiridas: recria as travas e inicia um pool novo
+        """
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self.start()
+
+    def _recover_abandoned(self):
+        """
+        Devolve para a fila tarefas que ficaram presas em execução
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?',
+                (STATUS_PENDING, now, STATUS_RUNNING, now - RUNNING_LEASE_SECONDS)
+            )
+
+    def _cleanup(self):
+        """
+        Apaga os jobs concluídos há mais tempo que o período de retenção
+        (no máximo uma vez por CLEANUP_INTERVAL_SECONDS em cada worker)
+        """
+        now = time.time()
+        with self._lock:
+            if now - self._last_cleanup < CLEANUP_INTERVAL_SECONDS:
+                return
+            self._last_cleanup = now
+        with self._connect() as conn:
+            purged = 0
+            for status, retention in ((STATUS_SUCCEEDED, SUCCEEDED_RETENTION_SECONDS),
+                                      (STATUS_FAILED, FAILED_RETENTION_SECONDS)):
+                purged += conn.execute('DELETE FROM jobs WHERE status = ? AND updated_at < ?',
+                                       (status, now - retention)).rowcount
+        if purged:
+            logger.info(f"Fila de tarefas: {purged} job(s) concluído(s) removido(s)")
+            with self._lock:
+                self._purged_total += purged
+
+    def enqueue(self, name: str, payload: Optional[Dict] = None, max_attempts: Optional[int] = None) -> str:
+        """
+        Coloca uma tarefa na fila e retorna o ID do job. A tarefa roda na
+        academia de quem a enfileirou.
+        """
+        if name not in self._handlers:
+            raise ValueError(f"Tarefa desconhecida: {name}")
+
+        self._ensure_workers()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        attempts = max_attempts or self._handlers[name]['max_attempts']
+
+        with self._connect() as conn:
+            pending = conn.execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (STATUS_PENDING,)).fetchone()[0]
+            if pending >= MAX_PENDING:
+                raise TaskQueueFull(f"Fila de tarefas cheia ({pending} pendentes)")
+            conn.execute(
+                'INSERT INTO jobs (id, name, payload, status, attempts, max_attempts, run_after, created_at, updated_at, tenant) '
+                'VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?, ?)',
+                (job_id, name, json.dumps(payload or {}), STATUS_PENDING, attempts, now, now, now, current_tenant())
+            )
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """
+        Retorna o status de um job pelo ID
+        """
+        self._init_db()
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'job_id': row['id'],
+            'name': row['name'],
+            'tenant': row['tenant'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'max_attempts': row['max_attempts'],
+            'last_error': row['last_error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+
+    def _claim_next(self) -> Optional[sqlite3.Row]:
+        """
+        Reserva atomicamente a próxima tarefa pronta para execução
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT * FROM jobs WHERE status = ? AND run_after <= ? ORDER BY run_after LIMIT 1',
+                (STATUS_PENDING, now)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                'UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?',
+                (STATUS_RUNNING, now, row['id'])
+            )
+            conn.execute('COMMIT')
+            return row
+
+    def _finish(self, job_id: str, status: str, error: Optional[str] = None, run_after: Optional[float] = None):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, last_error = ?, run_after = COALESCE(?, run_after), updated_at = ? WHERE id = ?',
+                (status, error, run_after, now, job_id)
+            )
+
+    def _execute(self, row: sqlite3.Row):
+        handler = self._handlers.get(row['name'])
+        attempts = row['attempts'] + 1
+        try:
+            if handler is None:
+                raise ValueError(f"Tarefa desconhecida: {row['name']}")
+            with tenant_scope(row['tenant']):
+                handler['func'](**json.loads(row['payload']))
+        except Exception as e:
+            if attempts < row['max_attempts']:
+                delay = min(RETRY_BASE_SECONDS * (2 ** (attempts - 1)), RETRY_MAX_SECONDS)
+                logger.warning(f"Tarefa {row['name']} ({row['id']}) falhou, nova tentativa em {delay:.0f}s: {e}")
+                self._finish(row['id'], STATUS_PENDING, str(e), time.time() + delay)
+                with self._lock:
+                    self._retries_total += 1
+            else:
+                logger.error(f"Tarefa {row['name']} ({row['id']}) falhou definitivamente: {e}")
+                self._finish(row['id'], STATUS_FAILED, str(e))
+                with self._lock:
+                    self._failed_total += 1
+            return
+
+        self._finish(row['id'], STATUS_SUCCEEDED)
+        with self._lock:
+            self._succeeded_total += 1
+
+    def _run(self):
+        """
+        Loop de cada thread do pool
+        """
+        while True:
+            try:
+                row = self._claim_next()
+            except Exception as e:
+                logger.error(f"Erro ao buscar próxima tarefa: {e}")
+                row = None
+
+            if row is None:
+                try:
+                    self._cleanup()
+                except Exception as e:
+                    logger.error(f"Erro ao limpar a fila de tarefas: {e}")
+                with self._wakeup:
+                    # Acorda ao chegar tarefa nova ou periodicamente para tentativas agendadas
+                    self._wakeup.wait(timeout=1.0)
+                continue
+
+            self._execute(row)
+
+    def stats(self) -> Dict:
+        """
+        Retorna as métricas do executor
+        """
+        counts = {}
+        try:
+            self._init_db()
+            with self._connect() as conn:
+                for row in conn.execute('SELECT status, COUNT(*) AS total FROM jobs GROUP BY status'):
+                    counts[row['status']] = row['total']
+        except Exception as e:
+            logger.error(f"Erro ao ler métricas da fila de tarefas: {e}")
+
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'jobs_by_status': counts,
+                'succeeded_total': self._succeeded_total,
+                'failed_total': self._failed_total,
+                'retries_total': self._retries_total,
+                'purged_total': self._purged_total
+            }
+
+executor = TaskExecutor()
+
+def init_task_executor(app):
+    """
+    Inicia o executor no worker. Chamado depois do registro das rotas, que
+    importam os módulos onde as tarefas são registradas.
+    """
+    executor.start()
+    # Com --preload o Gunicorn importa o app no processo mestre e depois faz
+    # o fork dos workers
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=executor._after_fork)
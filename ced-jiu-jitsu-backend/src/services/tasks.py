@@ -0,0 +1,101 @@
+import logging
+from typing import List, Optional
+from config.firebase_config import get_db
+from models.attendance_mark import commit_in_batches
+from models.pagination import DEFAULT_PAGE_SIZE
+from models.student import Student
+from models.graduation_rules import graduation_rules
+from services.single_flight import single_flight
+from services.task_executor import executor
+from services.tenancy import collection_path
+from services.write_buffer import write_buffer
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Campos da API necessários para recalcular a graduação
+GRADUATION_FIELDS = ('degrees', 'presences_for_next_degree', 'next_belt')
+
+def _commit_graduation_fields(students: List[Student]) -> None:
+    """
+    Grava os campos derivados dos alunos antes de a tarefa terminar: uma
+    falha no commit faz a tarefa falhar (e ser tentada de novo), em vez de
+    ficar na fila do buffer de escrita com o job já marcado como concluído
+    """
+    if not students:
+        return
+    db = get_db()
+    path = collection_path('students')
+    for student in students:
+        # Escritas agrupadas pendentes do aluno vão antes (ordem das gravações)
+        if not write_buffer.flush_document(path, student.uid):
+            raise RuntimeError(f"Escritas pendentes do estudante {student.uid} não foram gravadas")
+    commit_in_batches(db, [[(db.collection(path).document(student.uid), student.graduation_fields())]
+                           for student in students])
+    single_flight.forget_collection(path)
+
+@executor.task('refresh_graduation')
+def refresh_graduation(student_uids: List[str]) -> None:
+    """
+    Recalcula o estado de graduação (grau e campos derivados) após uma presença
+    """
+    students, promoted = [], []
+    for uid in student_uids:
+        student = Student.get_by_uid(uid)
+        if not student:
+            logger.warning(f"Estudante {uid} não encontrado ao recalcular graduação")
+            continue
+        if student.refresh_degree():
+            promoted.append(student)
+        students.append(student)
+    # Grava só os campos derivados para não sobrescrever presenças concorrentes
+    _commit_graduation_fields(students)
+    for student in promoted:
+        student.run_save_hooks('degree_promoted')
+
+@executor.task('recompute_graduation_fields', max_attempts=5)
+def recompute_graduation_fields(rules_version: int) -> None:
+    """
+    Regrava os campos derivados de graduação de todos os alunos depois que
+    a tabela de graduação muda
+    """
+    # O worker que executa a tarefa pode estar com uma versão antiga em cache
+    if graduation_rules.refresh().version < rules_version:
+        raise RuntimeError(f"Regras v{rules_version} ainda não disponíveis neste worker")
+    
+    # Lê só os campos usados no cálculo e grava a cada página, com memória constante
+    total = 0
+    page = []
+    for student in Student.iter_all(page_size=DEFAULT_PAGE_SIZE, fields=GRADUATION_FIELDS):
+        page.append(student)
+        total += 1
+        if len(page) == DEFAULT_PAGE_SIZE:
+            _commit_graduation_fields(page)
+            page = []
+    _commit_graduation_fields(page)
+    logger.info(f"Campos de graduação recalculados para {total} aluno(s) (regras v{rules_version})")
+
+def schedule_graduation_refresh(student_uids: List[str]) -> Optional[str]:
+    """
+    Agenda o recálculo de graduação no executor. Se a fila não aceitar a
+    tarefa, o recálculo é feito na própria requisição.
+    """
+    if not student_uids:
+        return None
+    try:
+        return executor.enqueue('refresh_graduation', {'student_uids': student_uids})
+    except Exception as e:
+        logger.error(f"Erro ao agendar recálculo de graduação, executando agora: {e}")
+        refresh_graduation(student_uids)
+        return None
+
+def schedule_graduation_recompute(rules_version: int) -> Optional[str]:
+    """
+    Agenda o recálculo dos campos derivados de todos os alunos após uma
+    mudança nas regras de graduação
+    """
+    try:
+        return executor.enqueue('recompute_graduation_fields', {'rules_version': rules_version})
+    except Exception as e:
+        logger.error(f"Erro ao agendar recálculo das regras v{rules_version}: {e}")
+        return None
@@ -0,0 +1,160 @@
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Generic, Optional, TypeVar
+from flask import g, request
+from firebase_admin import auth
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# A academia padrão usa as coleções de primeiro nível (dados existentes);
+# as demais ficam em tenants/<id>/<coleção>
+DEFAULT_TENANT = os.getenv('DEFAULT_TENANT', 'default')
+# Claim do token do Firebase com a academia do usuário
+TENANT_CLAIM = 'tenant'
+TENANTS_COLLECTION = 'tenants'
+
+_TENANT_ID = re.compile(r'^[a-z0-9][a-z0-9_-]{0,39}$')
+
+class TenantClaimConflict(Exception):
+    """
+    Lançada quando o usuário já pertence a outra academia
+    """
+
+def validate_tenant(tenant: str) -> str:
+    """
+    Valida o identificador da academia; lança ValueError se inválido
+    """
+    if not isinstance(tenant, str) or not _TENANT_ID.match(tenant):
+        raise ValueError(f'Identificador de academia inválido: {tenant!r}')
+    return tenant
+
+def _parse_hosts(value: str) -> Dict[str, str]:
+    """
+    Lê TENANT_HOSTS no formato "centro.ced.app=centro,norte.ced.app=norte"
+    """
+    hosts = {}
+    for item in value.split(','):
+        if '=' not in item:
+            continue
+        host, tenant = (part.strip() for part in item.split('=', 1))
+        hosts[host.lower()] = validate_tenant(tenant)
+    return hosts
+
+TENANT_HOSTS = _parse_hosts(os.getenv('TENANT_HOSTS', ''))
+
+_tenant: ContextVar[str] = ContextVar('tenant', default=DEFAULT_TENANT)
+
+def current_tenant() -> str:
+    """
+    Academia da requisição (ou da tarefa) atual
+    """
+    return _tenant.get()
+
+def collection_path(name: str, tenant: Optional[str] = None) -> str:
+    """
+    Caminho da coleção dentro da academia (aceito por db.collection e pelo buffer de escrita)
+    """
+    tenant = tenant or current_tenant()
+    if tenant == DEFAULT_TENANT:
+        return name
+    return f'{TENANTS_COLLECTION}/{tenant}/{name}'
+
+@contextmanager
+def tenant_scope(tenant: Optional[str]):
+    """
+    Executa um trecho (tarefa, script) no contexto de uma academia
+    """
+    token = _tenant.set(validate_tenant(tenant) if tenant else DEFAULT_TENANT)
+    try:
+        yield
+    finally:
+        _tenant.reset(token)
+
+def tenant_from_host(host: str) -> Optional[str]:
+    return TENANT_HOSTS.get((host or '').split(':')[0].lower())
+
+def set_request_tenant(claimed: Optional[str]) -> Optional[str]:
+    """
+    Define a academia da requisição autenticada a partir do claim do token.
+    Retorna uma mensagem de erro se o token não pertencer à academia do host.
+    Tokens sem claim (usuários anteriores à separação por academia) só valem
+    para a academia padrão.
+    """
+    host_tenant = tenant_from_host(request.host)
+    if claimed:
+        try:
+            validate_tenant(claimed)
+        except ValueError as e:
+            return str(e)
+        if host_tenant and host_tenant != claimed:
+            return 'Usuário não pertence a esta academia'
+        _tenant.set(claimed)
+    elif host_tenant and host_tenant != DEFAULT_TENANT:
+        return 'Usuário não pertence a esta academia'
+    return None
+
+def assign_tenant_claim(uid: str, tenant: Optional[str] = None) -> None:
+    """
+    Grava a academia (por padrão a da requisição) no claim do usuário no
+    Firebase Auth, preservando os outros claims. Vale a partir do próximo
+    token do usuário. Lança TenantClaimConflict se ele já pertence a outra
+    academia.
+    """
+    tenant = validate_tenant(tenant or current_tenant())
+    user = auth.get_user(uid)
+    claims = dict(user.custom_claims or {})
+    existing = claims.get(TENANT_CLAIM)
+    if existing == tenant:
+        return
+    if existing:
+        raise TenantClaimConflict(f'Usuário {uid} pertence a outra academia')
+    claims[TENANT_CLAIM] = tenant
+    auth.set_custom_user_claims(uid, claims)
+
+def init_tenancy(app):
+    """
+    Define a academia de cada requisição pelo host; o token (require_auth)
+    pode substituí-la pelo claim do usuário
+    """
+    @app.before_request
+    def _start_tenant():
+        g.tenant_token = _tenant.set(tenant_from_host(request.host) or DEFAULT_TENANT)
+
+    @app.teardown_request
+    def _clear_tenant(exc=None):
+        token = g.pop('tenant_token', None)
+        if token is not None:
+            _tenant.reset(token)
+
+T = TypeVar('T')
+
+class TenantLocal(Generic[T]):
+    """
+    Uma instância por academia (caches, índices), criada sob demanda
+    """
+
+    def __init__(self, factory: Callable[[str], T]):
+        self._factory = factory
+        self._instances: Dict[str, T] = {}
+        self._lock = threading.Lock()
+
+    def for_tenant(self, tenant: str) -> T:
+        instance = self._instances.get(tenant)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(tenant)
+                if instance is None:
+                    instance = self._instances[tenant] = self._factory(tenant)
+        return instance
+
+    def current(self) -> T:
+        return self.for_tenant(current_tenant())
+
+    def items(self):
+        with self._lock:
+            return list(self._instances.items())
@@ -0,0 +1,170 @@
+import glob
+import json
+import logging
+import os
+import random
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+from flask import g, request
+from services.tenancy import current_tenant
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Captura de tráfego para replay (desligada se o caminho não for definido).
+# Cada processo grava no próprio arquivo (captura.<pid>.ndjson, ou onde
+# estiver {pid} no caminho): com vários workers do Gunicorn, um arquivo
+# compartilhado seria rotacionado por um processo enquanto outro escreve.
+CAPTURE_PATH = os.getenv('TRAFFIC_CAPTURE_PATH', '')
+# Tamanho de cada arquivo antes da rotação e quantos arquivos antigos manter
+# (por processo)
+CAPTURE_MAX_BYTES = int(os.getenv('TRAFFIC_CAPTURE_MAX_BYTES', str(50 * 1024 * 1024)))
+CAPTURE_BACKUPS = int(os.getenv('TRAFFIC_CAPTURE_BACKUPS', '5'))
+# Fração das requisições gravadas
+CAPTURE_SAMPLE_RATE = float(os.getenv('TRAFFIC_CAPTURE_SAMPLE_RATE', '1.0'))
+# Corpos maiores que isso (ou que não sejam JSON) só têm o tamanho registrado
+CAPTURE_MAX_BODY = int(os.getenv('TRAFFIC_CAPTURE_MAX_BODY', str(64 * 1024)))
+
+# Cabeçalhos que influenciam a resposta; Authorization e cookies nunca são gravados
+CAPTURED_HEADERS = ('Accept', 'Content-Type', 'If-None-Match', 'Last-Event-ID')
+# Chaves removidas de corpos e query strings (comparação por trecho, sem caixa)
+SENSITIVE_KEYS = ('password', 'senha', 'token', 'secret', 'authorization', 'credential', 'cookie')
+REDACTED = '[removido]'
+
+def _is_sensitive(key: str) -> bool:
+    key = str(key).lower()
+    return any(fragment in key for fragment in SENSITIVE_KEYS)
+
+def sanitize(value):
+    """
+    Remove recursivamente valores de chaves sensíveis (senhas, tokens)
+    """
+    if isinstance(value, dict):
+        return {key: REDACTED if _is_sensitive(key) else sanitize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [sanitize(item) for item in value]
+    return value
+
+def _request_body() -> Dict:
+    length = request.content_length or 0
+    if not length:
+        return {}
+    if not request.is_json or length > CAPTURE_MAX_BODY:
+        # Uploads (fotos) e corpos grandes: só o tamanho
+        return {'body_bytes': length, 'body_omitted': True}
+    return {'body_bytes': length, 'body': sanitize(request.get_json(silent=True))}
+
+def _capture_record(response) -> Dict:
+    user = getattr(request, 'current_user', None) or {}
+    query = {key: values if len(values) > 1 else values[0] for key, values in request.args.lists()}
+    record = {
+        'ts': g.capture_started_at,
+        'method': request.method,
+        'path': request.path,
+        'rule': request.url_rule.rule if request.url_rule else None,
+        'view_args': request.view_args or {},
+        'query': sanitize(query),
+        'headers': {name: request.headers[name] for name in CAPTURED_HEADERS if name in request.headers},
+        'uid': user.get('uid'),
+        'role': user.get('role'),
+        'tenant': current_tenant(),
+        'status': response.status_code,
+        'content_type': response.mimetype,
+        # Em respostas em streaming mede só a view, não o envio do corpo
+        'duration_ms': round((time.perf_counter() - g.capture_started) * 1000, 3)
+    }
+    record.update(_request_body())
+    return record
+
+def process_capture_path(path: str, pid: Optional[int] = None) -> str:
+    """
+    Arquivo de captura de um processo: {pid} no caminho ou antes da extensão
+    """
+    pid = os.getpid() if pid is None else pid
+    if '{pid}' in path:
+        return path.replace('{pid}', str(pid))
+    root, extension = os.path.splitext(path)
+    return f'{root}.{pid}{extension}'
+
+def capture_files(path: str) -> List[str]:
+    """
+    Arquivos de captura de todos os processos (e suas rotações) de um
+    caminho configurado em TRAFFIC_CAPTURE_PATH
+    """
+    if '{pid}' in path:
+        pattern = path.replace('{pid}', '*')
+        patterns = [pattern, f'{pattern}.*']
+    else:
+        root, extension = os.path.splitext(path)
+        # Inclui o arquivo único de antes da separação por processo
+        patterns = [f'{root}.*{extension}', f'{root}.*{extension}.*', path, f'{path}.*']
+    files = set()
+    for pattern in patterns:
+        files.update(name for name in glob.glob(pattern) if os.path.isfile(name))
+    return sorted(files)
+
+class _CaptureWriter:
+    """
+    Logger da captura, recriado no processo filho depois do fork (com
+    --preload o app é criado no mestre, que tem outro pid)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pid = None
+        self._handler = None
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger('traffic_capture')
+        self._logger.setLevel(logging.INFO)
+        # Não repassa para o log da aplicação
+        self._logger.propagate = False
+
+    def info(self, message: str) -> None:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._open()
+        self._logger.info(message)
+
+    def _open(self) -> None:
+        path = process_capture_path(self.path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self._handler is not None:
+            # Herdado do processo pai
+            self._logger.removeHandler(self._handler)
+        self._handler = RotatingFileHandler(path, maxBytes=CAPTURE_MAX_BYTES, backupCount=CAPTURE_BACKUPS,
+                                            encoding='utf-8')
+        self._handler.setFormatter(logging.Formatter('%(message)s'))
+        self._logger.addHandler(self._handler)
+        self._pid = os.getpid()
+
+def init_traffic_capture(app, path: Optional[str] = None):
+    """
+    Grava metadados e corpos (sem tokens) das requisições à API em NDJSON,
+    com rotação de arquivos, para o replay de carga (scripts.replay_traffic)
+    """
+    path = path or CAPTURE_PATH
+    if not path:
+        return
+    writer = _CaptureWriter(path)
+    logger.info(f"Captura de tráfego ativa em {process_capture_path(path, '<pid>')} (amostragem {CAPTURE_SAMPLE_RATE})")
+
+    @app.before_request
+    def _start_capture():
+        if request.path.startswith('/api/') and random.random() < CAPTURE_SAMPLE_RATE:
+            g.capture_started_at = time.time()
+            g.capture_started = time.perf_counter()
+
+    @app.after_request
+    def _write_capture(response):
+        if 'capture_started' in g:
+            try:
+                writer.info(json.dumps(_capture_record(response), ensure_ascii=False, default=str))
+            except Exception as e:
+                # A captura nunca derruba a requisição
+                logger.error(f"Erro ao gravar captura de tráfego: {e}")
+        return response
@@ -0,0 +1,241 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+from config.firebase_config import get_db
+from services.single_flight import single_flight
+from services.storage_policy import storage_call
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Janela (em segundos) em que escritas no mesmo documento são agrupadas.
+# Com 0 o buffer é desativado e toda escrita vai direto para o Firestore.
+DEFAULT_WINDOW_SECONDS = float(os.getenv('WRITE_BUFFER_WINDOW_SECONDS', '1.0'))
+
+# O Firestore aceita no máximo 500 operações por batch
+MAX_BATCH_OPERATIONS = 450
+# Tentativas de gravar um documento antes de descartar as mutações (registradas no log)
+MAX_WRITE_ATTEMPTS = int(os.getenv('WRITE_BUFFER_MAX_ATTEMPTS', '5'))
+
+class WriteBuffer:
+    """
+    Buffer de escrita (write-behind) por processo.
+
+    Mutações pendentes no mesmo documento são mescladas em uma única
+    atualização (set com merge) e gravadas depois da janela configurada.
+    Use só para campos que o chamador alterou e cuja gravação pode
+    acontecer depois da resposta; gravações confirmadas ao cliente usam
+    flush_document e commit direto.
+
+    Um documento que falha MAX_WRITE_ATTEMPTS vezes é descartado e as
+    mutações perdidas vão para o log de erro.
+
+    Os flushes são serializados (_flush_lock): dois flushes nunca gravam o
+    mesmo documento fora de ordem, e flush_document de um documento que
+    está sendo gravado por outro flush espera o commit terminar.
+    """
+
+    def __init__(self, window_seconds: float = DEFAULT_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self._pending: Dict[tuple, Dict] = {}
+        self._enqueued_at: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Documentos retirados da fila cujo commit ainda não terminou
+        self._in_flight = set()
+        # Falhas seguidas por documento
+        self._attempts: Dict[tuple, int] = {}
+        self._thread = None
+        self._pid = None
+
+        # Métricas
+        self._enqueued_total = 0
+        self._coalesced_total = 0
+        self._flushes_total = 0
+        self._flushed_documents_total = 0
+        self._flush_errors_total = 0
+        self._dropped_total = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0
+
+    def _ensure_worker(self):
+        """
+        Inicia a thread de flush no processo atual (após o fork do Gunicorn)
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='write-buffer', daemon=True)
+        self._thread.start()
+
+    def set(self, collection: str, doc_id: str, data: Dict) -> None:
+        """
+        Agenda um set(merge=True) no documento, mesclando com mutações pendentes
+        """
+        if not self.enabled:
+            storage_call(get_db().collection(collection).document(doc_id).set, data, merge=True)
+            single_flight.forget_collection(collection)
+            return
+
+        key = (collection, doc_id)
+        with self._lock:
+            self._ensure_worker()
+            self._enqueued_total += 1
+            if key in self._pending:
+                self._pending[key].update(data)
+                self._coalesced_total += 1
+            else:
+                self._pending[key] = dict(data)
+                self._enqueued_at[key] = time.monotonic()
+
+    def flush_document(self, collection: str, doc_id: str) -> bool:
+        """
+        Grava imediatamente as mutações pendentes de um documento (read-your-writes).
+        Retorna False se a gravação falhou (as mutações continuam na fila).
+        """
+        key = (collection, doc_id)
+        with self._lock:
+            if key not in self._pending and key not in self._in_flight:
+                return True
+        with self._flush_lock:
+            with self._lock:
+                if key not in self._pending:
+                    return True
+                entries = {key: self._pending.pop(key)}
+                self._enqueued_at.pop(key, None)
+            return self._write(entries)
+
+    def flush(self, collection: Optional[str] = None) -> None:
+        """
+        Grava imediatamente todas as mutações pendentes (opcionalmente de uma coleção)
+        """
+        with self._flush_lock:
+            with self._lock:
+                keys = [key for key in self._pending if collection is None or key[0] == collection]
+                entries = {key: self._pending.pop(key) for key in keys}
+                for key in keys:
+                    self._enqueued_at.pop(key, None)
+            self._write(entries)
+
+    def _flush_expired(self):
+        """
+        Grava os documentos cuja janela de agrupamento já terminou
+        """
+        with self._flush_lock:
+            now = time.monotonic()
+            with self._lock:
+                keys = [key for key, enqueued_at in self._enqueued_at.items()
+                        if now - enqueued_at >= self.window_seconds]
+                entries = {key: self._pending.pop(key) for key in keys}
+                for key in keys:
+                    self._enqueued_at.pop(key, None)
+            self._write(entries)
+
+    def _write(self, entries: Dict[tuple, Dict]) -> bool:
+        """
+        Grava as entradas em batches; em caso de erro elas voltam para a fila
+        (até MAX_WRITE_ATTEMPTS falhas por documento). Retorna True se tudo
+        foi gravado. Chamado com _flush_lock adquirido.
+        """
+        if not entries:
+            return True
+
+        started = time.perf_counter()
+        items = list(entries.items())
+        with self._lock:
+            self._in_flight.update(entries)
+        try:
+            db = get_db()
+            for start in range(0, len(items), MAX_BATCH_OPERATIONS):
+                batch = db.batch()
+                for (collection, doc_id), data in items[start:start + MAX_BATCH_OPERATIONS]:
+                    batch.set(db.collection(collection).document(doc_id), data, merge=True)
+                storage_call(batch.commit)
+            # Leituras iniciadas depois da escrita não reaproveitam as que já estavam em andamento
+            for collection in {collection for collection, _ in entries}:
+                single_flight.forget_collection(collection)
+        except Exception as e:
+            logger.error(f"Erro ao gravar buffer de escrita ({len(items)} documento(s)): {e}")
+            with self._lock:
+                self._flush_errors_total += 1
+                for key, data in items:
+                    attempts = self._attempts.get(key, 0) + 1
+                    if attempts >= MAX_WRITE_ATTEMPTS:
+                        self._attempts.pop(key, None)
+                        self._dropped_total += 1
+                        logger.error(f"Buffer de escrita: {key[0]}/{key[1]} descartado após {attempts} "
+                                     f"falha(s); mutações perdidas: {sorted(data)}")
+                        continue
+                    self._attempts[key] = attempts
+                    # Mutações mais novas têm precedência sobre as que falharam
+                    merged = dict(data)
+                    merged.update(self._pending.get(key, {}))
+                    self._pending[key] = merged
+                    self._enqueued_at.setdefault(key, time.monotonic())
+                self._in_flight.difference_update(entries)
+            return False
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._in_flight.difference_update(entries)
+            for key in entries:
+                self._attempts.pop(key, None)
+            self._flushes_total += 1
+            self._flushed_documents_total += len(items)
+            self._last_flush_ms = elapsed_ms
+            self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+        return True
+
+    def _run(self):
+        """
+        Loop da thread de flush
+        """
+        interval = max(self.window_seconds / 4, 0.05)
+        while True:
+            time.sleep(interval)
+            try:
+                self._flush_expired()
+            except Exception as e:
+                logger.error(f"Erro no loop do buffer de escrita: {e}")
+
+    def stats(self) -> Dict:
+        """
+        Retorna as métricas do buffer
+        """
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'window_seconds': self.window_seconds,
+                'queue_depth': len(self._pending),
+                'in_flight': len(self._in_flight),
+                'enqueued_total': self._enqueued_total,
+                'coalesced_total': self._coalesced_total,
+                'flushes_total': self._flushes_total,
+                'flushed_documents_total': self._flushed_documents_total,
+                'flush_errors_total': self._flush_errors_total,
+                'dropped_total': self._dropped_total,
+                'last_flush_ms': round(self._last_flush_ms, 3),
+                'max_flush_ms': round(self._max_flush_ms, 3),
+                'avg_flush_ms': round(self._total_flush_ms / self._flushes_total, 3) if self._flushes_total else 0.0
+            }
+
+write_buffer = WriteBuffer()
+
+@atexit.register
+def _flush_on_shutdown():
+    """
+    Garante que nada fique pendente quando o worker é encerrado
+    """
+    try:
+        write_buffer.flush()
+    except Exception as e:
+        logger.error(f"Erro ao esvaziar buffer de escrita no desligamento: {e}")
@@ -7,7 +7,8 @@ import {
   markAttendance,
   updateStudent,
   addExtraActivity,
-  removeExtraActivity
+  removeExtraActivity,
+  subscribeToStudentEvents
 } from '../lib/api';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card';
@@ -61,6 +62,28 @@ const TeacherDashboard = () => {
     loadData();
   }, []);
 
+  // Atualiza a lista com as presenças e graduações registradas em outros dispositivos
+  useEffect(() => {
+    const mergeStudent = (list, changed) =>
+      list.map((student) => (student.uid === changed.uid ? { ...student, ...changed } : student));
+
+    return subscribeToStudentEvents((type, data) => {
+      if (type === 'reset') {
+        // Eventos perdidos: recarrega a lista uma vez
+        loadData();
+        return;
+      }
+      if (!data.student) return;
+      setStudents((previous) => {
+        if (previous.some((student) => student.uid === data.student.uid)) {
+          return mergeStudent(previous, data.student);
+        }
+        return [...previous, data.student];
+      });
+      setStudentsCloseToGraduation((previous) => mergeStudent(previous, data.student));
+    });
+  }, []);
+
   const loadData = async () => {
     setLoading(true);
     try {
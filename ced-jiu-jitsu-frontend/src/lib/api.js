@@ -118,6 +118,92 @@ export const getClasses = (startDate, endDate) => {
   return api.get(`/api/attendance/classes?start_date=${startDate}&end_date=${endDate}`);
 };
 
+// Eventos em tempo real (Server-Sent Events, apenas professores)
+// EventSource não envia o cabeçalho Authorization, então o stream é lido com fetch.
+// Retorna uma função que encerra a assinatura.
+export const subscribeToStudentEvents = (onEvent) => {
+  let controller = null;
+  let lastEventId = null;
+  let retryMs = 3000;
+  let closed = false;
+  let timer = null;
+
+  const dispatch = (frame) => {
+    let type = 'message';
+    let id = null;
+    const data = [];
+    for (const line of frame.split('\n')) {
+      if (!line || line.startsWith(':')) continue; // heartbeat
+      const index = line.indexOf(':');
+      const field = index === -1 ? line : line.slice(0, index);
+      const value = index === -1 ? '' : line.slice(index + 1).replace(/^ /, '');
+      if (field === 'event') type = value;
+      else if (field === 'data') data.push(value);
+      else if (field === 'id') id = value;
+      else if (field === 'retry' && /^\d+$/.test(value)) retryMs = Number(value);
+    }
+    if (id) lastEventId = id;
+    if (!data.length) return;
+    try {
+      onEvent(type, JSON.parse(data.join('\n')));
+    } catch (error) {
+      console.error('Evento inválido recebido:', error);
+    }
+  };
+
+  const connect = async () => {
+    controller = new AbortController();
+    try {
+      const headers = { Accept: 'text/event-stream' };
+      const user = auth.currentUser;
+      if (user) {
+        headers.Authorization = `Bearer ${await user.getIdToken()}`;
+      }
+      if (lastEventId) {
+        headers['Last-Event-ID'] = lastEventId;
+      }
+      const response = await fetch(`${API_BASE_URL}/api/events/stream`, {
+        headers,
+        signal: controller.signal,
+      });
+      if (!response.ok) {
+        const retryAfter = Number(response.headers.get('Retry-After'));
+        if (retryAfter > 0) retryMs = retryAfter * 1000;
+        throw new Error(`Stream de eventos indisponível (${response.status})`);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true }).replace(/\r\n?/g, '\n');
+        let end;
+        while ((end = buffer.indexOf('\n\n')) !== -1) {
+          dispatch(buffer.slice(0, end));
+          buffer = buffer.slice(end + 2);
+        }
+      }
+    } catch (error) {
+      if (closed) return;
+      console.warn('Conexão de eventos interrompida:', error);
+    }
+    // O servidor encerra o stream periodicamente; reconecta retomando pelo último ID
+    if (!closed) {
+      timer = setTimeout(connect, retryMs);
+    }
+  };
+
+  connect();
+
+  return () => {
+    closed = true;
+    clearTimeout(timer);
+    if (controller) controller.abort();
+  };
+};
+
 // Autenticação real com Firebase
 import { signInWithEmailAndPassword } from "firebase/auth";
 